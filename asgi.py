@@ -0,0 +1,13 @@
+"""
+ASGI entry point exposing the same Users, Availability and Meetings namespaces as controller/app.py.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
+The Flask app is synchronous, so requests run in the threadpool of the ASGI adapter while the event loop handles
+connections. With more than one worker set CALENDLY_DB_PATH, otherwise every worker keeps its own in-memory data.
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from controller.app import app
+
+application = WsgiToAsgi(app)
@@ -0,0 +1,89 @@
+"""
+Bitmap mode against the interval sweep for overlap queries over the whole booking window.
+
+Compares find_overlapping_ranges / find_common_intervals date by date with one AND of window bitmaps, for
+pairs and groups of users with availability in 15 minute steps, then the same through UserManager with and
+without bitmap_granularity.
+
+Usage: python -m benchmarks.bitmap_overlap [--users 200] [--repeat 2000]
+"""
+import argparse
+import functools
+import operator
+import random
+
+from benchmarks.data import populate, random_time_ranges
+from benchmarks.suite import timeit
+from manager.calendly_manager import UserManager
+from models.availability_model import interval_bitmap, bitmap_runs
+from utils.helper_functions import get_booking_window, merge_time_ranges, to_intervals, find_overlapping_ranges, \
+    find_common_intervals, window_bitmap, common_bitmap_availability, common_availability
+
+GRANULARITY = 15
+
+
+def bench_helpers(rng, users, repeat, results):
+    dates = get_booking_window()
+    calendars = [[merge_time_ranges(to_intervals(random_time_ranges(rng, 4))) for _ in dates] for _ in range(users)]
+    bitmaps = [window_bitmap([interval_bitmap(day, GRANULARITY) for day in calendar], GRANULARITY)
+               for calendar in calendars]
+    pairs = [rng.sample(range(users), 2) for _ in range(100)]
+    groups = [rng.sample(range(users), 10) for _ in range(100)]
+
+    def pair_sweep():
+        first, second = rng.choice(pairs)
+        return [find_overlapping_ranges(calendars[first][day], calendars[second][day]) for day in range(len(dates))]
+
+    def group_sweep():
+        group = rng.choice(groups)
+        return [find_common_intervals([calendars[user][day] for user in group]) for day in range(len(dates))]
+
+    def bitmap_and(users):
+        return list(bitmap_runs(functools.reduce(operator.and_, [bitmaps[user] for user in users])))
+
+    # raw (start, end) results
+    timeit('find_overlapping_ranges_31_days', pair_sweep, repeat, results)
+    timeit('bitmap_and_pair_31_days', lambda: bitmap_and(rng.choice(pairs)), repeat, results)
+    timeit('find_common_intervals_k10_31_days', group_sweep, repeat, results)
+    timeit('bitmap_and_k10_31_days', lambda: bitmap_and(rng.choice(groups)), repeat, results)
+    # formatted API results
+    timeit('common_availability_pair', lambda: common_availability(
+        lambda date, users=rng.choice(pairs): [calendars[user][dates.index(date)] for user in users]),
+        repeat, results)
+    timeit('common_bitmap_availability_pair', lambda: common_bitmap_availability(
+        [bitmaps[user] for user in rng.choice(pairs)], dates, GRANULARITY), repeat, results)
+    # both return the API format, checked on every pair
+    for first, second in pairs:
+        assert common_bitmap_availability([bitmaps[first], bitmaps[second]], dates, GRANULARITY) == \
+            common_availability(lambda date: [calendars[first][dates.index(date)],
+                                              calendars[second][dates.index(date)]])
+
+
+def bench_manager(rng, users, repeat, results):
+    for label, granularity in (('sweep', None), ('bitmap', GRANULARITY)):
+        manager = UserManager(cache_size=0, bitmap_granularity=granularity)
+        user_ids = populate(manager, users, 31, 4, 5, seed=3)
+        groups = [rng.sample(user_ids, 10) for _ in range(100)]
+        timeit(f"get_overlapping_availability_{label}",
+               lambda: manager.get_overlapping_availability(*rng.sample(user_ids, 2)), repeat, results)
+        timeit(f"get_group_availability_10_{label}",
+               lambda: manager.get_group_availability(rng.choice(groups)), repeat, results)
+        timeit(f"find_slots_10_users_{label}", lambda: manager.find_slots(rng.choice(groups), 30, limit=10),
+               repeat, results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    bench_helpers(rng, args.users, args.repeat, results)
+    bench_manager(rng, args.users, args.repeat, results)
+
+
+if __name__ == '__main__':
+    main()
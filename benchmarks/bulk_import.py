@@ -0,0 +1,57 @@
+"""
+Throughput of the bulk import path in rows/sec, for the in-memory and the SQLite backend.
+
+Usage: python -m benchmarks.bulk_import [--users 200000] [--days 5] [--db /tmp/calendly_bench.db]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from manager.calendly_manager import UserManager
+from storage.sqlite_storage import SQLiteStorage
+from utils.helper_functions import get_booking_window
+
+
+def run(label, manager, users, days):
+    user_rows = [{'user_name': f"user{i}", 'phone_number': str(i)} for i in range(users)]
+    # every hundredth row is broken to include the per row error path
+    for i in range(0, users, 100):
+        user_rows[i] = {'user_name': f"user{i}"}
+    started = time.perf_counter()
+    results = manager.add_users(user_rows)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<8} add_users                {users / elapsed:12,.0f} rows/sec")
+
+    user_ids = [result['user_id'] for result in results if 'user_id' in result]
+    dates = get_booking_window()[:days]
+    availability_rows = [
+        {'user_id': user_id, 'date': date, 'time_ranges': [{'start_time': '09:00', 'end_time': '12:00'},
+                                                           {'start_time': '13:00', 'end_time': '17:30'}]}
+        for user_id in user_ids for date in dates
+    ]
+    started = time.perf_counter()
+    manager.bulk_update_availability(availability_rows)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<8} bulk_update_availability {len(availability_rows) / elapsed:12,.0f} rows/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--db', default=os.path.join(tempfile.gettempdir(), 'calendly_bench.db'))
+    args = parser.parse_args()
+
+    run('memory', UserManager(), args.users, args.days)
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    storage = SQLiteStorage(args.db)
+    run('sqlite', UserManager(storage), args.users, args.days)
+    storage.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Compare two benchmark result files written by benchmarks.suite and flag regressions.
+
+Usage: python -m benchmarks.compare base.json head.json [--threshold 0.10]
+Exits with status 1 if any benchmark got slower than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative slowdown of p50')
+    args = parser.parse_args()
+
+    with open(args.base) as base_file, open(args.head) as head_file:
+        base, head = json.load(base_file), json.load(head_file)
+    if base['scale'] != head['scale']:
+        print(f"warning: different scale {base['scale']} vs {head['scale']}")
+
+    regressions = 0
+    print(f"{'benchmark':<40} {base['revision']:>12} {head['revision']:>12}   change")
+    for name in sorted(set(base['results']) | set(head['results'])):
+        if name not in base['results'] or name not in head['results']:
+            print(f"{name:<40} only in {'head' if name in head['results'] else 'base'}")
+            continue
+        before, after = base['results'][name]['p50_us'], head['results'][name]['p50_us']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > args.threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{name:<40} {before:>10.1f}us {after:>10.1f}us {change:>+8.1%}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Synthetic users, availability and bookings at configurable scale, shared by the benchmarks.
+"""
+import random
+
+from models.interval_model import minutes_to_time
+from utils.helper_functions import get_booking_window
+
+
+def random_time_ranges(rng, ranges_per_day) -> list:
+    """
+    Non overlapping working hours split into ranges_per_day blocks with random gaps
+    """
+    time_ranges = []
+    start = 7 * 60 + rng.randrange(0, 120, 15)
+    for _ in range(ranges_per_day):
+        end = min(start + rng.randrange(30, 180, 15), 23 * 60)
+        if start >= end:
+            break
+        time_ranges.append({'start_time': minutes_to_time(start), 'end_time': minutes_to_time(end)})
+        start = end + rng.randrange(15, 90, 15)
+    return time_ranges
+
+
+def populate(manager, users=1000, days=31, ranges_per_day=4, bookings_per_user=20, seed=1, timezones=None) -> list:
+    """
+    Fill a UserManager with synthetic data
+    :param manager: UserManager
+    :param users: number of users
+    :param days: number of dates with explicit availability per user
+    :param ranges_per_day: availability ranges per date
+    :param bookings_per_user: attempted bookings per user, some fail when the slot is taken
+    :param seed: random seed
+    :param timezones: timezones assigned to the users round robin, all users are in UTC by default
+    :return: list of created user ids
+    """
+    rng = random.Random(seed)
+    dates = get_booking_window()[:days]
+    timezones = timezones or ['UTC']
+    results = manager.add_users({'user_name': f"user{i}", 'phone_number': str(i),
+                                 'timezone': timezones[i % len(timezones)]} for i in range(users))
+    user_ids = [result['user_id'] for result in results]
+    manager.bulk_update_availability(
+        {'user_id': user_id, 'date': date, 'time_ranges': random_time_ranges(rng, ranges_per_day)}
+        for user_id in user_ids for date in dates)
+    for user_id in user_ids:
+        for _ in range(bookings_per_user):
+            date = rng.choice(dates)
+            free = manager.get_user(user_id).get_availability()[date].get_intervals().pairs()
+            if not free:
+                continue
+            start, end = rng.choice(free)
+            if end - start < 15:
+                continue
+            manager.book_meeting(user_id, date, minutes_to_time(start), minutes_to_time(start + 15),
+                                 rng.choice(user_ids))
+    return user_ids
@@ -0,0 +1,82 @@
+"""
+Peak memory and latency of reading all bookings of a heavy user: the full get_meetings result, cursor pages and
+the NDJSON export.
+
+The user's whole booking window is filled with short back to back meetings. Peak memory is measured with
+tracemalloc around each way of reading the bookings, result caches are off so every run builds its result.
+
+Usage: python -m benchmarks.export_memory [--bookings 20000] [--page-size 100]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from manager.calendly_manager import UserManager
+from utils.helper_functions import get_booking_window
+
+
+def populate_heavy(manager, bookings) -> int:
+    """
+    One host with up to bookings meetings of 2 minutes, requested round robin by 10 other users
+    :return: id of the host
+    """
+    host_id = manager.add_user('heavy', '0')
+    requestor_ids = [manager.add_user(f"requestor{i}", str(i)) for i in range(10)]
+    dates = get_booking_window()
+    manager.update_availability(host_id, dates, [[{'start_time': '00:00', 'end_time': '23:59'}]] * len(dates))
+    count = 0
+    for date in dates:
+        for start in range(0, 24 * 60 - 2, 2):
+            if count == bookings:
+                return host_id
+            manager.book_meeting(host_id, date, start, start + 2, requestor_ids[count % len(requestor_ids)])
+            count += 1
+    return host_id
+
+
+def measure(name, func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<24} {count:>8} bookings  {elapsed * 1e3:>9.1f} ms  peak {peak / 1024:>10.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+
+    manager = UserManager(cache_size=0)
+    host_id = populate_heavy(manager, args.bookings)
+
+    def full():
+        body = json.dumps({'booked_meetings': manager.get_meetings(host_id)})
+        return body.count('booking_id')
+
+    def pages():
+        count, cursor = 0, None
+        while True:
+            page, cursor = manager.get_meetings_page(host_id, cursor=cursor, limit=args.page_size)
+            count += json.dumps({'booked_meetings': page, 'next_cursor': cursor}).count('booking_id')
+            if cursor is None:
+                return count
+
+    def export():
+        count = 0
+        for record in manager.export_user(host_id):
+            json.dumps(record)
+            count += record['type'] == 'booking'
+        return count
+
+    measure('get_meetings', full)
+    measure(f"get_meetings_page {args.page_size}", pages)
+    measure('export_user', export)
+
+
+if __name__ == '__main__':
+    main()
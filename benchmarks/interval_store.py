@@ -0,0 +1,108 @@
+"""
+Memory and latency comparison between the old dict-of-strings availability model and IntervalList.
+
+Usage: python -m benchmarks.interval_store [--users 100000] [--days 31]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from models.interval_model import IntervalList, minutes_to_time
+
+
+def legacy_merge(time_ranges):
+    merged_ranges = []
+    time_ranges.sort(key=lambda r: r['start_time'])
+    start_time, end_time = time_ranges[0]['start_time'], time_ranges[0]['end_time']
+    for time_range in time_ranges[1:]:
+        new_start_time, new_end_time = time_range['start_time'], time_range['end_time']
+        if end_time < new_start_time:
+            merged_ranges.append({'start_time': start_time, 'end_time': end_time})
+            start_time, end_time = new_start_time, new_end_time
+        else:
+            end_time = max(end_time, new_end_time)
+    merged_ranges.append({'start_time': start_time, 'end_time': end_time})
+    return merged_ranges
+
+
+def legacy_book(existing_ranges, start_time, end_time):
+    updated_ranges = []
+    for existing_range in existing_ranges:
+        if existing_range['start_time'] <= start_time and existing_range['end_time'] >= end_time:
+            for existing_range in existing_ranges:
+                if existing_range['start_time'] >= end_time or existing_range['end_time'] <= start_time:
+                    updated_ranges.append(existing_range)
+                else:
+                    if existing_range['start_time'] < start_time:
+                        updated_ranges.append({'start_time': existing_range['start_time'], 'end_time': start_time})
+                    if existing_range['end_time'] > end_time:
+                        updated_ranges.append({'start_time': end_time, 'end_time': existing_range['end_time']})
+            return updated_ranges
+    return None
+
+
+def generate_day(rng):
+    """
+    A working day with a morning and an afternoon block
+    """
+    morning = rng.randrange(8 * 60, 10 * 60, 30)
+    afternoon = rng.randrange(13 * 60, 15 * 60, 30)
+    return [(morning, morning + 180), (afternoon, afternoon + 150)]
+
+
+def build_legacy(days):
+    store = []
+    for day in days:
+        ranges = [{'start_time': minutes_to_time(start), 'end_time': minutes_to_time(end)} for start, end in day]
+        store.append(legacy_merge(ranges))
+    return store
+
+
+def build_intervals(days):
+    return [IntervalList.from_pairs(day) for day in days]
+
+
+def measure(label, build, days):
+    tracemalloc.start()
+    started = time.perf_counter()
+    store = build(days)
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} build {elapsed * 1000:10.1f} ms  memory {current / 2 ** 20:10.1f} MiB")
+    return store
+
+
+def time_bookings(label, book, store, days):
+    started = time.perf_counter()
+    for ranges, day in zip(store, days):
+        start = day[0][0] + 30
+        book(ranges, start, start + 30)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<12} book  {elapsed * 1000:10.1f} ms  ({elapsed / len(store) * 1e6:.2f} us/op)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    days = [generate_day(rng) for _ in range(args.users * args.days)]
+    print(f"{args.users} users x {args.days} days = {len(days)} availability rows")
+
+    legacy = measure('dict/str', build_legacy, days)
+    time_bookings('dict/str', lambda ranges, start, end: legacy_book(
+        ranges, minutes_to_time(start), minutes_to_time(end)), legacy, days)
+    del legacy
+
+    intervals = measure('IntervalList', build_intervals, days)
+    time_bookings('IntervalList', lambda ranges, start, end: ranges.contains(start, end) and ranges.remove(
+        start, end), intervals, days)
+
+
+if __name__ == '__main__':
+    main()
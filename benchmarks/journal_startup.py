@@ -0,0 +1,111 @@
+"""
+Startup time of the journal backend for a large dataset, replaying the log alone, from a snapshot, and from a
+snapshot followed by a log tail. Also measures booking throughput with fsynced group commit.
+
+The dataset is written straight through the storage API with fsync off, which produces the same files as
+UserManager writes would, in a fraction of the time.
+
+Usage: python -m benchmarks.journal_startup [--users 10000] [--bookings 1000000] [--dir /tmp/calendly_journal]
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+
+from manager.calendly_manager import UserManager
+from models.booking_model import Booking
+from models.interval_model import IntervalList
+from storage.journal_storage import JournalStorage
+from utils.helper_functions import get_booking_window
+
+
+def write_dataset(directory, users, bookings, start_user=0):
+    """
+    Users available 08:00-20:00 on every date of the window, booked back to back in 15 minute slots
+    """
+    storage = JournalStorage(directory, fsync=False, snapshot_every=0)
+    dates = get_booking_window()
+    slots_per_day = 12 * 4
+    per_user = bookings // users
+    with storage.batch():
+        for i in range(start_user, start_user + users):
+            user_id = storage.create_user(f"user{i}", str(i))
+            for date in dates:
+                storage.save_availability(user_id, date, IntervalList([8 * 60], [20 * 60]))
+            for n in range(per_user):
+                date, slot = dates[n // slots_per_day % len(dates)], n % slots_per_day
+                start = 8 * 60 + slot * 15
+                remaining = IntervalList([start + 15], [20 * 60])
+                storage.save_booking(user_id, Booking(user_id, date, start, start + 15, user_id), remaining)
+    storage.close()
+
+
+def timed_open(label, directory):
+    started = time.perf_counter()
+    storage = JournalStorage(directory, snapshot_every=0)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed:8.2f} s  ({storage._seq:,} records)")
+    return storage
+
+
+def bench_group_commit(directory, threads, bookings_per_thread):
+    storage = JournalStorage(directory, snapshot_every=0)
+    manager = UserManager(storage)
+    dates = get_booking_window()
+    user_ids = [manager.add_user(f"writer{i}", str(i)) for i in range(threads)]
+    for user_id in user_ids:
+        manager.add_recurring_availability(user_id, range(7), [(0, 24 * 60 - 1)])
+
+    def book(user_id):
+        for n in range(bookings_per_thread):
+            start = n % 90 * 15
+            manager.book_meeting(user_id, dates[n // 90 % len(dates)], start, start + 15, user_id)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=book, args=(user_id,)) for user_id in user_ids]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    print(f"{'fsynced book_meeting, ' + str(threads) + ' threads':<40} "
+          f"{threads * bookings_per_thread / elapsed:8,.0f} bookings/sec")
+    storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--bookings', type=int, default=1000000)
+    parser.add_argument('--tail', type=int, default=100000, help='bookings written after the snapshot')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--dir', help='journal directory, a temporary one is used and removed by default')
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix='calendly_journal_')
+    try:
+        started = time.perf_counter()
+        write_dataset(directory, args.users, args.bookings)
+        print(f"{'write dataset':<40} {time.perf_counter() - started:8.2f} s")
+
+        storage = timed_open('startup, log replay only', directory)
+        started = time.perf_counter()
+        storage.snapshot()
+        print(f"{'snapshot':<40} {time.perf_counter() - started:8.2f} s")
+        storage.close()
+
+        timed_open('startup, snapshot', directory).close()
+        tail_users = max(1, args.users * args.tail // args.bookings)
+        write_dataset(directory, tail_users, args.tail, start_user=args.users)
+        storage = timed_open('startup, snapshot + log tail', directory)
+        storage.close()
+
+        bench_group_commit(directory, args.threads, 200)
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
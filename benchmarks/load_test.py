@@ -0,0 +1,125 @@
+"""
+Local HTTP load test reporting p50/p99 latency and requests/sec for each endpoint of a running server.
+
+Start the server first, e.g. `gunicorn controller.app:app` or `uvicorn asgi:application --port 8000`, then:
+
+Usage: python -m benchmarks.load_test [--url http://127.0.0.1:8000] [--requests 2000] [--concurrency 32]
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from utils.helper_functions import get_booking_window
+
+
+class Client:
+    """
+    One keep-alive connection per thread
+    """
+    def __init__(self, url):
+        self.parsed = urlparse(url)
+        self.local = threading.local()
+
+    def post(self, path, payload):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.parsed.hostname, self.parsed.port or 80, timeout=30)
+            self.local.connection = connection
+        body = json.dumps(payload)
+        connection.request('POST', path, body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, data
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_endpoint(client, name, path, payloads, concurrency):
+    def call(payload):
+        started = time.perf_counter()
+        status, _ = client.post(path, payload)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(call, payloads))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, status in results if status >= 500)
+    result = {
+        'endpoint': name,
+        'requests': len(payloads),
+        'rps': len(payloads) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'server_errors': errors
+    }
+    print(f"{name:<32} {result['rps']:>9.0f} req/s  p50 {result['p50_ms']:>7.2f} ms  "
+          f"p99 {result['p99_ms']:>7.2f} ms  5xx {errors}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = Client(args.url)
+    dates = get_booking_window()
+
+    status, body = client.post('/Users/add_users', [
+        {'user_name': f"load{i}", 'phone_number': str(i)} for i in range(args.users)])
+    user_ids = [row['user_id'] for row in json.loads(body)['results'] if 'user_id' in row]
+    for user_id in user_ids:
+        client.post('/Availability/set_recurring_availability', {
+            'user_id': user_id, 'weekdays': [0, 1, 2, 3, 4, 5, 6],
+            'time_ranges': [{'start_time': '08:00', 'end_time': '18:00'}]})
+
+    def pick_users(count):
+        return rng.sample(user_ids, count)
+
+    def booking():
+        start = rng.randrange(8 * 60, 17 * 60, 15)
+        return {'user_id': rng.choice(user_ids), 'requestor_id': rng.choice(user_ids), 'date': rng.choice(dates),
+                'start_time': f"{start // 60:02d}:{start % 60:02d}",
+                'end_time': f"{(start + 15) // 60:02d}:{(start + 15) % 60:02d}"}
+
+    count = args.requests
+    endpoints = [
+        ('add_user', '/Users/add_user', [{'user_name': 'x', 'phone_number': '1'} for _ in range(count)]),
+        ('set_user_availability', '/Availability/set_user_availability', [
+            {'user_id': rng.choice(user_ids), 'date_list': [rng.choice(dates)],
+             'time_ranges': [[{'start_time': '18:00', 'end_time': '19:00'}]]} for _ in range(count)]),
+        ('book_meeting', '/Meetings/book_meeting', [booking() for _ in range(count)]),
+        ('get_user_availability', '/Users/get_user_availability',
+         [{'user_id': rng.choice(user_ids)} for _ in range(count)]),
+        ('get_bookings', '/Meetings/get_bookings', [{'user_id': rng.choice(user_ids)} for _ in range(count)]),
+        ('get_availability_overlap', '/Availability/get_availability_overlap', [
+            dict(zip(('user_id_1', 'user_id_2'), pick_users(2))) for _ in range(count)]),
+        ('get_group_availability_overlap', '/Availability/get_group_availability_overlap', [
+            {'user_ids': pick_users(5), 'min_duration': 30} for _ in range(count)]),
+        ('find_slots', '/Availability/find_slots', [
+            {'user_ids': pick_users(3), 'duration': 30, 'limit': 5} for _ in range(count)]),
+    ]
+    results = [run_endpoint(client, name, path, payloads, args.concurrency) for name, path, payloads in endpoints]
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
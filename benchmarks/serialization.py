@@ -0,0 +1,52 @@
+"""
+Bytes and milliseconds per response for the old indent=4 stdlib encoding versus controller.response.
+
+Usage: python -m benchmarks.serialization [--bookings 20000] [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import time
+
+from controller.response import encode_json, orjson
+from utils.helper_functions import get_booking_window
+
+
+def bookings_payload(count) -> dict:
+    dates = get_booking_window()
+    booked_meetings = {}
+    for i in range(count):
+        start = 8 * 60 + (i % 40) * 15
+        booked_meetings.setdefault(dates[i % len(dates)], []).append({
+            'time_list': [{'start_time': f"{start // 60:02d}:{start % 60:02d}",
+                           'end_time': f"{(start + 15) // 60:02d}:{(start + 15) % 60:02d}"}],
+            'requestor_id': i,
+            'requestor_name': f"requestor {i}",
+            'requestor_phone': f"{9000000000 + i}"
+        })
+    return {'booked_meetings': booked_meetings}
+
+
+def measure(label, encode, payload, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = encode(payload)
+    elapsed = (time.perf_counter() - started) / repeat
+    compressed = gzip.compress(body, compresslevel=5)
+    print(f"{label:<24} {len(body):>12,} bytes  {len(compressed):>10,} gzipped  {elapsed * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = bookings_payload(args.bookings)
+    measure('before: indent=4', lambda value: json.dumps(value, indent=4).encode(), payload, args.repeat)
+    measure('after: pretty=1', lambda value: encode_json(value, pretty=True), payload, args.repeat)
+    measure(f"after: compact ({'orjson' if orjson else 'stdlib'})", encode_json, payload, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
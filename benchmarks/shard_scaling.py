@@ -0,0 +1,92 @@
+"""
+Throughput of ShardedUserManager from 1 to N shard processes, against a plain UserManager in one process.
+
+Client threads call the manager concurrently. The single user workload (get_availability, book_meeting) runs
+entirely on the owning shard, the overlap workload mostly combines users of different shards in the router.
+Result caches are off so every call does its work. Shards only help with as many cores as shards.
+
+Usage: python -m benchmarks.shard_scaling [--max-shards 8] [--users 2000] [--ops 20000] [--clients 32]
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.data import random_time_ranges
+from manager.calendly_manager import UserManager
+from manager.sharding import ShardedUserManager
+from utils.exceptions import SlotNotAvailableException
+from utils.helper_functions import get_booking_window
+
+
+def populate(manager, users, days, seed) -> list:
+    rng = random.Random(seed)
+    results = manager.add_users([{'user_name': f"user{i}", 'phone_number': str(i)} for i in range(users)])
+    user_ids = [result['user_id'] for result in results]
+    manager.bulk_update_availability([
+        {'user_id': user_id, 'date': date, 'time_ranges': random_time_ranges(rng, 4)}
+        for user_id in user_ids for date in get_booking_window()[:days]])
+    return user_ids
+
+
+def run(manager, user_ids, days, ops, clients, seed) -> dict:
+    rng = random.Random(seed)
+    dates = get_booking_window()[:days]
+
+    def single(_):
+        user_id = rng.choice(user_ids)
+        if rng.random() < 0.8:
+            manager.get_availability(user_id)
+        else:
+            start = rng.randrange(7 * 60, 20 * 60, 15)
+            try:
+                manager.book_meeting(user_id, rng.choice(dates), start, start + 15, rng.choice(user_ids))
+            except SlotNotAvailableException:
+                pass
+
+    def overlap(_):
+        manager.get_overlapping_availability(*rng.sample(user_ids, 2))
+
+    throughput = {}
+    for name, operation in (('single_user', single), ('overlap', overlap)):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(operation, range(ops)))
+        throughput[name] = ops / (time.perf_counter() - started)
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--max-shards', type=int, default=os.cpu_count())
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=11)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    shard_counts = [0] + [count for count in (1, 2, 4, 8, 16, 32, 64) if count < args.max_shards] + [args.max_shards]
+    results = []
+    for shard_count in sorted(set(shard_counts)):
+        manager = ShardedUserManager(shard_count, cache_size=0) if shard_count else UserManager(cache_size=0)
+        try:
+            user_ids = populate(manager, args.users, args.days, args.seed)
+            throughput = run(manager, user_ids, args.days, args.ops, args.clients, args.seed)
+        finally:
+            if shard_count:
+                manager.close()
+        label = f"{shard_count} shards" if shard_count else 'UserManager'
+        print(f"{label:<12} single user {throughput['single_user']:>9,.0f} ops/s   "
+              f"overlap {throughput['overlap']:>9,.0f} ops/s")
+        results.append(dict(throughput, shards=shard_count))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Concurrency stress check for UserManager.
+
+Fires thousands of concurrent add_user and book_meeting calls from a thread pool and verifies that
+user ids are unique, no two bookings of a user overlap and that every booked minute was removed from
+availability exactly once (no lost update). Exits with status 1 on any violation.
+
+Usage: python -m benchmarks.stress_booking [--threads 32] [--bookings 5000]
+"""
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from manager.calendly_manager import UserManager
+from models.interval_model import minutes_to_time
+from utils.exceptions import SlotNotAvailableException
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--bookings', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    # switch threads as often as possible to shake out races
+    sys.setswitchinterval(1e-6)
+    manager = UserManager()
+    with ThreadPoolExecutor(args.threads) as pool:
+        user_ids = list(pool.map(lambda i: manager.add_user(f"user{i}", str(i)), range(args.users * 50)))
+    failures = []
+    if len(set(user_ids)) != len(user_ids):
+        failures.append(f"duplicate user ids allocated: {len(user_ids) - len(set(user_ids))}")
+
+    user_ids = user_ids[:args.users]
+    dates = sorted(manager.get_availability(user_ids[0]))[:args.days]
+    for user_id in user_ids:
+        manager.update_availability(user_id, dates, [[{'start_time': '08:00', 'end_time': '18:00'}]] * len(dates))
+    original_minutes = 10 * 60
+
+    rng = random.Random(args.seed)
+    requests = []
+    for _ in range(args.bookings):
+        start = rng.randrange(8 * 60, 18 * 60 - 15, 5)
+        requests.append((rng.choice(user_ids), rng.choice(dates), start, start + rng.choice((15, 30, 45))))
+
+    def book(request):
+        user_id, date, start, end = request
+        try:
+            manager.book_meeting(user_id, date, minutes_to_time(start), minutes_to_time(min(end, 18 * 60)), 1)
+            return True
+        except SlotNotAvailableException:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        succeeded = sum(pool.map(book, requests))
+    elapsed = time.perf_counter() - started
+
+    booked_count = 0
+    for user_id in user_ids:
+        user = manager.get_user(user_id)
+        for date in dates:
+            bookings = sorted((booking.get_start(), booking.get_end())
+                              for booking in user.get_booked_meetings().get(date))
+            booked_count += len(bookings)
+            for (_, previous_end), (start, _) in zip(bookings, bookings[1:]):
+                if start < previous_end:
+                    failures.append(f"user {user_id} {date}: overlapping bookings")
+            booked_minutes = sum(end - start for start, end in bookings)
+            free_minutes = sum(end - start for start, end in user.get_availability()[date].get_intervals())
+            if booked_minutes + free_minutes != original_minutes:
+                failures.append(f"user {user_id} {date}: {booked_minutes} booked + {free_minutes} free "
+                                f"!= {original_minutes} minutes")
+    if booked_count != succeeded:
+        failures.append(f"{succeeded} successful bookings but {booked_count} recorded")
+
+    print(f"{len(requests)} booking attempts on {args.threads} threads in {elapsed:.2f}s, {succeeded} succeeded")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
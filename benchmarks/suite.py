@@ -0,0 +1,187 @@
+"""
+Benchmark suite for the scheduling core and the HTTP endpoints.
+
+Times the helper functions and UserManager methods on synthetic data, then the endpoints through the Flask test
+client (skipped when Flask is not installed), and writes machine readable results that
+benchmarks/compare.py can diff between commits.
+
+Usage: python -m benchmarks.suite [--users 1000] [--days 31] [--output bench.json]
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+
+from benchmarks.data import populate, random_time_ranges
+from manager.calendly_manager import UserManager
+from utils.helper_functions import get_booking_window, merge_time_ranges, find_overlapping_ranges, \
+    find_common_intervals, to_intervals, validate_time_range, validate_date_list
+
+
+def timeit(name, func, repeat, results):
+    """
+    Call func repeat times and record per call latency percentiles
+    :param name: benchmark name
+    :param func: zero argument callable
+    :param repeat: number of calls
+    :param results: dict to store the measurement in
+    """
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    results[name] = {
+        'ops': repeat,
+        'mean_us': sum(durations) / repeat * 1e6,
+        'p50_us': durations[repeat // 2] * 1e6,
+        'p99_us': durations[min(repeat - 1, int(repeat * 0.99))] * 1e6
+    }
+    print(f"{name:<40} mean {results[name]['mean_us']:>10.1f} us  p99 {results[name]['p99_us']:>10.1f} us")
+
+
+def bench_helpers(rng, repeat, results):
+    days = [to_intervals(random_time_ranges(rng, 8)) for _ in range(repeat)]
+    it = iter(days)
+    timeit('merge_time_ranges', lambda: merge_time_ranges(next(it)), repeat, results)
+    lists = [merge_time_ranges(day) for day in days]
+    timeit('find_overlapping_ranges', lambda: find_overlapping_ranges(rng.choice(lists), rng.choice(lists)),
+           repeat, results)
+    timeit('find_common_intervals_k10', lambda: find_common_intervals(rng.sample(lists, 10)), repeat, results)
+    payload = [random_time_ranges(rng, 4) for _ in range(31)]
+    timeit('validate_time_range_31_days', lambda: validate_time_range(payload), repeat, results)
+    dates = list(get_booking_window())
+    timeit('validate_date_list_31_days', lambda: validate_date_list(dates), repeat, results)
+
+
+def bench_manager(args, rng, results):
+    dates = get_booking_window()
+    # cache_size=0 measures the uncached computation, the default cache is measured separately
+    for label, cache_size in (('uncached', 0), ('cached', 1024)):
+        manager = UserManager(cache_size=cache_size)
+        user_ids = populate(manager, args.users, args.days, args.ranges, args.bookings, args.seed)
+        hot_ids = user_ids[:50]
+        pairs = [rng.sample(hot_ids, 2) for _ in range(20)]
+        groups = [rng.sample(hot_ids, 10) for _ in range(20)]
+        timeit(f"get_availability_{label}", lambda: manager.get_availability(rng.choice(hot_ids)),
+               args.repeat, results)
+        timeit(f"get_meetings_{label}", lambda: manager.get_meetings(rng.choice(hot_ids)), args.repeat, results)
+        timeit(f"get_overlapping_availability_{label}",
+               lambda: manager.get_overlapping_availability(*rng.choice(pairs)), args.repeat, results)
+        timeit(f"get_group_availability_10_{label}",
+               lambda: manager.get_group_availability(rng.choice(groups), min_duration=30), args.repeat, results)
+    timeit('find_slots_3_users', lambda: manager.find_slots(rng.sample(user_ids, 3), 30, limit=5),
+           args.repeat, results)
+
+    booked = []
+
+    def book():
+        user_id = rng.choice(user_ids)
+        date = rng.choice(dates[:args.days])
+        free = manager.get_user(user_id).get_availability()[date].get_intervals().pairs()
+        if free and free[0][1] - free[0][0] >= 15:
+            start = free[0][0]
+            result = manager.book_meeting(user_id, date, f"{start // 60:02d}:{start % 60:02d}",
+                                          f"{(start + 15) // 60:02d}:{(start + 15) % 60:02d}", rng.choice(user_ids))
+            booked.append((user_id, result['booking_id']))
+    timeit('book_meeting', book, args.repeat, results)
+
+    def reschedule():
+        # moving a booking onto its own slot exercises the full restore, check and carve path
+        user_id, booking_id = rng.choice(booked)
+        booking = manager.get_user(user_id).get_booked_meetings().get_by_id(booking_id)
+        manager.reschedule_meeting(user_id, booking_id, booking.get_date(), booking.get_start(), booking.get_end())
+
+    def cancel():
+        if booked:
+            manager.cancel_meeting(*booked.pop())
+    if booked:
+        timeit('reschedule_meeting', reschedule, args.repeat, results)
+        timeit('cancel_meeting', cancel, args.repeat, results)
+    # rewrites the requestor snapshot on every booking the user requested
+    timeit('update_user', lambda: manager.update_user(rng.choice(user_ids), phone=str(rng.randrange(10 ** 9))),
+           args.repeat, results)
+
+
+def bench_timezones(args, rng, results):
+    """
+    Overlap queries between users of one timezone run date by date, users of different timezones are
+    intersected on their UTC timelines
+    """
+    zones = ['UTC', 'Europe/Berlin', 'America/New_York', 'Asia/Kolkata']
+    for label, cache_size in (('uncached', 0), ('cached', 1024)):
+        manager = UserManager(cache_size=cache_size)
+        user_ids = populate(manager, min(args.users, 200), args.days, args.ranges, 0, args.seed, timezones=zones)
+        same_zone, mixed_zones = user_ids[::len(zones)], user_ids[:50]
+        # groups of 10, or of every user in the zone with small --users
+        mixed_groups = [rng.sample(mixed_zones, min(10, len(mixed_zones))) for _ in range(20)]
+        same_groups = [rng.sample(same_zone, min(10, len(same_zone))) for _ in range(20)]
+        timeit(f"get_group_availability_10_same_tz_{label}",
+               lambda: manager.get_group_availability(rng.choice(same_groups)), args.repeat, results)
+        timeit(f"get_group_availability_10_mixed_tz_{label}",
+               lambda: manager.get_group_availability(rng.choice(mixed_groups)), args.repeat, results)
+        timeit(f"find_slots_10_mixed_tz_{label}",
+               lambda: manager.find_slots(rng.choice(mixed_groups), 30, limit=10), args.repeat, results)
+
+
+def bench_http(args, rng, results):
+    try:
+        from controller.app import app, user_manager
+    except ImportError as e:
+        print(f"skipping HTTP benchmarks: {e}")
+        return
+    user_ids = populate(user_manager, min(args.users, 200), args.days, args.ranges, args.bookings, args.seed)
+    client = app.test_client()
+    cases = [
+        ('http_get_user_availability', '/Users/get_user_availability', lambda: {'user_id': rng.choice(user_ids)}),
+        ('http_get_bookings', '/Meetings/get_bookings', lambda: {'user_id': rng.choice(user_ids)}),
+        ('http_get_availability_overlap', '/Availability/get_availability_overlap',
+         lambda: dict(zip(('user_id_1', 'user_id_2'), rng.sample(user_ids, 2)))),
+        ('http_find_slots', '/Availability/find_slots',
+         lambda: {'user_ids': rng.sample(user_ids, 3), 'duration': 30, 'limit': 5}),
+    ]
+    for name, path, payload in cases:
+        timeit(name, lambda: client.post(path, json=payload()), args.repeat, results)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--ranges', type=int, default=4, help='availability ranges per day')
+    parser.add_argument('--bookings', type=int, default=20, help='bookings per user')
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {}
+    bench_helpers(rng, args.repeat, results)
+    bench_manager(args, rng, results)
+    bench_timezones(args, rng, results)
+    bench_http(args, rng, results)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'scale': {'users': args.users, 'days': args.days, 'ranges': args.ranges, 'bookings': args.bookings,
+                  'repeat': args.repeat},
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,51 @@
 import json
+import os
 from textwrap import indent
 
 from flask import Flask, request, Response
 from flask_restx import Api, Resource, fields
 
 from controller.schema import hello_world_model, add_user_model, add_user_response_model, get_user_model, \
-    time_range_model, set_user_availability_model, get_overlap_model, book_meeting_model, get_bookings_model
-from utils.exceptions import UserNotFoundException, DateOutOfBoundException, SlotNotAvailableException
+    time_range_model, set_user_availability_model, bulk_availability_row_model, recurring_availability_model, \
+    get_overlap_model, get_group_overlap_model, find_slots_model, book_meeting_model, get_bookings_model, \
+    cancel_meeting_model, reschedule_meeting_model, export_user_model, update_user_model
+from utils.exceptions import UserNotFoundException, DateOutOfBoundException, SlotNotAvailableException, \
+    BookingNotFoundException
 from manager.calendly_manager import UserManager
+from manager.sharding import ShardedUserManager
 from controller.api_instance import api
-from utils.helper_functions import validate_time_range, validate_date_list
+from controller.response import json_response, ndjson_response, error_response
+from controller.instrumentation import init_instrumentation
+from utils.metrics import metrics
+from utils.helper_functions import validate_time_range, validate_date_list, validate_date_format, validate_date_range, \
+    validate_weekdays, validate_timezone, validate_page_limit
+from storage.sqlite_storage import SQLiteStorage
+from storage.journal_storage import JournalStorage
 
 
 app = Flask(__name__)
 app.config.SWAGGER_UI_URL = '/swagger'
 api.init_app(app)
+init_instrumentation(app)
 
 
 api.models = {
     'HelloWorld': hello_world_model,
     'AddUser': add_user_model,
     'AddUserResponse': add_user_response_model,
+    'UpdateUser': update_user_model,
     'GetUser': get_user_model,
+    'ExportUser': export_user_model,
     'TimeRange': time_range_model,
     'SetUserAvailability': set_user_availability_model,
+    'BulkAvailabilityRow': bulk_availability_row_model,
+    'RecurringAvailability': recurring_availability_model,
     'GetOverlap': get_overlap_model,
+    'GetGroupOverlap': get_group_overlap_model,
+    'FindSlots': find_slots_model,
     'BookMeeting': book_meeting_model,
+    'CancelMeeting': cancel_meeting_model,
+    'RescheduleMeeting': reschedule_meeting_model,
     'GetBookings': get_bookings_model,
 }
 
@@ -33,33 +53,148 @@ user_ns = api.namespace('Users', description='User related operations')
 meeting_ns = api.namespace('Meetings', description='Meeting related operations')
 availability_ns = api.namespace('Availability', description='Availability related operations')
 
-#In memory DB
-user_manager = UserManager()
+MAX_SLOTS = 100
+
+#In memory DB, written through to SQLite when CALENDLY_DB_PATH is set so workers share data and survive restarts,
+#or journaled to CALENDLY_JOURNAL_DIR for in-memory speed with durability in a single worker
+#CALENDLY_SHARDS partitions the users over that many worker processes behind a router
+db_path = os.environ.get('CALENDLY_DB_PATH')
+journal_dir = os.environ.get('CALENDLY_JOURNAL_DIR')
+shards = int(os.environ.get('CALENDLY_SHARDS', 0))
+cache_size = int(os.environ.get('CALENDLY_CACHE_SIZE', 1024))
+#CALENDLY_BITMAP_GRANULARITY=15 answers overlap and slot queries on bitsets for calendars in 15 minute steps
+bitmap_granularity = int(os.environ.get('CALENDLY_BITMAP_GRANULARITY', 0)) or None
+if shards and not db_path:
+    user_manager = ShardedUserManager(shards, journal_dir, cache_size=cache_size, bitmap_granularity=bitmap_granularity)
+else:
+    if db_path:
+        storage = SQLiteStorage(db_path)
+    elif journal_dir:
+        storage = JournalStorage(journal_dir, snapshot_every=int(os.environ.get('CALENDLY_SNAPSHOT_EVERY', 100000)))
+    else:
+        storage = None
+    user_manager = UserManager(storage, cache_size=cache_size, bitmap_granularity=bitmap_granularity)
+
+
+def read_rows() -> list:
+    """
+    Read bulk import rows from a JSON array body or an NDJSON body (Content-Type: application/x-ndjson).
+    NDJSON lines that are not valid JSON are kept as None so they get reported as a row error.
+    :return: list of rows
+    """
+    if request.mimetype == 'application/x-ndjson':
+        rows = []
+        for line in request.get_data(as_text=True).splitlines():
+            if line.strip():
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    rows.append(None)
+        return rows
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of rows")
+    return rows
+
+
+def bulk_response(results) -> Response:
+    failed = sum(1 for result in results if 'error' in result)
+    return json_response({
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results
+    })
 
 
 @api.route('/hello')
 class HelloWorld(Resource):
-    @api.marshal_with(hello_world_model)
+    @api.response(200, 'Success', hello_world_model)
     def get(self):
         """
         Returns a friendly 'Hello World!' message
         """
-        return {'message': 'Hello World!'}
+        return json_response({'message': 'Hello World!'})
+
+
+@api.route('/cache_stats')
+class CacheStats(Resource):
+    def get(self):
+        """
+        Returns hit/miss counters of the availability and bookings result cache
+        """
+        return json_response(user_manager.cache_stats())
+
+
+@api.route('/metrics')
+class Metrics(Resource):
+    def get(self):
+        """
+        Prometheus style metrics: endpoint and UserManager latency histograms, exception counters and in-memory sizes
+        """
+        sizes = user_manager.sizes()
+        cache_stats = user_manager.cache_stats()
+        gauges = {
+            'calendly_users': ('Users loaded in memory', sizes['users']),
+            'calendly_availability_intervals': ('Availability intervals in memory', sizes['intervals']),
+            'calendly_recurrence_rules': ('Recurrence rules in memory', sizes['recurrence_rules']),
+            'calendly_bookings': ('Bookings in memory', sizes['bookings']),
+            'calendly_cache_entries': ('Entries in the result cache', cache_stats['size']),
+            'calendly_cache_hits': ('Result cache hits', cache_stats['hits']),
+            'calendly_cache_misses': ('Result cache misses', cache_stats['misses']),
+        }
+        return Response(metrics.render(gauges), status=200, mimetype='text/plain; version=0.0.4')
 
 
 @user_ns.route('/add_user')
 class AddUser(Resource):
     @api.doc(description="Add new user")
     @api.expect(add_user_model)
-    @api.marshal_with(add_user_response_model)
+    @api.response(200, 'Success', add_user_response_model)
     def post(self):
         """
         Add new user in in-memory db
         """
         name = request.json['user_name']
         phone_number = request.json['phone_number']
-        user_id = user_manager.add_user(name, phone_number)
-        return {'message': 'User added successfully', 'user_id': user_id}
+        try:
+            timezone = validate_timezone(request.json.get('timezone'))
+        except ValueError as e:
+            return error_response(e, 422)
+        user_id = user_manager.add_user(name, phone_number, timezone)
+        return json_response({'message': 'User added successfully', 'user_id': user_id})
+
+
+@user_ns.route('/add_users')
+class AddUsers(Resource):
+    @api.doc(description="Add many users from a JSON array or NDJSON body")
+    @api.expect([add_user_model])
+    def post(self):
+        """
+        Bulk add users, reporting errors per row without aborting the batch
+        """
+        try:
+            return bulk_response(user_manager.add_users(read_rows()))
+        except ValueError as e:
+            return error_response(e, 422)
+
+
+@user_ns.route('/update_user')
+class UpdateUser(Resource):
+    @api.doc(description="Change the name and/or phone number of a user")
+    @api.expect(update_user_model)
+    def post(self):
+        """
+        Change the name and/or phone number of a user
+        """
+        user_id = request.json.get("user_id")
+        user_name = request.json.get("user_name")
+        phone_number = request.json.get("phone_number")
+        try:
+            return json_response(user_manager.update_user(user_id, user_name, phone_number))
+        except ValueError as e:
+            return error_response(e, 422)
+        except UserNotFoundException as e:
+            return error_response(e, 400)
 
 
 @user_ns.route('/get_user_availability')
@@ -68,22 +203,48 @@ class GetUser(Resource):
     @api.expect(get_user_model)
     def post(self):
         """
-        Get Availability for a user
+        Get Availability for a user, bookings are paged when cursor or limit is given
         """
         user_id = request.json.get("user_id")
+        cursor = request.json.get("cursor")
+        limit = request.json.get("limit")
         try:
             user = user_manager.get_user(user_id)
             availability = user_manager.get_availability(user_id)
-            bookings = user_manager.get_meetings(user_id)
-            return Response(json.dumps({
+            output = {
                 'user_id': user.get_user_id(),
                 'user_name': user.get_name(),
                 'phone_number': user.get_phone(),
-                'availability': availability,
-                'bookings': bookings
-            }, indent=4), status=200)
+                'timezone': user.get_timezone(),
+                'availability': availability
+            }
+            if cursor is None and limit is None:
+                output['bookings'] = user_manager.get_meetings(user_id)
+            else:
+                output['bookings'], output['next_cursor'] = user_manager.get_meetings_page(
+                    user_id, cursor=cursor, limit=validate_page_limit(limit))
+            return json_response(output)
+        except ValueError as e:
+            return error_response(e, 422)
+        except UserNotFoundException as e:
+            return error_response(e, 400)
+
+
+@user_ns.route('/export_user')
+class ExportUser(Resource):
+    @api.doc(description="Export a user's profile, availability and bookings as NDJSON, one record per line")
+    @api.expect(export_user_model)
+    def post(self):
+        """
+        Stream a user's profile, availability and bookings as NDJSON
+        """
+        user_id = request.json.get("user_id")
+        try:
+            # fail before the stream starts, errors can not change the status once lines are sent
+            user_manager.get_user(user_id)
         except UserNotFoundException as e:
-            return Response(json.dumps({"error": str(e)}), status=400)
+            return error_response(e, 400)
+        return ndjson_response(user_manager.export_user(user_id))
 
 
 @availability_ns.route('/set_user_availability')
@@ -98,16 +259,59 @@ class SetAvailability(Resource):
         date_list = request.json.get("date_list")
         time_ranges = request.json.get("time_ranges")
         try:
-            validate_time_range(time_ranges)
-            validate_date_list(date_list)
-            message = user_manager.update_availability(user_id, date_list, time_ranges)
-            return Response(json.dumps({"message": message.get("message")}), status=200)
+            intervals = validate_time_range(time_ranges)
+            date_list = validate_date_list(date_list)
+            message = user_manager.update_availability(user_id, date_list, intervals)
+            return json_response({"message": message.get("message")})
         except ValueError as e:
-            return Response(json.dumps({"error": str(e)}), status=422)
+            return error_response(e, 422)
         except UserNotFoundException as e:
-            return Response(json.dumps({"error": str(e)}), status=400)
+            return error_response(e, 400)
         except DateOutOfBoundException as e:
-            return Response(json.dumps({"error": str(e)}), status=400)
+            return error_response(e, 400)
+
+
+@availability_ns.route('/set_recurring_availability')
+class SetRecurringAvailability(Resource):
+    @api.doc(description="Set weekly recurring availability for a user")
+    @api.expect(recurring_availability_model, validate=True)
+    def post(self):
+        """
+        Set weekly recurring availability for a user, stored once and expanded per date when queried
+        """
+        user_id = request.json.get("user_id")
+        weekdays = request.json.get("weekdays")
+        time_ranges = request.json.get("time_ranges")
+        start_date = request.json.get("start_date")
+        end_date = request.json.get("end_date")
+        exceptions = request.json.get("exceptions") or []
+        replace = bool(request.json.get("replace"))
+        try:
+            validate_weekdays(weekdays)
+            intervals = validate_time_range([time_ranges])[0]
+            start_date, end_date = validate_date_range(start_date, end_date, bounded=False)
+            exceptions = validate_date_format(exceptions)
+            message = user_manager.add_recurring_availability(user_id, weekdays, intervals, start_date, end_date,
+                                                              exceptions, replace)
+            return json_response(message)
+        except ValueError as e:
+            return error_response(e, 422)
+        except UserNotFoundException as e:
+            return error_response(e, 400)
+
+
+@availability_ns.route('/set_bulk_availability')
+class SetBulkAvailability(Resource):
+    @api.doc(description="Set availability rows for many users from a JSON array or NDJSON body")
+    @api.expect([bulk_availability_row_model])
+    def post(self):
+        """
+        Bulk set availability, one row per user and date, reporting errors per row without aborting the batch
+        """
+        try:
+            return bulk_response(user_manager.bulk_update_availability(read_rows()))
+        except ValueError as e:
+            return error_response(e, 422)
 
 
 @availability_ns.route('/get_availability_overlap')
@@ -120,11 +324,67 @@ class GetOverlap(Resource):
         """
         user_id_1 = request.json.get("user_id_1")
         user_id_2 = request.json.get("user_id_2")
+        timezone = request.json.get("timezone")
         try:
-            message = user_manager.get_overlapping_availability(user_id_1, user_id_2)
-            return Response(json.dumps({"output": message}, indent=4), status=200)
+            timezone = validate_timezone(timezone) if timezone else None
+            message = user_manager.get_overlapping_availability(user_id_1, user_id_2, timezone)
+            return json_response({"output": message})
+        except ValueError as e:
+            return error_response(e, 422)
         except UserNotFoundException as e:
-            return Response(json.dumps({"error": str(e)}), status=400)
+            return error_response(e, 400)
+
+
+@availability_ns.route('/get_group_availability_overlap')
+class GetGroupOverlap(Resource):
+    @api.doc(description="Get common availability of a group of users")
+    @api.expect(get_group_overlap_model, validate=True)
+    def post(self):
+        """
+        Get common availability of a group of users, keeping only slots of at least min_duration minutes
+        """
+        user_ids = request.json.get("user_ids")
+        start_date = request.json.get("start_date")
+        end_date = request.json.get("end_date")
+        min_duration = request.json.get("min_duration") or 0
+        timezone = request.json.get("timezone")
+        try:
+            start_date, end_date = validate_date_range(start_date, end_date)
+            if min_duration < 0:
+                raise ValueError("min_duration should not be negative")
+            timezone = validate_timezone(timezone) if timezone else None
+            message = user_manager.get_group_availability(user_ids, start_date, end_date, min_duration, timezone)
+            return json_response({"output": message})
+        except ValueError as e:
+            return error_response(e, 422)
+        except UserNotFoundException as e:
+            return error_response(e, 400)
+
+
+@availability_ns.route('/find_slots')
+class FindSlots(Resource):
+    @api.doc(description="Find the next free slots common to one or more users")
+    @api.expect(find_slots_model, validate=True)
+    def post(self):
+        """
+        Find the first free slots of a given duration common to all users, earliest first
+        """
+        user_ids = request.json.get("user_ids")
+        duration = request.json.get("duration")
+        granularity = request.json.get("granularity") or 15
+        start_date = request.json.get("start_date")
+        end_date = request.json.get("end_date")
+        limit = min(request.json.get("limit") or 10, MAX_SLOTS)
+        timezone = request.json.get("timezone")
+        try:
+            start_date, end_date = validate_date_range(start_date, end_date)
+            timezone = validate_timezone(timezone) if timezone else None
+            slots = user_manager.find_slots(user_ids, duration, granularity, start_date, end_date, limit, timezone)
+            return json_response({"slots": slots})
+        except ValueError as e:
+            return error_response(e, 422)
+        except UserNotFoundException as e:
+            return error_response(e, 400)
 
 
 @meeting_ns.route('/book_meeting')
@@ -140,18 +400,70 @@ class BookMeeting(Resource):
         start_time = request.json.get("start_time")
         end_time = request.json.get("end_time")
         requestor_id = request.json.get("requestor_id")
+        timezone = request.json.get("timezone")
+        try:
+            [[(start, end)]] = validate_time_range([[{'start_time': start_time, 'end_time': end_time}]])
+            [date] = validate_date_format([date])
+            timezone = validate_timezone(timezone) if timezone else None
+            booking_status = user_manager.book_meeting(user_id, date, start, end, requestor_id, timezone)
+            return json_response(booking_status)
+        except ValueError as e:
+            return error_response(e, 422)
+        except UserNotFoundException as e:
+            return error_response(e, 400)
+        except DateOutOfBoundException as e:
+            return error_response(e, 400)
+        except SlotNotAvailableException as e:
+            return error_response(e, 400)
+
+@meeting_ns.route('/cancel_meeting')
+class CancelMeeting(Resource):
+    @api.doc(description="Cancel a booked meeting and free its time range again")
+    @api.expect(cancel_meeting_model)
+    def post(self):
+        """
+        Cancel a booked meeting
+        """
+        user_id = request.json.get("user_id")
+        booking_id = request.json.get("booking_id")
         try:
-            validate_time_range([[{'start_time': start_time, 'end_time': end_time}]])
-            booking_status = user_manager.book_meeting(user_id, date, start_time, end_time, requestor_id)
-            return Response(json.dumps(booking_status, indent=4), 200)
+            return json_response(user_manager.cancel_meeting(user_id, booking_id))
+        except UserNotFoundException as e:
+            return error_response(e, 400)
+        except BookingNotFoundException as e:
+            return error_response(e, 400)
+        except DateOutOfBoundException as e:
+            return error_response(e, 400)
+
+@meeting_ns.route('/reschedule_meeting')
+class RescheduleMeeting(Resource):
+    @api.doc(description="Move a booked meeting to another date or time range")
+    @api.expect(reschedule_meeting_model)
+    def post(self):
+        """
+        Move a booked meeting to another date or time range
+        """
+        user_id = request.json.get("user_id")
+        booking_id = request.json.get("booking_id")
+        date = request.json.get("date")
+        start_time = request.json.get("start_time")
+        end_time = request.json.get("end_time")
+        timezone = request.json.get("timezone")
+        try:
+            [[(start, end)]] = validate_time_range([[{'start_time': start_time, 'end_time': end_time}]])
+            [date] = validate_date_format([date])
+            timezone = validate_timezone(timezone) if timezone else None
+            return json_response(user_manager.reschedule_meeting(user_id, booking_id, date, start, end, timezone))
         except ValueError as e:
-            return Response(json.dumps({"error": str(e)}), status=422)
+            return error_response(e, 422)
         except UserNotFoundException as e:
-            return Response(json.dumps({'error': str(e)}), 400)
+            return error_response(e, 400)
+        except BookingNotFoundException as e:
+            return error_response(e, 400)
         except DateOutOfBoundException as e:
-            return Response(json.dumps({'error': str(e)}), 400)
+            return error_response(e, 400)
         except SlotNotAvailableException as e:
-            return Response(json.dumps({'error': str(e)}), 400)
+            return error_response(e, 400)
 
 @meeting_ns.route('/get_bookings')
 class GetOverlap(Resource):
@@ -162,11 +474,23 @@ class GetOverlap(Resource):
         Get bookings for a user
         """
         user_id = request.json.get("user_id")
+        start_date = request.json.get("start_date")
+        end_date = request.json.get("end_date")
+        requested = bool(request.json.get("requested"))
+        cursor = request.json.get("cursor")
+        limit = request.json.get("limit")
         try:
-            output = user_manager.get_meetings(user_id)
-            return Response(json.dumps({"booked_meetings": output}, indent=4), status=200)
+            start_date, end_date = validate_date_range(start_date, end_date)
+            key = "requested_meetings" if requested else "booked_meetings"
+            if cursor is None and limit is None:
+                return json_response({key: user_manager.get_meetings(user_id, start_date, end_date, requested)})
+            output, next_cursor = user_manager.get_meetings_page(user_id, start_date, end_date, requested, cursor,
+                                                                 validate_page_limit(limit))
+            return json_response({key: output, 'next_cursor': next_cursor})
+        except ValueError as e:
+            return error_response(e, 422)
         except UserNotFoundException as e:
-            return Response(json.dumps({"error": str(e)}), status=400)
+            return error_response(e, 400)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,68 @@
+import cProfile
+import os
+import tempfile
+import time
+
+from flask import g, request, got_request_exception
+from werkzeug.exceptions import HTTPException
+
+from utils.metrics import metrics
+
+# Opt in per request profiling: requests slower than CALENDLY_PROFILE_SLOW_MS get their cProfile stats dumped
+PROFILE_SLOW_MS = os.environ.get('CALENDLY_PROFILE_SLOW_MS')
+PROFILE_DIR = os.environ.get('CALENDLY_PROFILE_DIR', tempfile.gettempdir())
+
+
+def count_exception(error):
+    """
+    Count an exception of a request by type, whether a handler turned it into an error response or not
+    :param error: exception
+    """
+    metrics.increment('calendly_exceptions_total', 'Exceptions raised by type', type=type(error).__name__)
+
+
+def init_instrumentation(app):
+    """
+    Register request hooks recording per endpoint latency histograms, exception counts and the optional slow
+    request profiler
+    :param app: flask app
+    """
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        if PROFILE_SLOW_MS:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.histogram('calendly_http_request_seconds', 'Time spent handling HTTP requests',
+                          endpoint=endpoint, method=request.method).observe(elapsed)
+        metrics.increment('calendly_http_responses_total', 'HTTP responses by status', endpoint=endpoint,
+                          status=response.status_code)
+        return response
+
+    # Flask and flask-restx send this for exceptions no handler caught, the handled ones go through error_response.
+    # HTTP errors like a malformed body are counted by status in calendly_http_responses_total.
+    @got_request_exception.connect_via(app)
+    def count_unhandled(sender, exception, **extra):
+        if not isinstance(exception, HTTPException):
+            count_exception(exception)
+
+    @app.teardown_request
+    def stop_profiler(error=None):
+        # teardown runs even when the handler raised, so the profiler never stays enabled
+        started = g.pop('request_started', None)
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        if started is not None and (time.perf_counter() - started) * 1000 >= float(PROFILE_SLOW_MS):
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            file_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint.strip('/').replace('/', '_')}.prof"
+            profiler.dump_stats(os.path.join(PROFILE_DIR, file_name))
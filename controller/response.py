@@ -0,0 +1,100 @@
+import gzip
+import json
+import time
+import zlib
+
+from flask import request, Response
+
+from controller.instrumentation import count_exception
+from utils.metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional, faster encoder
+    orjson = None
+
+# Bodies below this are not worth compressing, NDJSON streams are sent in chunks of about CHUNK_SIZE
+GZIP_MIN_SIZE = 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def encode_json(payload, pretty=False) -> bytes:
+    """
+    Encode payload with orjson when installed, falling back to the stdlib encoder
+    :param payload: JSON serializable object
+    :param pretty: indent the output for humans
+    :return: encoded body
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(payload, indent=4).encode()
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def _ndjson_chunks(records, compress):
+    compressor = zlib.compressobj(5, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    lines, size = [], 0
+    for record in records:
+        line = encode_json(record) + b'\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            chunk = b''.join(lines)
+            lines, size = [], 0
+            yield compressor.compress(chunk) if compressor else chunk
+    chunk = b''.join(lines)
+    if compressor:
+        yield compressor.compress(chunk) + compressor.flush()
+    elif chunk:
+        yield chunk
+
+
+def ndjson_response(records, status=200) -> Response:
+    """
+    Stream records as newline delimited JSON, encoding them as the client reads so the whole body is never held
+    in memory. Gzip is negotiated from Accept-Encoding as for json_response.
+    :param records: iterable of JSON serializable objects, consumed lazily
+    :param status: HTTP status code
+    :return: flask Response
+    """
+    compress = request.accept_encodings.quality('gzip') > 0
+    headers = {'Vary': 'Accept-Encoding'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(_ndjson_chunks(records, compress), status=status, mimetype='application/x-ndjson',
+                    headers=headers)
+
+
+def json_response(payload, status=200) -> Response:
+    """
+    Single place every handler builds its JSON response. Output is compact unless the request has ?pretty=1,
+    gzip is negotiated from Accept-Encoding. The body is encoded in memory, use ndjson_response to stream large
+    results.
+    :param payload: JSON serializable object
+    :param status: HTTP status code
+    :return: flask Response
+    """
+    pretty = request.args.get('pretty', '').lower() in ('1', 'true')
+    started = time.perf_counter()
+    body = encode_json(payload, pretty)
+    metrics.histogram('calendly_json_encode_seconds', 'Time spent encoding JSON responses').observe(
+        time.perf_counter() - started)
+    compress = len(body) >= GZIP_MIN_SIZE and request.accept_encodings.quality('gzip') > 0
+    headers = {'Vary': 'Accept-Encoding'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    if compress:
+        body = gzip.compress(body, compresslevel=5)
+    return Response(body, status=status, mimetype='application/json', headers=headers)
+
+
+def error_response(error, status) -> Response:
+    """
+    JSON error body for an exception a handler turned into a response, counted by type in the metrics
+    :param error: exception
+    :param status: HTTP status code
+    :return: flask Response
+    """
+    count_exception(error)
+    return json_response({'error': str(error)}, status)
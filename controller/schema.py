@@ -65,7 +65,15 @@ hello_world_model = api.model('HelloWorld', {
 
 add_user_model = api.model('AddUser', {
     'user_name': fields.String(required=True, description='Name of user'),
-    'phone_number': fields.String(required=True, description='Phone number')
+    'phone_number': fields.String(required=True, description='Phone number'),
+    'timezone': fields.String(description="IANA timezone of the user's availability and bookings, defaults to UTC",
+                              example='Europe/Berlin')
+})
+
+update_user_model = api.model('UpdateUser', {
+    'user_id': fields.Integer(required=True, description='User id'),
+    'user_name': fields.String(description='New name of user, unchanged when left out'),
+    'phone_number': fields.String(description='New phone number, unchanged when left out')
 })
 
 add_user_response_model = api.model('AddUserResponse', {
@@ -74,6 +82,12 @@ add_user_response_model = api.model('AddUserResponse', {
 })
 
 get_user_model = api.model('GetUser', {
+    'user_id': fields.Integer(description='User id'),
+    'cursor': fields.String(description='next_cursor of the previous page of bookings, pages the bookings when given'),
+    'limit': fields.Integer(description='Bookings per page, at most 1000, pages the bookings when given', example=100)
+})
+
+export_user_model = api.model('ExportUser', {
     'user_id': fields.Integer(description='User id')
 })
 
@@ -88,9 +102,47 @@ set_user_availability_model = api.model('SetUserAvailability', {
     'time_ranges': fields.List(fields.List(fields.Nested(time_range_model), description='List of lists of time ranges'))
 })
 
+bulk_availability_row_model = api.model('BulkAvailabilityRow', {
+    'user_id': fields.Integer(required=True, description='User id'),
+    'date': fields.String(required=True, description='Date in YYYY-MM-DD format'),
+    'time_ranges': fields.List(fields.Nested(time_range_model), description='List of time ranges')
+})
+
+recurring_availability_model = api.model('RecurringAvailability', {
+    'user_id': fields.Integer(required=True, description='User id'),
+    'weekdays': fields.List(fields.Integer(), required=True, description='Weekdays, 0 is Monday and 6 is Sunday'),
+    'time_ranges': fields.List(fields.Nested(time_range_model), required=True, description='List of time ranges'),
+    'start_date': fields.String(description='First date the rule applies to in YYYY-MM-DD format'),
+    'end_date': fields.String(description='Last date the rule applies to in YYYY-MM-DD format'),
+    'exceptions': fields.List(fields.String(), description='Dates the rule does not apply to'),
+    'replace': fields.Boolean(description='Replace existing rules instead of adding to them', default=False)
+})
+
 get_overlap_model = api.model('GetOverlap', {
     'user_id_1': fields.Integer(description='User id'),
-    'user_id_2': fields.Integer(description='User id')
+    'user_id_2': fields.Integer(description='User id'),
+    'timezone': fields.String(description="Timezone of the returned dates and times, defaults to the first user's",
+                              example='Europe/Berlin')
+})
+
+get_group_overlap_model = api.model('GetGroupOverlap', {
+    'user_ids': fields.List(fields.Integer(), required=True, description='List of user ids'),
+    'start_date': fields.String(description='First date in YYYY-MM-DD format'),
+    'end_date': fields.String(description='Last date in YYYY-MM-DD format'),
+    'min_duration': fields.Integer(description='Minimum slot length in minutes', default=0),
+    'timezone': fields.String(description="Timezone of the dates and returned times, defaults to the first user's",
+                              example='Europe/Berlin')
+})
+
+find_slots_model = api.model('FindSlots', {
+    'user_ids': fields.List(fields.Integer(), required=True, description='List of user ids'),
+    'duration': fields.Integer(required=True, description='Slot length in minutes', example=30),
+    'granularity': fields.Integer(description='Slots start on multiples of this many minutes', default=15),
+    'start_date': fields.String(description='First date in YYYY-MM-DD format'),
+    'end_date': fields.String(description='Last date in YYYY-MM-DD format'),
+    'limit': fields.Integer(description='Maximum number of slots, at most 100', default=10),
+    'timezone': fields.String(description="Timezone of the dates and returned slots, defaults to the first user's",
+                              example='Europe/Berlin')
 })
 
 book_meeting_model = api.model('BookMeeting', {
@@ -98,8 +150,28 @@ book_meeting_model = api.model('BookMeeting', {
     'requestor_id': fields.Integer(description='Requestor ID'),
     'date': fields.String(required=True, description='Date in YYYY-MM-DD format'),
     'start_time': fields.String(required=True, description='Start time in HH:MM format'),
-    'end_time': fields.String(required=True, description='End time in HH:MM format')
+    'end_time': fields.String(required=True, description='End time in HH:MM format'),
+    'timezone': fields.String(description="Timezone of date and times, defaults to the user's",
+                              example='Europe/Berlin')
+})
+cancel_meeting_model = api.model('CancelMeeting', {
+    'user_id': fields.Integer(required=True, description='User ID the meeting was booked with'),
+    'booking_id': fields.Integer(required=True, description='Booking ID returned by book_meeting')
+})
+reschedule_meeting_model = api.model('RescheduleMeeting', {
+    'user_id': fields.Integer(required=True, description='User ID the meeting was booked with'),
+    'booking_id': fields.Integer(required=True, description='Booking ID returned by book_meeting'),
+    'date': fields.String(required=True, description='New date in YYYY-MM-DD format'),
+    'start_time': fields.String(required=True, description='New start time in HH:MM format'),
+    'end_time': fields.String(required=True, description='New end time in HH:MM format'),
+    'timezone': fields.String(description="Timezone of date and times, defaults to the user's",
+                              example='Europe/Berlin')
 })
 get_bookings_model = api.model('GetBookings', {
-    'user_id': fields.Integer(description='User id')
+    'user_id': fields.Integer(description='User id'),
+    'start_date': fields.String(description='First date in YYYY-MM-DD format'),
+    'end_date': fields.String(description='Last date in YYYY-MM-DD format'),
+    'requested': fields.Boolean(description='Return meetings the user requested on other calendars', default=False),
+    'cursor': fields.String(description='next_cursor of the previous page, pages the result when given'),
+    'limit': fields.Integer(description='Meetings per page, at most 1000, pages the result when given', example=100)
 })
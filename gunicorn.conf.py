@@ -0,0 +1,22 @@
+"""
+Production WSGI configuration, used with `gunicorn controller.app:app` (gunicorn reads this file by default).
+
+Each worker process has its own in-memory UserManager, so several workers only make sense with the shared SQLite
+storage (CALENDLY_DB_PATH). Without it, including with the journal (CALENDLY_JOURNAL_DIR), a single worker with
+many threads is used.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('CALENDLY_BIND', '0.0.0.0:8000')
+worker_class = 'gthread'
+workers = int(os.environ.get('CALENDLY_WORKERS',
+                             multiprocessing.cpu_count() * 2 + 1 if os.environ.get('CALENDLY_DB_PATH') else 1))
+threads = int(os.environ.get('CALENDLY_THREADS', 16))
+backlog = 2048
+keepalive = 5
+timeout = 30
+# recycle workers now and then to bound memory growth, with jitter so they do not restart together. Not with the
+# journal (CALENDLY_JOURNAL_DIR), where every restart replays the log.
+max_requests = 0 if os.environ.get('CALENDLY_JOURNAL_DIR') else 10000
+max_requests_jitter = 1000
@@ -1,164 +1,894 @@
-from utils.exceptions import UserNotFoundException, DateOutOfBoundException, SlotNotAvailableException
+import functools
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+from utils.exceptions import UserNotFoundException, DateOutOfBoundException, SlotNotAvailableException, \
+    BookingNotFoundException, StaleUserException
 from models.user_model import User
 from models.booking_model import Booking
-from utils.helper_functions import init_availability, merge_time_ranges, find_overlapping_ranges
+from models.availability_model import Availability, interval_bitmap
+from models.booking_index import BookingIndex, booking_position
+from models.recurrence_model import RecurrenceRule, RecurrenceSchedule, shift_date
+from models.timezone_model import DEFAULT_TIMEZONE, MINUTES_PER_DAY
+from utils.helper_functions import get_booking_window, is_in_booking_window, merge_time_ranges, to_intervals, \
+    to_time_list, common_availability, iter_slots, window_bitmap, common_bitmap_availability, iter_bitmap_slots, \
+    validate_user_row, validate_availability_row, validate_timezone, split_overnight, window_offset_table, \
+    utc_timeline, common_utc_availability, iter_utc_slots, to_slot, encode_cursor, decode_cursor, \
+    validate_profile_update, local_now
+from models.interval_model import time_to_minutes, minutes_to_time
+from utils.concurrency import LockRegistry
+from storage.memory_storage import InMemoryStorage
+from utils.cache import LRUCache
+from utils.metrics import metrics, timed
+
+manager_timed = functools.partial(timed, 'calendly_manager_seconds', 'Time spent in UserManager methods')
+
+STALE_WRITE_ATTEMPTS = 5
+
+# Bulk rows are committed in chunks of this many, a storage batch may lock out the writers of other processes
+BULK_CHUNK_SIZE = 500
+
+
+def retry_stale(method):
+    """
+    Rerun a UserManager write method on a reloaded user when its storage write was refused because another worker
+    process wrote to the user since this process loaded it. The first argument after self is the user id.
+    """
+    @functools.wraps(method)
+    def wrapper(self, user_id, *args, **kwargs):
+        for attempt in range(1, STALE_WRITE_ATTEMPTS + 1):
+            try:
+                return method(self, user_id, *args, **kwargs)
+            except StaleUserException:
+                if attempt == STALE_WRITE_ATTEMPTS:
+                    raise
+                # get_user reloads the user when it does not know the loaded version
+                self._storage_versions.pop(user_id, None)
+    return wrapper
 
 
 class UserManager:
-    def __init__(self):
+    def __init__(self, storage=None, cache_size=1024, bitmap_granularity=None):
+        """
+        :param storage: StorageBackend, defaults to InMemoryStorage
+        :param cache_size: number of cached read results
+        :param bitmap_granularity: slot length in minutes for bitmap mode, None for the exact interval sweep only
+        """
         self.users = {}
+        # First date of the booking window when past dates were last dropped from the loaded users
+        self._window_start = None
+        # Overlap and slot queries run on bitsets when every involved day is aligned to this granularity
+        self._bitmap_granularity = bitmap_granularity
+        # Writers lock (user_id, date) so concurrent requests on a threaded server can not double book a slot
+        self._locks = LockRegistry()
+        # Storage writes and reloads of a user are serialized on their own pool, taken while holding a lock of the
+        # one above
+        self._version_locks = LockRegistry()
+        self._storage = storage if storage is not None else InMemoryStorage()
+        # Storage version each cached user was loaded at, to notice writes made by other worker processes
+        self._storage_versions = {}
+        # Read results are cached under the versions of the users they depend on, every write bumps the version
+        self._cache = LRUCache(cache_size)
+        self._cache_versions = {}
+        self._cache_versions_lock = threading.Lock()
+        # Reverse index of requestor id to the bookings they made on other users' calendars
+        self._requested = {}
+        self._requested_lock = threading.Lock()
 
-    def add_user(self, user_name, phone) -> int:
+    @manager_timed(method='add_user')
+    def add_user(self, user_name, phone, timezone=DEFAULT_TIMEZONE) -> int:
         """
         Add new user
         :param user_name: user name
         :param phone:  Phone
+        :param timezone: IANA timezone name the user's availability and bookings are in
         :return: user_id
         """
-        user_id = len(self.users) + 1
-        user = User(user_id, user_name, phone)
-        user.set_availability(init_availability())
+        timezone = validate_timezone(timezone)
+        user_id = self._storage.create_user(user_name, phone, timezone)
+        user = User(user_id, user_name, phone, timezone)
         self.users[user.get_user_id()] = user
+        self._storage_versions[user_id] = 0
         return user_id
 
+    @manager_timed(method='add_users')
+    def add_users(self, rows) -> list:
+        """
+        Add many users, committed in storage batches of BULK_CHUNK_SIZE rows. Invalid rows are reported and
+        skipped, not fatal. When storage fails, the rows of the batches committed before stay added.
+        :param rows: iterable of dicts with user_name, phone_number and optional timezone
+        :return: list of per row results with either user_id or error
+        """
+        results = []
+        rows = enumerate(rows)
+        for chunk in iter(lambda: list(islice(rows, BULK_CHUNK_SIZE)), []):
+            user_ids = set()
+            with self._bulk_batch(user_ids):
+                for index, row in chunk:
+                    try:
+                        user_name, phone, timezone = validate_user_row(row)
+                        user_id = self.add_user(user_name, phone, timezone)
+                        user_ids.add(user_id)
+                        results.append({'row': index, 'user_id': user_id})
+                    except ValueError as e:
+                        results.append({'row': index, 'error': str(e)})
+        return results
+
+    @contextmanager
+    def _bulk_batch(self, user_ids):
+        """
+        Storage batch for a chunk of bulk rows. When it fails and storage rolls its writes back, the loaded copies
+        of the users it changed are dropped, so they are reloaded from storage or, if it created them, not found.
+        :param user_ids: set the block fills with the ids of the users it creates or changes
+        """
+        try:
+            with self._storage.batch():
+                yield
+        except BaseException:
+            if self._storage.transactional:
+                for user_id in user_ids:
+                    self._forget_user(user_id)
+            raise
+
+    def _forget_user(self, user_id):
+        """
+        Drop the loaded copy of a user and its reverse index entries, the next access loads it from storage
+        :param user_id: User id
+        """
+        with self._version_locks.hold(user_id):
+            user = self.users.pop(user_id, None)
+            self._storage_versions.pop(user_id, None)
+            if user is not None:
+                self._unindex_requested(user)
+        self._invalidate(user_id)
+
+    @manager_timed(method='update_user')
+    def update_user(self, user_id, user_name=None, phone=None) -> dict:
+        """
+        Change the name and/or phone of a user, together with the copy kept on every booking the user requested
+        :param user_id: User id
+        :param user_name: new user name, None to keep it
+        :param phone: new phone, None to keep it
+        :return: Update status message
+        """
+        validate_profile_update(user_name, phone)
+        user = self.get_user(user_id)
+        user_name = user.get_name() if user_name is None else user_name
+        phone = user.get_phone() if phone is None else phone
+        with self._storage.batch():
+            self._track_version(user_id, self._storage.update_user(user_id, user_name, phone))
+            # the profile changes before the snapshots, see _book_meeting
+            user.set_profile(user_name, phone)
+            self._refresh_requestor(user_id, (user_name, phone))
+        self._invalidate(user_id)
+        # requested meetings of others show this user as the host, and are not always cached under its version
+        for requestor_id in {booking.get_requestor_id() for booking in user.get_booked_meetings().iter_after()}:
+            self._invalidate(requestor_id)
+        return {'message': 'User updated successfully'}
+
+    def _refresh_requestor(self, requestor_id, requestor):
+        """
+        Replace the requestor snapshot on the bookings a user made, found through the reverse index
+        :param requestor_id: User id of the requestor
+        :param requestor: (name, phone)
+        """
+        index = self._requested_index(requestor_id)
+        if not len(index) and not self._storage.get_requested_user_ids(requestor_id):
+            return
+        for user_id, version in self._storage.update_requestor(requestor_id, requestor).items():
+            self._track_version(user_id, version)
+        host_ids = set()
+        for booking in index.iter_after():
+            booking.set_requestor(requestor)
+            host_ids.add(booking.get_user_id())
+        for host_id in host_ids:
+            self._invalidate(host_id)
+
     def get_user(self, user_id) -> User:
         """
         Get user from user id
         :param user_id: User id
         :return: User class object from user list
         """
-        if user_id in self.users:
-            return self.users[user_id]
-        else:
+        # SQLite would match "1" to user 1 by type affinity and cache the user under the string
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
             raise UserNotFoundException(f"User {user_id} not found")
+        self._evict_past_dates()
+        user = self.users.get(user_id)
+        version = self._storage.get_user_version(user_id)
+        if version is not None and (user is None or self._storage_versions.get(user_id) != version):
+            user = self._reload_user(user_id)
+        if user is None:
+            raise UserNotFoundException(f"User {user_id} not found")
+        return user
+
+    def _reload_user(self, user_id):
+        """
+        Replace the loaded copy of a user and its reverse index entries by the stored one. Serialized with the
+        storage writes of the user, so concurrent reloads neither index a user twice nor swap in an older copy.
+        :param user_id: User id
+        :return: User, None if storage does not know the user
+        """
+        with self._version_locks.hold(user_id):
+            stale_user = self.users.get(user_id)
+            version = self._storage.get_user_version(user_id)
+            if stale_user is not None and (version is None or self._storage_versions.get(user_id) == version):
+                # another thread reloaded it while this one waited for the lock
+                return stale_user
+            user, version = self._storage.load_user(user_id)
+            if user is None:
+                return None
+            if stale_user is not None:
+                self._unindex_requested(stale_user)
+            self._index_requested(user)
+            self.users[user_id] = user
+            self._storage_versions[user_id] = version
+        self._invalidate(user_id)
+        return user
+
+    def _evict_past_dates(self):
+        """
+        Drop the explicit availability of dates that left the booking window from every loaded user, once each
+        time the window rolls over. Users loaded from storage only get dates of the current window.
+        """
+        window_start = get_booking_window()[0]
+        if window_start == self._window_start:
+            return
+        self._window_start = window_start
+        for user in list(self.users.values()):
+            availability_dict = user.get_availability()
+            for date in list(availability_dict):
+                if date < window_start:
+                    availability_dict.pop(date, None)
+
+    def _requested_index(self, requestor_id) -> BookingIndex:
+        with self._requested_lock:
+            if requestor_id not in self._requested:
+                self._requested[requestor_id] = BookingIndex()
+            return self._requested[requestor_id]
+
+    def _index_requested(self, user):
+        for _, bookings in user.get_booked_meetings().items():
+            for booking in bookings:
+                self._requested_index(booking.get_requestor_id()).add(booking)
 
+    def _unindex_requested(self, user):
+        for _, bookings in user.get_booked_meetings().items():
+            for booking in bookings:
+                self._requested_index(booking.get_requestor_id()).remove(booking)
+
+    def _track_version(self, user_id, version):
+        """
+        Record the storage version after our own write. If another process wrote in between, forget the cached
+        version so the user is reloaded on next access.
+        """
+        if version is None:
+            return
+        if self._storage_versions.get(user_id) == version - 1:
+            self._storage_versions[user_id] = version
+        else:
+            self._storage_versions.pop(user_id, None)
+
+    def _write(self, user_id, write):
+        """
+        Run a storage write computed from the loaded copy of a user, conditional on the version it was loaded at.
+        Writes of one user are serialized here so they do not refuse each other within this process.
+        :param user_id: User id
+        :param write: function of the expected version, calling the storage write method
+        """
+        with self._version_locks.hold(user_id):
+            self._track_version(user_id, write(self._storage_versions.get(user_id)))
+
+    def _invalidate(self, user_id):
+        """
+        Bump the cache version of a user so results computed from the old state are never served again
+        """
+        with self._cache_versions_lock:
+            self._cache_versions[user_id] = self._cache_versions.get(user_id, 0) + 1
+
+    def _cache_key(self, name, user_ids) -> tuple:
+        versions = tuple(self._cache_versions.get(user_id, 0) for user_id in user_ids)
+        return name, get_booking_window()[0], tuple(user_ids), versions
+
+    def sizes(self) -> dict:
+        """
+        In memory sizes, computed by walking all loaded users
+        :return: dict with counts of users, availability intervals, recurrence rules and bookings
+        """
+        users = list(self.users.values())
+        return {
+            'users': len(users),
+            'intervals': sum(len(availability.get_intervals())
+                             for user in users for availability in list(user.get_availability().values())),
+            'recurrence_rules': sum(len(user.get_recurrence().rules) for user in users),
+            'bookings': sum(len(user.get_booked_meetings()) for user in users)
+        }
+
+    def cache_stats(self) -> dict:
+        """
+        :return: hit/miss counters of the result cache
+        """
+        return self._cache.stats()
+
+    @manager_timed(method='update_availability')
+    @retry_stale
     def update_availability(self, user_id, date_list, time_slots_list) -> dict:
         """
         Update availability of user
         :param user_id: User id of user
         :param date_list: List of dates to update availability for
-        :param time_slots_list: List of list of slots for all the above dates
+        :param time_slots_list: List of list of slots for all the above dates, as HH:MM dicts or parsed minute pairs.
+            A slot ending before it starts runs past midnight into the next date.
         :return: dict if updated successfully
         """
-        if user_id not in self.users:
-            raise UserNotFoundException(f"User {user_id} not found")
-        user = self.users[user_id]
-        for date, time_range in zip(date_list, time_slots_list):
-            availability_dict = user.get_availability()
-            if date in availability_dict:
-                existing_ranges = availability_dict.get(date).get_time_list()
-                new_ranges = existing_ranges + time_range
-                merged_ranges = merge_time_ranges(new_ranges)
-                user.availability[date].time_list = merged_ranges
-            else:
-                raise DateOutOfBoundException(f"date {date} is more than one month from now")
+        user = self.get_user(user_id)
+        try:
+            for date, time_range in zip(date_list, time_slots_list):
+                if is_in_booking_window(date):
+                    same_day, next_day = split_overnight(to_intervals(time_range))
+                    self._add_ranges(user, date, same_day)
+                    # the part after midnight is dropped when the next date is past the booking window
+                    if next_day and is_in_booking_window(shift_date(date, 1)):
+                        self._add_ranges(user, shift_date(date, 1), next_day)
+                else:
+                    raise DateOutOfBoundException(f"date {date} is more than one month from now")
+        finally:
+            self._invalidate(user_id)
         return {'message': 'Availability updated successfully'}
 
+    def _add_ranges(self, user, date, ranges):
+        user_id = user.get_user_id()
+        availability_dict = user.get_availability()
+        with self._locks.hold((user_id, date)):
+            # Availability is only materialized for dates the user actually sets, seeded from the
+            # recurrence rules so explicit ranges add to the weekly schedule instead of replacing it
+            availability = availability_dict.get(date)
+            merged_ranges = merge_time_ranges(self._intervals_on(user, date).pairs() + ranges)
+            self._write(user_id, lambda expected: self._storage.save_availability(
+                user_id, date, merged_ranges, expected_version=expected))
+            if availability:
+                availability.set_intervals(merged_ranges)
+            else:
+                availability_dict[date] = Availability(date, merged_ranges)
+
+    @manager_timed(method='add_recurring_availability')
+    @retry_stale
+    def add_recurring_availability(self, user_id, weekdays, time_ranges, start_date=None, end_date=None,
+                                   exceptions=(), replace=False) -> dict:
+        """
+        Add a weekly recurring availability rule. Dates without explicitly set availability are expanded from the
+        rules when queried, dates that were already set or booked keep their concrete availability.
+        :param user_id: User id of user
+        :param weekdays: list of weekdays the rule applies to, Monday is 0
+        :param time_ranges: list of time ranges available on those days, as HH:MM dicts or parsed minute pairs.
+            A range ending before it starts runs past midnight into the following day.
+        :param start_date: first date the rule applies to, defaults to no lower bound
+        :param end_date: last date the rule applies to, defaults to no upper bound
+        :param exceptions: dates the rule does not apply to
+        :param replace: drop the existing rules instead of adding to them
+        :return: dict if updated successfully
+        """
+        user = self.get_user(user_id)
+        same_day, next_day = split_overnight(to_intervals(time_ranges))
+        rule = RecurrenceRule(weekdays, merge_time_ranges(same_day), start_date, end_date, exceptions,
+                              merge_time_ranges(next_day))
+        with self._locks.hold((user_id, 'recurrence')):
+            rules = (() if replace else user.get_recurrence().rules) + (rule,)
+            self._write(user_id, lambda expected: self._storage.save_recurrence_rules(
+                user_id, rules, expected_version=expected))
+            user.set_recurrence(RecurrenceSchedule(rules))
+        self._invalidate(user_id)
+        return {'message': 'Recurring availability updated successfully'}
+
+    @staticmethod
+    def _intervals_on(user, date):
+        """
+        Availability of a user on a date, the explicitly set one if any, else expanded from the recurrence rules.
+        The returned list must not be modified.
+        """
+        availability = user.get_availability().get(date)
+        if availability is not None:
+            return availability.get_intervals()
+        return user.get_recurrence().expand(date)
+
+    def _interval_lists_on(self, users):
+        """
+        :param users: list of User objects
+        :return: function of a date returning the availability of every user on it
+        """
+        return lambda date: [self._intervals_on(user, date) for user in users]
+
+    def _window_bitmaps(self, users, dates):
+        """
+        :param users: list of User objects
+        :param dates: consecutive dates of the booking window to cover
+        :return: list of window bitmaps, one per user, None if a user has a day not aligned to the bitmap
+            granularity
+        """
+        granularity = self._bitmap_granularity
+        stride = 24 * 60 // granularity + 1
+        shift = get_booking_window().index(dates[0]) * stride if dates else 0
+        mask = (1 << len(dates) * stride) - 1
+        bitmaps = []
+        for user in users:
+            # the bitmap of the whole window is cached per user version, queries on fewer dates slice it
+            bits = self._cache.get_or_compute(self._cache_key('bitmap', [user.get_user_id()]),
+                                              lambda: self._user_bitmap(user))
+            if bits is None:
+                metrics.increment('calendly_bitmap_fallbacks_total',
+                                  'Queries answered by the exact sweep in bitmap mode')
+                return None
+            bitmaps.append(bits >> shift & mask)
+        return bitmaps
+
+    def _user_bitmap(self, user):
+        day_bitmaps = [interval_bitmap(self._intervals_on(user, date), self._bitmap_granularity)
+                       for date in get_booking_window()]
+        return None if None in day_bitmaps else window_bitmap(day_bitmaps, self._bitmap_granularity)
+
+    def _utc_timeline(self, user) -> list:
+        # converted once per user version, queries across timezones then only compare epoch minutes
+        return self._cache.get_or_compute(
+            self._cache_key('utc', [user.get_user_id()]),
+            lambda: utc_timeline(lambda date: self._intervals_on(user, date), window_offset_table(user.get_timezone())))
+
+    @staticmethod
+    def _mixed_timezones(users, timezone) -> bool:
+        """
+        :return: True if the users' local dates do not line up with each other or with the requested timezone
+        """
+        return any(user.get_timezone() != timezone for user in users)
+
+    @staticmethod
+    def _dates_between(start_date=None, end_date=None) -> list:
+        return [date for date in get_booking_window()
+                if (not start_date or date >= start_date) and (not end_date or date <= end_date)]
+
+    def _common_availability(self, users, start_date=None, end_date=None, min_duration=0, timezone=None) -> dict:
+        """
+        Common availability of users, on bitmaps in bitmap mode when every day is aligned, else by the exact sweep.
+        Users in different timezones are intersected on UTC timelines.
+        """
+        timezone = validate_timezone(timezone) if timezone else users[0].get_timezone()
+        if self._mixed_timezones(users, timezone):
+            return common_utc_availability([self._utc_timeline(user) for user in users],
+                                           window_offset_table(timezone), start_date, end_date, min_duration)
+        if self._bitmap_granularity:
+            dates = self._dates_between(start_date, end_date)
+            bitmaps = self._window_bitmaps(users, dates)
+            if bitmaps is not None:
+                return common_bitmap_availability(bitmaps, dates, self._bitmap_granularity, min_duration)
+        return common_availability(self._interval_lists_on(users), start_date, end_date, min_duration)
+
+    def _iter_slots(self, users, duration, granularity, start_date=None, end_date=None, timezone=None):
+        """
+        Free slots common to users, on bitmaps in bitmap mode when every day and the slot starts are aligned,
+        else by the exact sweep. Users in different timezones are intersected on UTC timelines.
+        """
+        timezone = validate_timezone(timezone) if timezone else users[0].get_timezone()
+        if self._mixed_timezones(users, timezone):
+            return iter_utc_slots([self._utc_timeline(user) for user in users], window_offset_table(timezone),
+                                  duration, granularity, start_date, end_date,
+                                  [window_offset_table(zone) for zone in {user.get_timezone() for user in users}])
+        if self._bitmap_granularity and granularity % self._bitmap_granularity == 0:
+            dates = self._dates_between(start_date, end_date)
+            bitmaps = self._window_bitmaps(users, dates)
+            if bitmaps is not None:
+                return iter_bitmap_slots(bitmaps, dates, self._bitmap_granularity, duration, granularity,
+                                         local_now(window_offset_table(timezone)))
+        return iter_slots(self._interval_lists_on(users), duration, granularity, start_date, end_date,
+                          local_now(window_offset_table(timezone)))
+
+    @manager_timed(method='bulk_update_availability')
+    def bulk_update_availability(self, rows) -> list:
+        """
+        Merge availability rows for many users, committed in storage batches of BULK_CHUNK_SIZE rows. Invalid rows
+        are reported and skipped. When storage fails, the rows of the batches committed before stay merged.
+        :param rows: iterable of dicts with user_id, date and time_ranges
+        :return: list of per row results with either message or error
+        """
+        results = []
+        rows = enumerate(rows)
+        for chunk in iter(lambda: list(islice(rows, BULK_CHUNK_SIZE)), []):
+            user_ids = set()
+            with self._bulk_batch(user_ids):
+                for index, row in chunk:
+                    try:
+                        user_id, date, time_ranges = validate_availability_row(row)
+                        user_ids.add(user_id)
+                        self.update_availability(user_id, [date], [time_ranges])
+                        results.append({'row': index, 'message': 'Availability updated successfully'})
+                    except (ValueError, UserNotFoundException, DateOutOfBoundException) as e:
+                        results.append({'row': index, 'error': str(e)})
+        return results
+
+    @manager_timed(method='get_availability')
     def get_availability(self, user_id) -> dict:
         """
         Get Availability based on user id
         :param user_id: User id
         :return: dict of availability for a user
         """
-        if user_id not in self.users:
-            raise UserNotFoundException(f"User {user_id} not found")
-        user = self.users[user_id]
+        user = self.get_user(user_id)
+        return self._cache.get_or_compute(self._cache_key('availability', [user_id]),
+                                          lambda: self._build_availability(user))
+
+    def _build_availability(self, user) -> dict:
         availability = {}
-        for date, avail_obj in user.get_availability().items():
-            availability[date] = avail_obj.get_time_list()
+        for date in get_booking_window():
+            availability[date] = to_time_list(self._intervals_on(user, date))
         return availability
 
-    def get_overlapping_availability(self, user_id1, user_id2) -> dict:
+    @manager_timed(method='get_overlapping_availability')
+    def get_overlapping_availability(self, user_id1, user_id2, timezone=None) -> dict:
         """
         Get Overlapping intervals between 2 users
         :param user_id1: user id of first user
         :param user_id2: user id of second user
+        :param timezone: timezone to report the dates and times in, defaults to the first user's
         :return: dict of overlapping availability
         """
-        if user_id1 in self.users and user_id2 in self.users:
-            user1 = self.users[user_id1]
-            user2 = self.users[user_id2]
-            overlapping_availability = {}
-            for date in set(user1.get_availability().keys()) & set(user2.get_availability().keys()):
-                ranges1 = user1.get_availability().get(date).get_time_list()
-                ranges2 = user2.get_availability().get(date).get_time_list()
-                overlapping_ranges = find_overlapping_ranges(ranges1, ranges2)
-                if overlapping_ranges:
-                    overlapping_availability[date] = overlapping_ranges
-            return overlapping_availability
-        else:
+        try:
+            users = [self.get_user(user_id1), self.get_user(user_id2)]
+        except UserNotFoundException:
             raise UserNotFoundException(f"Either User {user_id1} or User {user_id2} not found")
+        return self._cache.get_or_compute(self._cache_key(('overlap', timezone), [user_id1, user_id2]),
+                                          lambda: self._common_availability(users, timezone=timezone))
+
+    @manager_timed(method='get_group_availability')
+    def get_group_availability(self, user_ids, start_date=None, end_date=None, min_duration=0,
+                               timezone=None) -> dict:
+        """
+        Get common availability of a group of users
+        :param user_ids: list of user ids
+        :param start_date: first date to consider in YYYY-MM-DD format, defaults to no lower bound
+        :param end_date: last date to consider in YYYY-MM-DD format, defaults to no upper bound
+        :param min_duration: minimum length in minutes of a returned slot
+        :param timezone: timezone to report the dates and times in, defaults to the first user's
+        :return: dict of common availability
+        """
+        users = self._get_users(user_ids)
+        user_ids = [user.get_user_id() for user in users]
+        return self._cache.get_or_compute(
+            self._cache_key(('group', start_date, end_date, min_duration, timezone), user_ids),
+            lambda: self._common_availability(users, start_date, end_date, min_duration, timezone))
+
+    def _get_users(self, user_ids) -> list:
+        """
+        :param user_ids: list of user ids, duplicates are ignored
+        :return: list of User objects
+        """
+        if not user_ids:
+            raise ValueError("user_ids should contain at least one user")
+        users, missing_ids = [], []
+        for user_id in dict.fromkeys(user_ids):
+            try:
+                users.append(self.get_user(user_id))
+            except UserNotFoundException:
+                missing_ids.append(user_id)
+        if missing_ids:
+            raise UserNotFoundException(f"Users {missing_ids} not found")
+        return users
+
+    @manager_timed(method='find_slots')
+    def find_slots(self, user_ids, duration, granularity=15, start_date=None, end_date=None, limit=10,
+                   timezone=None) -> list:
+        """
+        Find the first free slots of a given length common to all users, earliest first
+        :param user_ids: list of user ids
+        :param duration: slot length in minutes
+        :param granularity: slots start on multiples of this many minutes
+        :param start_date: first date to search in YYYY-MM-DD format, defaults to today
+        :param end_date: last date to search in YYYY-MM-DD format, defaults to the end of the booking window
+        :param limit: maximum number of slots to return
+        :param timezone: timezone to search and report the slots in, defaults to the first user's
+        :return: list of dicts with date, start_time and end_time
+        """
+        if duration <= 0 or granularity <= 0 or limit <= 0:
+            raise ValueError("duration, granularity and limit should be positive")
+        users = self._get_users(user_ids)
+        slots = islice(self._iter_slots(users, duration, granularity, start_date, end_date, timezone), limit)
+        return [to_slot(date, start, duration) for date, start in slots]
 
-    def book_meeting(self, user_id, date, start_time, end_time, requestor_id):
+    @manager_timed(method='book_meeting')
+    def book_meeting(self, user_id, date, start_time, end_time, requestor_id, timezone=None):
         """
         Book a meeting for a user on a specific date and time range
         :param requestor_id: id of requestor
         :param user_id: User ID
         :param date: Date in YYYY-MM-DD format
-        :param start_time: Start time in HH:MM format
-        :param end_time: End time in HH:MM format
+        :param start_time: Start time in HH:MM format or minutes since midnight
+        :param end_time: End time in HH:MM format or minutes since midnight
+        :param timezone: timezone of date and times, defaults to the user's
         :return: Booking status message
         """
-        if user_id not in self.users:
-            raise UserNotFoundException(f"User {user_id} not found")
+        requestor = self.get_user(requestor_id)
+        return self._book_meeting(user_id, date, start_time, end_time, requestor_id,
+                                  (requestor.get_name(), requestor.get_phone()), timezone)
 
-        user = self.users[user_id]
-        availability_dict = user.get_availability()
+    @retry_stale
+    def _book_meeting(self, user_id, date, start_time, end_time, requestor_id, requestor, timezone=None):
+        """
+        book_meeting with the requestor's (name, phone) given by the caller, e.g. by the shard router when the
+        requestor lives on another shard
+        """
+        user = self.get_user(user_id)
+        start = start_time if isinstance(start_time, int) else time_to_minutes(start_time)
+        end = end_time if isinstance(end_time, int) else time_to_minutes(end_time)
+        date, start, end = self._to_user_time(user, date, start, end, timezone)
+        end = self._single_date_end(start, end)
 
-        if date not in availability_dict:
+        if not is_in_booking_window(date):
             raise DateOutOfBoundException(f"Date {date} is more than one month from now")
 
-        time_range = {'start_time': start_time, 'end_time': end_time}
-        existing_ranges = availability_dict[date].get_time_list()
-        updated_ranges = []
-
-        for existing_range in existing_ranges:
-            if existing_range['start_time'] <= start_time and existing_range['end_time'] >= end_time:
-                # The requested time range is within an available time slot
-                for existing_range in existing_ranges:
-                    # Check if the existing range overlaps with the booked range
-                    if existing_range['start_time'] >= end_time or existing_range['end_time'] <= start_time:
-                        updated_ranges.append(existing_range)
-                    else:
-                        if existing_range['start_time'] < start_time:
-                            updated_ranges.append({'start_time': existing_range['start_time'], 'end_time': start_time})
-
-                        if existing_range['end_time'] > end_time:
-                            updated_ranges.append({'start_time': end_time, 'end_time': existing_range['end_time']})
-
-                # The requested time range is available, proceed with booking
-                user.availability[date].time_list = updated_ranges
-                booked_meetings = user.get_booked_meetings()
-                if date not in booked_meetings:
-                    booked_meetings[date] = []
-                booking = Booking(date, [time_range], requestor_id)
-                booked_meetings[date].append(booking)
-                user.book_meeting(booked_meetings)
-                return {'message': 'Booking successful'}
-        else:
-            # The requested time range is not within any available time slot
-            raise SlotNotAvailableException(f"The requested time slot {start_time} to {end_time} is not available")
+        start_time, end_time = minutes_to_time(start), minutes_to_time(end)
+        with self._locks.hold((user_id, date)):
+            availability = self._materialize(user, date)
+            intervals = availability.get_intervals()
+            booked_meetings = user.get_booked_meetings()
+            if not intervals.contains(start, end) or booked_meetings.conflicts(date, start, end):
+                # The requested time range is not within any available time slot
+                raise SlotNotAvailableException(f"The requested time slot {start_time} to {end_time} is not available")
 
-    def get_meetings(self, user_id):
+            # The requested time range is available, swap in the availability without it and record the booking.
+            # Readers never see a half updated interval list since the new one is built on a copy.
+            updated_intervals = intervals.copy()
+            updated_intervals.remove(start, end)
+            booking = Booking(user_id, date, start, end, requestor_id, requestor=requestor)
+            self._write(user_id, lambda expected: self._storage.save_booking(
+                user_id, booking, updated_intervals, expected_version=expected))
+            availability.set_intervals(updated_intervals)
+            self._install(user, availability)
+            user.book_meeting(booking)
+            self._requested_index(requestor_id).add(booking)
+            # update_user changes the profile before walking the reverse index, so a booking indexed too late
+            # for that walk sees the new profile here
+            current = self.users.get(requestor_id)
+            if current is not None and (current.get_name(), current.get_phone()) != requestor:
+                booking.set_requestor((current.get_name(), current.get_phone()))
+        self._invalidate(user_id)
+        self._invalidate(requestor_id)
+        return {'message': 'Booking successful', 'booking_id': booking.get_booking_id()}
+
+    @staticmethod
+    def _to_user_time(user, date, start, end, timezone):
+        """
+        Convert a time range given in another timezone to the user's local date and minutes
+        :return: tuple of (date, start, end), end is past 1440 when the range crosses the user's midnight
+        """
+        if timezone is None or timezone == user.get_timezone():
+            return date, start, end
+        timezone = validate_timezone(timezone)
+        # a range ending before it starts runs past midnight, 00:00 to 24:00 is the full day
+        duration = end - start if end >= start else end - start + MINUTES_PER_DAY
+        epoch_minute = window_offset_table(timezone).to_utc(date, start)
+        date, start = window_offset_table(user.get_timezone()).to_local(epoch_minute)
+        return date, start, start + duration
+
+    @staticmethod
+    def _single_date_end(start, end) -> int:
+        """
+        A booking lives on one of the user's dates, like the availability it is taken from
+        :param start: start minute in the user's time
+        :param end: end minute in the user's time, past 1440 or before start when the range crosses midnight
+        :return: end minute, an end at midnight given as 00:00 becomes 1440
+        """
+        if end == 0 < start:
+            return MINUTES_PER_DAY
+        if end < start or end > MINUTES_PER_DAY:
+            raise SlotNotAvailableException(
+                f"The requested time slot {minutes_to_time(start)} to {minutes_to_time(end % MINUTES_PER_DAY)} "
+                f"runs past midnight in the user's timezone, book the part on each date separately")
+        return end
+
+    @staticmethod
+    def _materialize(user, date) -> Availability:
+        """
+        Availability of a user on a date. On a date covered only by the recurrence rules it is a new one expanded
+        from them and not yet part of the user, pass it to _install once the write to storage succeeded, so a
+        failed write leaves the date following the rules. Call with the (user, date) lock held.
+        """
+        availability = user.get_availability().get(date)
+        if availability is None:
+            availability = Availability(date, user.get_recurrence().expand(date).copy())
+        return availability
+
+    @staticmethod
+    def _install(user, availability):
+        """
+        Make an availability returned by _materialize the explicit availability of its date.
+        Call with the (user, date) lock held.
+        """
+        user.get_availability()[availability.get_date()] = availability
+
+    def _get_booking(self, user, booking_id) -> Booking:
+        booking = user.get_booked_meetings().get_by_id(booking_id)
+        if booking is None:
+            raise BookingNotFoundException(f"Booking {booking_id} not found for user {user.get_user_id()}")
+        if not is_in_booking_window(booking.get_date()):
+            raise DateOutOfBoundException(f"Booking {booking_id} on {booking.get_date()} is outside the booking window")
+        return booking
+
+    @manager_timed(method='cancel_meeting')
+    @retry_stale
+    def cancel_meeting(self, user_id, booking_id) -> dict:
+        """
+        Cancel a booking and give its time range back to the user's availability
+        :param user_id: User ID of the user the meeting was booked with
+        :param booking_id: id returned by book_meeting
+        :return: Cancellation status message
+        """
+        user = self.get_user(user_id)
+        booking = self._get_booking(user, booking_id)
+        date = booking.get_date()
+        with self._locks.hold((user_id, date)):
+            # another cancel or reschedule may have won the race for the lock
+            if user.get_booked_meetings().get_by_id(booking_id) is not booking:
+                raise BookingNotFoundException(f"Booking {booking_id} not found for user {user_id}")
+            availability = self._materialize(user, date)
+            updated_intervals = availability.get_intervals().copy()
+            updated_intervals.add(booking.get_start(), booking.get_end())
+            self._write(user_id, lambda expected: self._storage.delete_booking(
+                user_id, booking, updated_intervals, expected_version=expected))
+            availability.set_intervals(updated_intervals)
+            self._install(user, availability)
+            user.cancel_meeting(booking)
+            self._requested_index(booking.get_requestor_id()).remove(booking)
+        self._invalidate(user_id)
+        self._invalidate(booking.get_requestor_id())
+        return {'message': 'Booking cancelled'}
+
+    @manager_timed(method='reschedule_meeting')
+    @retry_stale
+    def reschedule_meeting(self, user_id, booking_id, date, start_time, end_time, timezone=None) -> dict:
+        """
+        Move a booking to another time range, atomically: either the booking moves or nothing changes
+        :param user_id: User ID of the user the meeting was booked with
+        :param booking_id: id returned by book_meeting
+        :param date: new date in YYYY-MM-DD format
+        :param start_time: new start time in HH:MM format or minutes since midnight
+        :param end_time: new end time in HH:MM format or minutes since midnight
+        :param timezone: timezone of date and times, defaults to the user's
+        :return: Reschedule status message
+        """
+        user = self.get_user(user_id)
+        booking = self._get_booking(user, booking_id)
+        start = start_time if isinstance(start_time, int) else time_to_minutes(start_time)
+        end = end_time if isinstance(end_time, int) else time_to_minutes(end_time)
+        date, start, end = self._to_user_time(user, date, start, end, timezone)
+        end = self._single_date_end(start, end)
+        if not is_in_booking_window(date):
+            raise DateOutOfBoundException(f"Date {date} is more than one month from now")
+
+        old_date = booking.get_date()
+        with self._locks.hold((user_id, old_date), (user_id, date)):
+            booked_meetings = user.get_booked_meetings()
+            if booked_meetings.get_by_id(booking_id) is not booking:
+                raise BookingNotFoundException(f"Booking {booking_id} not found for user {user_id}")
+            availabilities = {day: self._materialize(user, day) for day in (old_date, date)}
+            # the old range is given back first so the new one may overlap it, all on copies
+            updated = {day: availability.get_intervals().copy() for day, availability in availabilities.items()}
+            updated[old_date].add(booking.get_start(), booking.get_end())
+            if not updated[date].contains(start, end) or booked_meetings.conflicts(date, start, end, ignore=booking):
+                raise SlotNotAvailableException(
+                    f"The requested time slot {minutes_to_time(start)} to {minutes_to_time(end)} is not available")
+            updated[date].remove(start, end)
+            new_booking = Booking(user_id, date, start, end, booking.get_requestor_id(), booking_id,
+                                  booking.get_requestor())
+            self._write(user_id, lambda expected: self._storage.move_booking(
+                user_id, booking, new_booking, updated, expected_version=expected))
+            for day, availability in availabilities.items():
+                availability.set_intervals(updated[day])
+                self._install(user, availability)
+            user.cancel_meeting(booking)
+            user.book_meeting(new_booking)
+            requested = self._requested_index(booking.get_requestor_id())
+            requested.remove(booking)
+            requested.add(new_booking)
+        self._invalidate(user_id)
+        self._invalidate(booking.get_requestor_id())
+        return {'message': 'Booking rescheduled', 'booking_id': booking_id}
+
+    @manager_timed(method='get_meetings')
+    def get_meetings(self, user_id, start_date=None, end_date=None, requested=False):
         """
         Get the booked meetings for a user
         :param user_id: User ID
+        :param start_date: first date in YYYY-MM-DD format, inclusive, defaults to no lower bound
+        :param end_date: last date in YYYY-MM-DD format, inclusive, defaults to no upper bound
+        :param requested: return the meetings the user requested on other calendars instead of their own bookings
         :return: Dictionary of booked meetings
         """
-        if user_id not in self.users:
-            raise UserNotFoundException(f"User {user_id} not found")
+        user = self.get_user(user_id)
+        if requested:
+            host_ids = self._load_hosts(user_id)
+            return self._cache.get_or_compute(
+                self._cache_key(('requested', start_date, end_date), [user_id] + host_ids),
+                lambda: self._build_requested_meetings(user_id, start_date, end_date))
+        return self._cache.get_or_compute(self._cache_key(('meetings', start_date, end_date), [user_id]),
+                                          lambda: self._build_meetings(user, start_date, end_date))
+
+    def _load_hosts(self, requestor_id) -> list:
+        # other workers may hold bookings made by this user on calendars not loaded here yet
+        host_ids = sorted(set(self._storage.get_requested_user_ids(requestor_id)))
+        for host_id in host_ids:
+            self.get_user(host_id)
+        return host_ids
+
+    @manager_timed(method='get_meetings_page')
+    def get_meetings_page(self, user_id, start_date=None, end_date=None, requested=False, cursor=None,
+                          limit=100) -> tuple:
+        """
+        One page of the booked meetings of a user, in date and start time order. A page costs a binary search to
+        the cursor plus the meetings on it, however many meetings the user has.
+        :param user_id: User ID
+        :param start_date: first date in YYYY-MM-DD format, inclusive, defaults to no lower bound
+        :param end_date: last date in YYYY-MM-DD format, inclusive, defaults to no upper bound
+        :param requested: page through the meetings the user requested on other calendars instead
+        :param cursor: cursor returned with the previous page, None for the first page
+        :param limit: maximum number of meetings on the page
+        :return: tuple of (dict of date to meetings like get_meetings, cursor of the next page or None)
+        """
+        if limit <= 0:
+            raise ValueError("limit should be positive")
+        user = self.get_user(user_id)
+        after = decode_cursor(cursor) if cursor else None
+        if requested:
+            self._load_hosts(user_id)
+            index, build = self._requested_index(user_id), self._requested_meeting
+        else:
+            index, build = user.get_booked_meetings(), self._meeting
+        bookings = list(islice(index.iter_after(after, start_date, end_date), limit + 1))
+        page = {}
+        for booking in bookings[:limit]:
+            page.setdefault(booking.get_date(), []).append(build(booking))
+        return page, encode_cursor(booking_position(bookings[limit - 1])) if len(bookings) > limit else None
+
+    def export_user(self, user_id):
+        """
+        Profile, availability and bookings of a user as a stream of records, e.g. for an NDJSON export. Bookings
+        are read from the index as the stream is consumed, so memory does not grow with the user's history.
+        :param user_id: User ID
+        :return: iterator of dicts, each with a type of user, availability or booking
+        """
+        user = self.get_user(user_id)
+        yield {'type': 'user', 'user_id': user_id, 'user_name': user.get_name(), 'phone_number': user.get_phone(),
+               'timezone': user.get_timezone()}
+        for date in get_booking_window():
+            yield {'type': 'availability', 'date': date, 'time_list': to_time_list(self._intervals_on(user, date))}
+        for booking in user.get_booked_meetings().iter_after():
+            yield dict(self._meeting(booking), type='booking', date=booking.get_date())
+
+    def _meeting(self, booking) -> dict:
+        requestor_name, requestor_phone = booking.get_requestor() or self._requestor_of(booking)
+        return {
+            'booking_id': booking.get_booking_id(),
+            'time_list': booking.get_time_list(),
+            'requestor_id': booking.get_requestor_id(),
+            'requestor_name': requestor_name,
+            'requestor_phone': requestor_phone
+        }
+
+    def _requestor_of(self, booking) -> tuple:
+        # bookings stored before the requestor snapshot was recorded
+        requestor = self.get_user(booking.get_requestor_id())
+        return requestor.get_name(), requestor.get_phone()
+
+    def _requested_meeting(self, booking) -> dict:
+        host = self.get_user(booking.get_user_id())
+        return {
+            'booking_id': booking.get_booking_id(),
+            'time_list': booking.get_time_list(),
+            'user_id': booking.get_user_id(),
+            'user_name': host.get_name(),
+            'user_phone': host.get_phone()
+        }
+
+    def _build_meetings(self, user, start_date=None, end_date=None) -> dict:
+        return {date: [self._meeting(booking) for booking in bookings]
+                for date, bookings in user.get_booked_meetings().between(start_date, end_date)}
 
-        user = self.users[user_id]
-        booked_meetings = {}
-        for date, bookings in user.get_booked_meetings().items():
-            booked_meetings[date] = [
-                {
-                    'time_list': booking.get_time_list(),
-                    'requestor_id': booking.get_requestor_id(),
-                    'requestor_name': self.users[booking.get_requestor_id()].get_name(),
-                    'requestor_phone': self.users[booking.get_requestor_id()].get_phone()
-
-                }
-                for booking in bookings
-            ]
-        return booked_meetings
\ No newline at end of file
+    def _build_requested_meetings(self, requestor_id, start_date=None, end_date=None) -> dict:
+        return {date: [self._requested_meeting(booking) for booking in bookings]
+                for date, bookings in self._requested_index(requestor_id).between(start_date, end_date)}
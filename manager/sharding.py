@@ -0,0 +1,518 @@
+import heapq
+import multiprocessing
+import os
+import threading
+from itertools import islice
+
+from manager.calendly_manager import UserManager
+from models.booking_index import booking_position
+from models.interval_model import minutes_to_time
+from models.timezone_model import DEFAULT_TIMEZONE
+from models.user_model import User
+from storage.journal_storage import JournalStorage
+from storage.memory_storage import InMemoryStorage
+from utils.concurrency import IdAllocator
+from utils.exceptions import UserNotFoundException
+from utils.helper_functions import get_booking_window, common_availability, iter_slots, validate_timezone, \
+    window_offset_table, utc_timeline, common_utc_availability, iter_utc_slots, to_slot, encode_cursor, \
+    decode_cursor, local_now
+
+# meetings fetched per round trip while exporting a user
+EXPORT_PAGE_SIZE = 500
+
+
+def shard_of(user_id, shard_count) -> int:
+    """
+    Shard k allocates the ids k + 1, k + 1 + shard_count, ... so the owner of a user follows from its id
+    :param user_id: User id
+    :param shard_count: number of shards
+    :return: index of the owning shard
+    """
+    return (user_id - 1) % shard_count
+
+
+class ShardWorker:
+    """
+    Runs in a shard process. Public UserManager methods are forwarded, the methods below export raw data for
+    operations the router combines across shards.
+    """
+    def __init__(self, user_manager):
+        self.user_manager = user_manager
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user_manager, name)
+
+    def profiles(self, user_ids) -> dict:
+        """
+        :param user_ids: list of user ids owned by this shard
+        :return: dict of user id to (name, phone, timezone) of the users that exist
+        """
+        profiles = {}
+        for user_id in user_ids:
+            try:
+                user = self.user_manager.get_user(user_id)
+                profiles[user_id] = (user.get_name(), user.get_phone(), user.get_timezone())
+            except UserNotFoundException:
+                pass
+        return profiles
+
+    def intervals(self, user_ids) -> tuple:
+        """
+        :param user_ids: list of user ids owned by this shard
+        :return: tuple of (dict of user id to (timezone, dict of date to (start, end) pairs over the booking
+            window), list of ids not found)
+        """
+        intervals, missing_ids = {}, []
+        for user_id in user_ids:
+            try:
+                user = self.user_manager.get_user(user_id)
+            except UserNotFoundException:
+                missing_ids.append(user_id)
+                continue
+            intervals[user_id] = (user.get_timezone(), {date: self.user_manager._intervals_on(user, date).pairs()
+                                                        for date in get_booking_window()})
+        return intervals, missing_ids
+
+    def book_meeting(self, user_id, date, start_time, end_time, requestor_id, requestor, timezone=None):
+        """
+        :param requestor: (name, phone) of the requestor, looked up by the router on the requestor's shard
+        """
+        return self.user_manager._book_meeting(user_id, date, start_time, end_time, requestor_id, requestor,
+                                               timezone)
+
+    def refresh_requestor(self, requestor_id, requestor):
+        """
+        Refresh the requestor snapshot on the bookings the requestor made on calendars of this shard
+        """
+        self.user_manager._refresh_requestor(requestor_id, requestor)
+
+    def meetings(self, user_id, start_date=None, end_date=None) -> list:
+        """
+        :return: list of (date, list of (booking_id, start, end, requestor_id, requestor)) of the user's bookings,
+            requestor is the (name, phone) snapshot or None
+        """
+        return [(date, [(booking.get_booking_id(), booking.get_start(), booking.get_end(), booking.get_requestor_id(),
+                         booking.get_requestor())
+                        for booking in bookings])
+                for date, bookings in self.user_manager.get_user(user_id).get_booked_meetings()
+                .between(start_date, end_date)]
+
+    def requested_meetings(self, requestor_id, start_date=None, end_date=None) -> dict:
+        """
+        :return: the meetings the requestor made on calendars of this shard, by date
+        """
+        return self.user_manager._build_requested_meetings(requestor_id, start_date, end_date)
+
+    def meetings_page(self, user_id, start_date=None, end_date=None, after=None, limit=100) -> list:
+        """
+        :return: list of up to limit + 1 (booking_position, booking_id, start, end, requestor_id, requestor) of the
+            user's bookings after the position
+        """
+        bookings = self.user_manager.get_user(user_id).get_booked_meetings().iter_after(after, start_date, end_date)
+        return [(booking_position(booking), booking.get_booking_id(), booking.get_start(), booking.get_end(),
+                 booking.get_requestor_id(), booking.get_requestor())
+                for booking in islice(bookings, limit + 1)]
+
+    def requested_meetings_page(self, requestor_id, start_date=None, end_date=None, after=None, limit=100) -> list:
+        """
+        :return: list of up to limit + 1 (booking_position, meeting) the requestor made on calendars of this
+            shard after the position
+        """
+        self.user_manager._load_hosts(requestor_id)
+        bookings = self.user_manager._requested_index(requestor_id).iter_after(after, start_date, end_date)
+        return [(booking_position(booking), self.user_manager._requested_meeting(booking))
+                for booking in islice(bookings, limit + 1)]
+
+
+def _serve(connection, shard_index, shard_count, journal_dir, cache_size, bitmap_granularity):
+    """
+    Shard process main loop, executes (method, args, kwargs) requests one at a time
+    """
+    if journal_dir:
+        storage = JournalStorage(os.path.join(journal_dir, f"shard-{shard_index}"), first_id=shard_index + 1,
+                                 id_step=shard_count)
+    else:
+        storage = InMemoryStorage(first_id=shard_index + 1, id_step=shard_count)
+    worker = ShardWorker(UserManager(storage, cache_size=cache_size, bitmap_granularity=bitmap_granularity))
+    try:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            method, args, kwargs = request
+            try:
+                connection.send((True, getattr(worker, method)(*args, **kwargs)))
+            except Exception as e:
+                connection.send((False, e))
+    finally:
+        storage.close()
+
+
+class ShardedUserManager:
+    """
+    Same interface as UserManager, with users partitioned by user id across worker processes so requests on
+    different users run on different cores. Single user calls are forwarded to the owning shard. Calls on
+    several users are forwarded whole when one shard owns them all, otherwise the router fetches each user's
+    availability from its shard and intersects it itself.
+
+    Each shard handles one request at a time, the router serializes the calls per shard.
+    """
+
+    def __init__(self, shard_count, journal_dir=None, cache_size=1024, bitmap_granularity=None):
+        """
+        :param shard_count: number of worker processes
+        :param journal_dir: optional directory, each shard journals to its own subdirectory of it
+        :param cache_size: result cache size of each shard
+        :param bitmap_granularity: bitmap mode of each shard, see UserManager
+        """
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods()
+                                              else 'spawn')
+        self.shard_count = shard_count
+        self._connections = []
+        self._locks = []
+        self._processes = []
+        for shard_index in range(shard_count):
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve, name=f"calendly-shard-{shard_index}", daemon=True,
+                                      args=(child, shard_index, shard_count, journal_dir, cache_size,
+                                            bitmap_granularity))
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._locks.append(threading.Lock())
+            self._processes.append(process)
+        # new users are spread round robin over the shards
+        self._next_shard = IdAllocator(0)
+
+    def _call(self, shard_index, method, *args, **kwargs):
+        with self._locks[shard_index]:
+            self._connections[shard_index].send((method, args, kwargs))
+            ok, result = self._connections[shard_index].recv()
+        if not ok:
+            raise result
+        return result
+
+    def _scatter(self, requests) -> dict:
+        """
+        Send requests to several shards before waiting for any answer, so the shards work in parallel
+        :param requests: dict of shard index to (method, args)
+        :return: dict of shard index to result
+        """
+        shard_indexes = sorted(requests)
+        # locks are always taken in shard order, so concurrent scatters can not deadlock
+        for shard_index in shard_indexes:
+            self._locks[shard_index].acquire()
+        try:
+            for shard_index in shard_indexes:
+                method, args = requests[shard_index]
+                self._connections[shard_index].send((method, args, {}))
+            answers = {shard_index: self._connections[shard_index].recv() for shard_index in shard_indexes}
+        finally:
+            for shard_index in shard_indexes:
+                self._locks[shard_index].release()
+        for ok, result in answers.values():
+            if not ok:
+                raise result
+        return {shard_index: result for shard_index, (_, result) in answers.items()}
+
+    def _owner(self, user_id) -> int:
+        if not isinstance(user_id, int) or user_id < 1:
+            raise UserNotFoundException(f"User {user_id} not found")
+        return shard_of(user_id, self.shard_count)
+
+    def _group(self, user_ids) -> dict:
+        """
+        :param user_ids: list of user ids, duplicates are ignored
+        :return: dict of shard index to the ids it owns
+        """
+        if not user_ids:
+            raise ValueError("user_ids should contain at least one user")
+        shards = {}
+        for user_id in dict.fromkeys(user_ids):
+            shards.setdefault(self._owner(user_id), []).append(user_id)
+        return shards
+
+    def _fetch_intervals(self, user_ids) -> list:
+        """
+        Fetch the availability of users owned by several shards
+        :return: list of (timezone, dict of date to (start, end) pairs), one per user
+        """
+        answers = self._scatter({shard_index: ('intervals', (ids,))
+                                 for shard_index, ids in self._group(user_ids).items()})
+        intervals, missing_ids = {}, []
+        for shard_intervals, shard_missing_ids in answers.values():
+            intervals.update(shard_intervals)
+            missing_ids.extend(shard_missing_ids)
+        if missing_ids:
+            raise UserNotFoundException(f"Users {sorted(missing_ids)} not found")
+        return [intervals[user_id] for user_id in dict.fromkeys(user_ids)]
+
+    @staticmethod
+    def _zoned(intervals, timezone):
+        """
+        :param intervals: list of (timezone, dict of date to pairs), see _fetch_intervals
+        :param timezone: timezone requested by the caller, None for the first user's
+        :return: tuple of (timezone to report in, UTC timelines if the users' local dates do not line up with it
+            else None)
+        """
+        timezone = validate_timezone(timezone) if timezone else intervals[0][0]
+        if all(user_timezone == timezone for user_timezone, _ in intervals):
+            return timezone, None
+        return timezone, [utc_timeline(lambda date, dates=dates: dates.get(date, ()), window_offset_table(zone))
+                          for zone, dates in intervals]
+
+    def _common_availability(self, user_ids, start_date=None, end_date=None, min_duration=0, timezone=None):
+        intervals = self._fetch_intervals(user_ids)
+        timezone, timelines = self._zoned(intervals, timezone)
+        if timelines is not None:
+            return common_utc_availability(timelines, window_offset_table(timezone), start_date, end_date,
+                                           min_duration)
+        return common_availability(lambda date: [dates.get(date, ()) for _, dates in intervals], start_date,
+                                   end_date, min_duration)
+
+    def _iter_slots(self, user_ids, duration, granularity, start_date=None, end_date=None, timezone=None):
+        intervals = self._fetch_intervals(user_ids)
+        timezone, timelines = self._zoned(intervals, timezone)
+        if timelines is not None:
+            return iter_utc_slots(timelines, window_offset_table(timezone), duration, granularity, start_date,
+                                  end_date, [window_offset_table(zone) for zone in {zone for zone, _ in intervals}])
+        return iter_slots(lambda date: [dates.get(date, ()) for _, dates in intervals], duration, granularity,
+                          start_date, end_date, local_now(window_offset_table(timezone)))
+
+    def _profiles(self, user_ids) -> dict:
+        answers = self._scatter({shard_index: ('profiles', (ids,))
+                                 for shard_index, ids in self._group(user_ids).items()})
+        return {user_id: profile for profiles in answers.values() for user_id, profile in profiles.items()}
+
+    def add_user(self, user_name, phone, timezone=DEFAULT_TIMEZONE) -> int:
+        return self._call(self._next_shard.next_id() % self.shard_count, 'add_user', user_name, phone, timezone)
+
+    def add_users(self, rows) -> list:
+        """
+        Spread the rows over the shards, each shard imports its part in a single batch
+        """
+        parts = {}
+        for index, row in enumerate(rows):
+            parts.setdefault(self._next_shard.next_id() % self.shard_count, []).append((index, row))
+        answers = self._scatter({shard_index: ('add_users', ([row for _, row in part],))
+                                 for shard_index, part in parts.items()})
+        results = []
+        for shard_index, part in parts.items():
+            for (index, _), result in zip(part, answers[shard_index]):
+                results.append(dict(result, row=index))
+        return sorted(results, key=lambda result: result['row'])
+
+    def update_user(self, user_id, user_name=None, phone=None) -> dict:
+        """
+        The profile changes on the user's shard, the bookings the user requested may be on any shard
+        """
+        owner = self._owner(user_id)
+        result = self._call(owner, 'update_user', user_id, user_name, phone)
+        user_name, phone, _ = self._call(owner, 'profiles', [user_id])[user_id]
+        self._scatter({shard_index: ('refresh_requestor', (user_id, (user_name, phone)))
+                       for shard_index in range(self.shard_count) if shard_index != owner})
+        return result
+
+    def get_user(self, user_id) -> User:
+        """
+        :return: User with the profile only, availability and bookings stay in the shard
+        """
+        profile = self._call(self._owner(user_id), 'profiles', [user_id]).get(user_id)
+        if profile is None:
+            raise UserNotFoundException(f"User {user_id} not found")
+        return User(user_id, *profile)
+
+    def update_availability(self, user_id, date_list, time_slots_list) -> dict:
+        return self._call(self._owner(user_id), 'update_availability', user_id, date_list, time_slots_list)
+
+    def add_recurring_availability(self, user_id, weekdays, time_ranges, start_date=None, end_date=None,
+                                   exceptions=(), replace=False) -> dict:
+        return self._call(self._owner(user_id), 'add_recurring_availability', user_id, list(weekdays),
+                          time_ranges, start_date, end_date, list(exceptions), replace)
+
+    def bulk_update_availability(self, rows) -> list:
+        """
+        Route every row to the shard of its user, rows without a valid user id are left to shard 0 to report
+        """
+        parts = {}
+        for index, row in enumerate(rows):
+            user_id = row.get('user_id') if isinstance(row, dict) else None
+            shard_index = shard_of(user_id, self.shard_count) if isinstance(user_id, int) and user_id > 0 else 0
+            parts.setdefault(shard_index, []).append((index, row))
+        answers = self._scatter({shard_index: ('bulk_update_availability', ([row for _, row in part],))
+                                 for shard_index, part in parts.items()})
+        results = []
+        for shard_index, part in parts.items():
+            for (index, _), result in zip(part, answers[shard_index]):
+                results.append(dict(result, row=index))
+        return sorted(results, key=lambda result: result['row'])
+
+    def get_availability(self, user_id) -> dict:
+        return self._call(self._owner(user_id), 'get_availability', user_id)
+
+    def get_overlapping_availability(self, user_id1, user_id2, timezone=None) -> dict:
+        try:
+            shards = self._group([user_id1, user_id2])
+            if len(shards) == 1:
+                return self._call(next(iter(shards)), 'get_overlapping_availability', user_id1, user_id2, timezone)
+            return self._common_availability([user_id1, user_id2], timezone=timezone)
+        except UserNotFoundException:
+            raise UserNotFoundException(f"Either User {user_id1} or User {user_id2} not found")
+
+    def get_group_availability(self, user_ids, start_date=None, end_date=None, min_duration=0,
+                               timezone=None) -> dict:
+        shards = self._group(user_ids)
+        if len(shards) == 1:
+            return self._call(next(iter(shards)), 'get_group_availability', user_ids, start_date, end_date,
+                              min_duration, timezone)
+        return self._common_availability(user_ids, start_date, end_date, min_duration, timezone)
+
+    def find_slots(self, user_ids, duration, granularity=15, start_date=None, end_date=None, limit=10,
+                   timezone=None) -> list:
+        if duration <= 0 or granularity <= 0 or limit <= 0:
+            raise ValueError("duration, granularity and limit should be positive")
+        shards = self._group(user_ids)
+        if len(shards) == 1:
+            return self._call(next(iter(shards)), 'find_slots', user_ids, duration, granularity, start_date,
+                              end_date, limit, timezone)
+        slots = []
+        for date, start in self._iter_slots(user_ids, duration, granularity, start_date, end_date, timezone):
+            slots.append(to_slot(date, start, duration))
+            if len(slots) == limit:
+                break
+        return slots
+
+    def book_meeting(self, user_id, date, start_time, end_time, requestor_id, timezone=None):
+        """
+        Only the calendar of user_id changes, so the booking runs entirely on its shard, with the requestor's
+        profile fetched from the requestor's shard first. The requestor's side is found by asking every shard in
+        get_meetings(requested=True).
+        """
+        requestor = self.get_user(requestor_id)
+        return self._call(self._owner(user_id), 'book_meeting', user_id, date, start_time, end_time, requestor_id,
+                          (requestor.get_name(), requestor.get_phone()), timezone)
+
+    def cancel_meeting(self, user_id, booking_id) -> dict:
+        return self._call(self._owner(user_id), 'cancel_meeting', user_id, booking_id)
+
+    def reschedule_meeting(self, user_id, booking_id, date, start_time, end_time, timezone=None) -> dict:
+        return self._call(self._owner(user_id), 'reschedule_meeting', user_id, booking_id, date, start_time, end_time,
+                          timezone)
+
+    def get_meetings(self, user_id, start_date=None, end_date=None, requested=False):
+        if self.shard_count == 1:
+            return self._call(0, 'get_meetings', user_id, start_date, end_date, requested)
+        if requested:
+            self.get_user(user_id)
+            answers = self._scatter({shard_index: ('requested_meetings', (user_id, start_date, end_date))
+                                     for shard_index in range(self.shard_count)})
+            merged = {}
+            for requested_meetings in answers.values():
+                for date, meetings in requested_meetings.items():
+                    merged.setdefault(date, []).extend(meetings)
+            return {date: sorted(merged[date], key=lambda meeting: (meeting['time_list'][0]['start_time'],
+                                                                   meeting['user_id']))
+                    for date in sorted(merged)}
+        meetings = self._call(self._owner(user_id), 'meetings', user_id, start_date, end_date)
+        profiles = self._missing_profiles(booking for _, bookings in meetings for booking in bookings)
+        booked_meetings = {}
+        for date, bookings in meetings:
+            booked_meetings[date] = [self._meeting(profiles, *booking) for booking in bookings]
+        return booked_meetings
+
+    def get_meetings_page(self, user_id, start_date=None, end_date=None, requested=False, cursor=None,
+                          limit=100) -> tuple:
+        """
+        Requested meetings are paged on every shard from the same cursor and merged in position order, each
+        shard returns at most one page so a page costs one round of calls whatever the total
+        """
+        if self.shard_count == 1:
+            return self._call(0, 'get_meetings_page', user_id, start_date, end_date, requested, cursor, limit)
+        if limit <= 0:
+            raise ValueError("limit should be positive")
+        after = decode_cursor(cursor) if cursor else None
+        page = {}
+        if requested:
+            self.get_user(user_id)
+            answers = self._scatter({shard_index: ('requested_meetings_page', (user_id, start_date, end_date,
+                                                                               after, limit))
+                                     for shard_index in range(self.shard_count)})
+            rows = list(islice(heapq.merge(*answers.values(), key=lambda row: row[0]), limit + 1))
+            for position, meeting in rows[:limit]:
+                page.setdefault(position[0], []).append(meeting)
+        else:
+            rows = self._call(self._owner(user_id), 'meetings_page', user_id, start_date, end_date, after, limit)
+            profiles = self._missing_profiles(row[1:] for row in rows[:limit])
+            for position, *booking in rows[:limit]:
+                page.setdefault(position[0], []).append(self._meeting(profiles, *booking))
+        return page, encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+
+    def export_user(self, user_id):
+        """
+        Same records as UserManager.export_user, bookings are fetched from the shard a page at a time
+        """
+        user = self.get_user(user_id)
+        yield {'type': 'user', 'user_id': user_id, 'user_name': user.get_name(), 'phone_number': user.get_phone(),
+               'timezone': user.get_timezone()}
+        for date, time_list in self.get_availability(user_id).items():
+            yield {'type': 'availability', 'date': date, 'time_list': time_list}
+        cursor = None
+        while True:
+            page, cursor = self.get_meetings_page(user_id, cursor=cursor, limit=EXPORT_PAGE_SIZE)
+            for date, meetings in page.items():
+                for meeting in meetings:
+                    yield dict(meeting, type='booking', date=date)
+            if cursor is None:
+                break
+
+    def _missing_profiles(self, bookings) -> dict:
+        """
+        :param bookings: iterable of (booking_id, start, end, requestor_id, requestor)
+        :return: profiles of the requestors of bookings stored without a requestor snapshot
+        """
+        requestor_ids = {requestor_id for _, _, _, requestor_id, requestor in bookings if requestor is None}
+        return self._profiles(list(requestor_ids)) if requestor_ids else {}
+
+    @staticmethod
+    def _meeting(profiles, booking_id, start, end, requestor_id, requestor) -> dict:
+        if requestor is None:
+            if requestor_id not in profiles:
+                raise UserNotFoundException(f"User {requestor_id} not found")
+            requestor = profiles[requestor_id][:2]
+        requestor_name, requestor_phone = requestor
+        return {
+            'booking_id': booking_id,
+            'time_list': [{'start_time': minutes_to_time(start), 'end_time': minutes_to_time(end)}],
+            'requestor_id': requestor_id,
+            'requestor_name': requestor_name,
+            'requestor_phone': requestor_phone
+        }
+
+    def sizes(self) -> dict:
+        totals = {}
+        for sizes in self._scatter({shard_index: ('sizes', ()) for shard_index in range(self.shard_count)}).values():
+            for name, value in sizes.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def cache_stats(self) -> dict:
+        totals = {'size': 0, 'max_size': 0, 'hits': 0, 'misses': 0}
+        for stats in self._scatter({shard_index: ('cache_stats', ())
+                                    for shard_index in range(self.shard_count)}).values():
+            for name in totals:
+                totals[name] += stats[name]
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_ratio'] = totals['hits'] / lookups if lookups else 0.0
+        return totals
+
+    def close(self):
+        for shard_index, connection in enumerate(self._connections):
+            with self._locks[shard_index]:
+                connection.send(None)
+        for process in self._processes:
+            process.join()
@@ -1,8 +1,60 @@
+from array import array
+from functools import lru_cache
+
+from models.interval_model import IntervalList, minutes_to_time
+
+# Bitmap mode: a day at 15 minute granularity is 96 bits, bit i set when [15 * i, 15 * (i + 1)) is free
+BITMAP_GRANULARITY = 15
+
+
+def interval_bitmap(intervals, granularity=BITMAP_GRANULARITY):
+    """
+    :param intervals: IntervalList
+    :param granularity: slot length in minutes
+    :return: int bitset of the free slots, None when an interval does not start and end on a slot boundary and
+        so has no exact bitmap
+    """
+    return _interval_bitmap(intervals.starts.tobytes(), intervals.ends.tobytes(), granularity)
+
+
+@lru_cache(maxsize=4096)
+def _interval_bitmap(starts, ends, granularity):
+    # keyed on the interval bytes, so identical days (e.g. all expanded from one weekly rule) convert only once
+    bits = 0
+    for start, end in zip(array('H', starts), array('H', ends)):
+        if start % granularity or end % granularity or start >= end:
+            return None
+        bits |= ((1 << (end - start) // granularity) - 1) << (start // granularity)
+    return bits
+
+
+def bitmap_runs(bits):
+    """
+    :param bits: int bitset
+    :return: generator of (first, last + 1) bit index of every run of set bits, lowest first
+    """
+    offset = 0
+    while bits:
+        gap = (bits & -bits).bit_length() - 1
+        bits >>= gap
+        length = (~bits & (bits + 1)).bit_length() - 1
+        yield offset + gap, offset + gap + length
+        bits >>= length
+        offset += gap + length
+
+
 class Availability:
-    def __init__(self, date, time_list):
+    __slots__ = ('date', 'intervals')
+
+    def __init__(self, date, intervals=None):
         self.date = date
-        self.time_list = time_list
+        self.intervals = intervals if intervals is not None else IntervalList()
     def get_date(self):
         return self.date
+    def get_intervals(self):
+        return self.intervals
+    def set_intervals(self, intervals):
+        self.intervals = intervals
     def get_time_list(self):
-        return self.time_list
\ No newline at end of file
+        return [{'start_time': minutes_to_time(start), 'end_time': minutes_to_time(end)}
+                for start, end in self.intervals]
@@ -0,0 +1,151 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+
+class BookingIndex:
+    """
+    Bookings kept sorted by start minute within each date, with the dates themselves kept sorted, so conflict
+    checks are a binary search and date range queries skip straight to the first matching date.
+    """
+    __slots__ = ('_bookings', '_starts', '_dates', '_ids', '_lock')
+
+    def __init__(self):
+        self._bookings = {}
+        self._starts = {}
+        self._dates = []
+        self._ids = {}
+        # bookings on different dates are added under different (user, date) locks but share the date list
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(bookings) for bookings in self._bookings.values())
+
+    def __contains__(self, date):
+        return date in self._bookings
+
+    def add(self, booking):
+        """
+        Insert a booking keeping its date sorted by start minute
+        :param booking: Booking
+        """
+        date = booking.get_date()
+        with self._lock:
+            if date not in self._bookings:
+                self._dates.insert(bisect_left(self._dates, date), date)
+                self._bookings[date] = []
+                self._starts[date] = []
+            starts = self._starts[date]
+            index = bisect_right(starts, booking.get_start())
+            starts.insert(index, booking.get_start())
+            self._bookings[date].insert(index, booking)
+            if booking.get_booking_id() is not None:
+                self._ids[booking.get_booking_id()] = booking
+
+    def remove(self, booking) -> bool:
+        """
+        Remove a booking object from the index
+        :param booking: Booking
+        :return: True if it was found
+        """
+        date = booking.get_date()
+        with self._lock:
+            starts = self._starts.get(date)
+            if not starts:
+                return False
+            bookings = self._bookings[date]
+            index = bisect_left(starts, booking.get_start())
+            while index < len(starts) and starts[index] == booking.get_start():
+                if bookings[index] is booking:
+                    del starts[index]
+                    del bookings[index]
+                    if self._ids.get(booking.get_booking_id()) is booking:
+                        del self._ids[booking.get_booking_id()]
+                    if not bookings:
+                        del self._bookings[date]
+                        del self._starts[date]
+                        self._dates.pop(bisect_left(self._dates, date))
+                    return True
+                index += 1
+            return False
+
+    def get(self, date) -> list:
+        """
+        :param date: Date in YYYY-MM-DD format
+        :return: bookings on the date sorted by start minute
+        """
+        return self._bookings.get(date, [])
+
+    def get_by_id(self, booking_id):
+        """
+        :param booking_id: Booking id
+        :return: Booking, None if not in the index
+        """
+        return self._ids.get(booking_id)
+
+    def conflicts(self, date, start, end, ignore=None) -> bool:
+        """
+        Check if [start, end) overlaps any booking on the date. Assumes bookings of a date do not overlap,
+        which holds for the bookings a user received.
+        :param date: Date in YYYY-MM-DD format
+        :param start: start minute
+        :param end: end minute
+        :param ignore: booking to leave out of the check, e.g. the one being rescheduled
+        :return: True if the range overlaps an existing booking
+        """
+        starts = self._starts.get(date)
+        if not starts:
+            return False
+        bookings = self._bookings[date]
+        index = bisect_left(starts, end) - 1
+        if index >= 0 and bookings[index] is ignore:
+            index -= 1
+        return index >= 0 and bookings[index].get_end() > start
+
+    def between(self, start_date=None, end_date=None):
+        """
+        Iterate bookings grouped by date within a date range
+        :param start_date: first date, inclusive, defaults to no lower bound
+        :param end_date: last date, inclusive, defaults to no upper bound
+        :return: iterator of (date, list of bookings)
+        """
+        low = bisect_left(self._dates, start_date) if start_date else 0
+        high = bisect_right(self._dates, end_date) if end_date else len(self._dates)
+        for date in self._dates[low:high]:
+            yield date, self._bookings[date]
+
+    def iter_after(self, after=None, start_date=None, end_date=None):
+        """
+        Iterate bookings in booking_position order, resuming after a position, for cursor pagination. Each date
+        is copied as it is reached, so writers are never blocked for the whole iteration.
+        :param after: booking_position of the last booking already returned, None to start at the first
+        :param start_date: first date, inclusive, defaults to no lower bound
+        :param end_date: last date, inclusive, defaults to no upper bound
+        :return: iterator of bookings
+        """
+        if after is not None and start_date and after[0] < start_date:
+            after = None
+        first_date = after[0] if after is not None else start_date
+        low = bisect_left(self._dates, first_date) if first_date else 0
+        high = bisect_right(self._dates, end_date) if end_date else len(self._dates)
+        for date in self._dates[low:high]:
+            with self._lock:
+                bookings = list(self._bookings.get(date, ()))
+            # bookings starting at the same minute, e.g. on different calendars of a requestor, need a tie break
+            bookings.sort(key=booking_position)
+            if after is not None and date == after[0]:
+                # bisect has no key argument before Python 3.10
+                positions = [booking_position(booking) for booking in bookings]
+                bookings = bookings[bisect_right(positions, after):]
+            yield from bookings
+
+    def items(self):
+        return self.between()
+
+
+def booking_position(booking) -> tuple:
+    """
+    Sort key of a booking that is unique across calendars, booking ids are only unique per storage
+    :param booking: Booking
+    :return: tuple of (date, start minute, host user id, booking id)
+    """
+    return booking.get_date(), booking.get_start(), booking.get_user_id(), booking.get_booking_id() or 0
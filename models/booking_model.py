@@ -1,14 +1,51 @@
+from models.interval_model import minutes_to_time
+
+
 class Booking:
-    def __init__(self, date, time_list, requestor_id):
+    """
+    A meeting on a user's calendar. The requestor's name and phone are copied in when the booking is made, so
+    listing bookings never looks the requestor up. UserManager.update_user refreshes the copy.
+    """
+    __slots__ = ('user_id', 'date', 'start', 'end', 'requestor_id', 'booking_id', 'requestor')
+
+    def __init__(self, user_id, date, start, end, requestor_id, booking_id=None, requestor=None):
+        self.user_id = user_id
         self.date = date
-        self.time_list = time_list
+        self.start = start
+        self.end = end
         self.requestor_id = requestor_id
+        # assigned by the storage backend when the booking is saved
+        self.booking_id = booking_id
+        # (name, phone) of the requestor, None for bookings stored before it was recorded. One tuple so a
+        # refresh swaps both at once.
+        self.requestor = requestor
+
+    def get_user_id(self):
+        return self.user_id
 
     def get_date(self):
         return self.date
 
+    def get_start(self):
+        return self.start
+
+    def get_end(self):
+        return self.end
+
     def get_time_list(self):
-        return self.time_list
+        return [{'start_time': minutes_to_time(self.start), 'end_time': minutes_to_time(self.end)}]
 
     def get_requestor_id(self):
-        return self.requestor_id
\ No newline at end of file
+        return self.requestor_id
+
+    def get_booking_id(self):
+        return self.booking_id
+
+    def get_requestor(self):
+        return self.requestor
+
+    def set_requestor(self, requestor):
+        self.requestor = requestor
+
+    def set_booking_id(self, booking_id):
+        self.booking_id = booking_id
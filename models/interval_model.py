@@ -0,0 +1,132 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+def time_to_minutes(time_str) -> int:
+    """
+    Convert HH:MM string to minutes since midnight
+    :param time_str: time in HH:MM format
+    :return: minutes since midnight
+    """
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def minutes_to_time(minutes) -> str:
+    """
+    Convert minutes since midnight to HH:MM string
+    :param minutes: minutes since midnight
+    :return: time in HH:MM format
+    """
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class IntervalList:
+    """
+    Sorted list of non overlapping [start, end) intervals stored as minutes since midnight.
+    Starts and ends live in two parallel unsigned short arrays, so a day costs a few bytes per
+    interval instead of a dict and two strings per slot.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, starts=(), ends=()):
+        self.starts = array('H', starts)
+        self.ends = array('H', ends)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Build interval list from (start, end) minute pairs, merging overlapping or touching pairs
+        :param pairs: iterable of (start, end) tuples
+        :return: IntervalList
+        """
+        interval_list = cls()
+        starts, ends = interval_list.starts, interval_list.ends
+        for start, end in sorted(pairs):
+            if ends and start <= ends[-1]:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+        return interval_list
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalList) and self.starts == other.starts and self.ends == other.ends
+
+    def __repr__(self):
+        return f"IntervalList({list(self)})"
+
+    def copy(self) -> 'IntervalList':
+        return IntervalList(self.starts, self.ends)
+
+    def pairs(self) -> list:
+        """
+        :return: list of (start, end) minute tuples
+        """
+        return list(zip(self.starts, self.ends))
+
+    def union(self, pairs) -> 'IntervalList':
+        """
+        Merge new pairs into the existing intervals
+        :param pairs: iterable of (start, end) tuples
+        :return: new merged IntervalList
+        """
+        return IntervalList.from_pairs(self.pairs() + list(pairs))
+
+    def contains(self, start, end) -> bool:
+        """
+        Check if [start, end) lies completely inside a single interval
+        :param start: start minute
+        :param end: end minute
+        :return: True if the range is free
+        """
+        if start >= end:
+            return False
+        index = bisect_right(self.starts, start) - 1
+        return index >= 0 and self.ends[index] >= end
+
+    def add(self, start, end):
+        """
+        Merge [start, end) into the intervals in place, joining the intervals it overlaps or touches.
+        Two binary searches and one slice assignment, no re-sort.
+        :param start: start minute
+        :param end: end minute
+        """
+        starts, ends = self.starts, self.ends
+        # first interval that ends at or after start and first interval that starts after end
+        low = bisect_left(ends, start)
+        high = bisect_right(starts, end)
+        if low < high:
+            start = min(start, starts[low])
+            end = max(end, ends[high - 1])
+        starts[low:high] = array('H', (start,))
+        ends[low:high] = array('H', (end,))
+
+    def remove(self, start, end):
+        """
+        Carve [start, end) out of the intervals in place
+        :param start: start minute
+        :param end: end minute
+        """
+        starts, ends = self.starts, self.ends
+        # first interval that ends after start and first interval that starts at or after end
+        low = bisect_right(ends, start)
+        high = bisect_left(starts, end)
+        if low >= high:
+            return
+        new_starts, new_ends = array('H'), array('H')
+        if starts[low] < start:
+            new_starts.append(starts[low])
+            new_ends.append(start)
+        if ends[high - 1] > end:
+            new_starts.append(end)
+            new_ends.append(ends[high - 1])
+        starts[low:high] = new_starts
+        ends[low:high] = new_ends
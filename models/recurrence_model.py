@@ -0,0 +1,101 @@
+from datetime import date, timedelta
+from functools import lru_cache
+
+from models.interval_model import IntervalList
+
+
+@lru_cache(maxsize=512)
+def weekday_of(date_str) -> int:
+    """
+    :param date_str: date in YYYY-MM-DD format
+    :return: weekday, Monday is 0 and Sunday is 6
+    """
+    return date.fromisoformat(date_str).weekday()
+
+
+@lru_cache(maxsize=512)
+def shift_date(date_str, days) -> str:
+    """
+    :param date_str: date in YYYY-MM-DD format
+    :param days: number of days to move, negative for earlier dates
+    :return: date in YYYY-MM-DD format
+    """
+    return (date.fromisoformat(date_str) + timedelta(days=days)).isoformat()
+
+
+class RecurrenceRule:
+    """
+    Weekly availability, e.g. 09:00-17:00 every weekday, stored once instead of once per date. Ranges running
+    past midnight, e.g. 22:00-02:00, keep the part after midnight in carry, it applies to the following date.
+    """
+    __slots__ = ('weekdays', 'intervals', 'start_date', 'end_date', 'exceptions', 'carry')
+
+    def __init__(self, weekdays, intervals, start_date=None, end_date=None, exceptions=(), carry=None):
+        self.weekdays = frozenset(weekdays)
+        self.intervals = intervals
+        self.start_date = start_date
+        self.end_date = end_date
+        self.exceptions = frozenset(exceptions)
+        self.carry = carry if carry is not None else IntervalList()
+
+    def applies_to(self, date_str) -> bool:
+        """
+        :param date_str: date in YYYY-MM-DD format
+        :return: True if the rule produces availability on the date
+        """
+        if (self.start_date and date_str < self.start_date) or (self.end_date and date_str > self.end_date):
+            return False
+        return date_str not in self.exceptions and weekday_of(date_str) in self.weekdays
+
+    def to_dict(self) -> dict:
+        return {
+            'weekdays': sorted(self.weekdays),
+            'intervals': self.intervals.pairs(),
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'exceptions': sorted(self.exceptions),
+            'carry': self.carry.pairs()
+        }
+
+    @classmethod
+    def from_dict(cls, value) -> 'RecurrenceRule':
+        return cls(value['weekdays'], IntervalList.from_pairs(value['intervals']), value.get('start_date'),
+                   value.get('end_date'), value.get('exceptions', ()), IntervalList.from_pairs(value.get('carry', ())))
+
+
+class RecurrenceSchedule:
+    """
+    All recurrence rules of a user. Dates are expanded on demand, and the union for each combination of
+    applicable rules is built once and reused, so querying a month of weekdays merges the rules only once.
+    """
+    __slots__ = ('rules', '_expanded')
+
+    EMPTY = IntervalList()
+
+    def __init__(self, rules=()):
+        self.rules = tuple(rules)
+        self._expanded = {}
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def expand(self, date_str) -> IntervalList:
+        """
+        Concrete availability produced by the rules on a date. The returned list is shared, callers must copy
+        it before modifying.
+        :param date_str: date in YYYY-MM-DD format
+        :return: IntervalList
+        """
+        if not self.rules:
+            return self.EMPTY
+        applicable = tuple(index for index, rule in enumerate(self.rules) if rule.applies_to(date_str))
+        previous_date = shift_date(date_str, -1)
+        carried = tuple(index for index, rule in enumerate(self.rules)
+                        if rule.carry and rule.applies_to(previous_date))
+        intervals = self._expanded.get((applicable, carried))
+        if intervals is None:
+            intervals = IntervalList.from_pairs(
+                [pair for index in applicable for pair in self.rules[index].intervals] +
+                [pair for index in carried for pair in self.rules[index].carry])
+            self._expanded[(applicable, carried)] = intervals
+        return intervals
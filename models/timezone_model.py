@@ -0,0 +1,135 @@
+from bisect import bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+DEFAULT_TIMEZONE = 'UTC'
+MINUTES_PER_DAY = 24 * 60
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# days covered beyond both ends of the requested range, local dates of far east and west zones stick out of it
+PADDING_DAYS = 2
+
+
+@lru_cache(maxsize=1024)
+def day_number(date_str) -> int:
+    """
+    :param date_str: date in YYYY-MM-DD format
+    :return: days since 1970-01-01
+    """
+    return date.fromisoformat(date_str).toordinal() - _EPOCH_ORDINAL
+
+
+@lru_cache(maxsize=1024)
+def date_of_day(day) -> str:
+    """
+    :param day: days since 1970-01-01
+    :return: date in YYYY-MM-DD format
+    """
+    return date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+
+
+class OffsetTable:
+    """
+    UTC offsets of one timezone over a range of days, as the UTC minutes where the offset changes and the offset
+    from each of them on. Converting between a local (date, minute) and UTC epoch minutes is then a bisect and an
+    addition, the tz database is only consulted while building the table.
+    """
+    __slots__ = ('name', 'transitions', 'offsets')
+
+    def __init__(self, name, first_day, last_day):
+        """
+        :param name: IANA timezone name, e.g. Europe/Berlin
+        :param first_day: first day to cover, in days since 1970-01-01
+        :param last_day: last day to cover, inclusive
+        """
+        zone = ZoneInfo(name)
+
+        def offset_at(minute):
+            return int(datetime.fromtimestamp(minute * 60, zone).utcoffset().total_seconds()) // 60
+
+        self.name = name
+        self.transitions = [first_day * MINUTES_PER_DAY]
+        self.offsets = [offset_at(self.transitions[0])]
+        # sample every UTC midnight and binary search the minute of each change, zones change at most a few
+        # times a year so the table stays tiny
+        for day in range(first_day + 1, last_day + 2):
+            offset = offset_at(day * MINUTES_PER_DAY)
+            if offset != self.offsets[-1]:
+                low, high = (day - 1) * MINUTES_PER_DAY, day * MINUTES_PER_DAY
+                while high - low > 1:
+                    middle = (low + high) // 2
+                    if offset_at(middle) == self.offsets[-1]:
+                        low = middle
+                    else:
+                        high = middle
+                self.transitions.append(high)
+                self.offsets.append(offset)
+
+    def offset_at(self, epoch_minute) -> int:
+        """
+        :param epoch_minute: minutes since 1970-01-01 00:00 UTC
+        :return: local time minus UTC in minutes at that instant
+        """
+        return self.offsets[max(bisect_right(self.transitions, epoch_minute) - 1, 0)]
+
+    def to_utc(self, date_str, minute) -> int:
+        """
+        Local times repeated when clocks go back map to their first occurrence, local times skipped when clocks
+        go forward map to the instant of the change, so the mapping never runs backwards
+        :param date_str: local date in YYYY-MM-DD format
+        :param minute: local minutes since midnight, 1440 is midnight of the next day
+        :return: minutes since 1970-01-01 00:00 UTC
+        """
+        local = day_number(date_str) * MINUTES_PER_DAY + minute
+        transitions, offsets = self.transitions, self.offsets
+        for index, offset in enumerate(offsets):
+            utc = local - offset
+            if index + 1 == len(offsets) or utc < transitions[index + 1]:
+                return utc if index == 0 or utc >= transitions[index] else transitions[index]
+        return local - offsets[-1]
+
+    def to_local(self, epoch_minute) -> tuple:
+        """
+        :param epoch_minute: minutes since 1970-01-01 00:00 UTC
+        :return: tuple of (local date in YYYY-MM-DD format, local minutes since midnight)
+        """
+        day, minute = divmod(epoch_minute + self.offset_at(epoch_minute), MINUTES_PER_DAY)
+        return date_of_day(day), minute
+
+    def split_days(self, start, end):
+        """
+        Split a UTC range at local midnights
+        :param start: start in UTC epoch minutes
+        :param end: end in UTC epoch minutes
+        :return: iterator of (local date, start minute, end minute), a range reaching midnight ends at 1440
+        """
+        while start < end:
+            date_str, minute = self.to_local(start)
+            midnight = self.to_utc(date_of_day(day_number(date_str) + 1), 0)
+            part_end = min(end, midnight) if midnight > start else end
+            if part_end == midnight:
+                end_minute = MINUTES_PER_DAY
+            else:
+                end_minute = self.to_local(part_end)[1]
+                if end_minute <= minute:
+                    # the part runs through the hour repeated when clocks go back
+                    end_minute = min(minute + part_end - start, MINUTES_PER_DAY)
+            yield date_str, minute, end_minute
+            start = part_end
+
+
+def offset_table(name, first_date, days) -> OffsetTable:
+    """
+    Offset table of a timezone covering a range of dates, built once per timezone and range
+    :param name: IANA timezone name
+    :param first_date: first date in YYYY-MM-DD format
+    :param days: number of dates
+    :return: OffsetTable
+    """
+    first_day = day_number(first_date)
+    return _offset_table(name, first_day - PADDING_DAYS, first_day + days + PADDING_DAYS)
+
+
+@lru_cache(maxsize=512)
+def _offset_table(name, first_day, last_day) -> OffsetTable:
+    return OffsetTable(name, first_day, last_day)
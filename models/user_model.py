@@ -1,21 +1,39 @@
+from models.booking_index import BookingIndex
+from models.recurrence_model import RecurrenceSchedule
+from models.timezone_model import DEFAULT_TIMEZONE
+
+
 class User:
-    def __init__(self, user_id, name, phone):
+    def __init__(self, user_id, name, phone, timezone=DEFAULT_TIMEZONE):
         self.user_id = user_id
         self.name = name
         self.phone = phone
+        self.timezone = timezone
         self.availability = {}
-        self.bookings = {}
+        self.bookings = BookingIndex()
+        self.recurrence = RecurrenceSchedule()
     def get_availability(self):
         return self.availability
     def set_availability(self, availability):
         self.availability = availability
+    def get_recurrence(self):
+        return self.recurrence
+    def set_recurrence(self, recurrence):
+        self.recurrence = recurrence
     def get_user_id(self):
         return self.user_id
     def get_name(self):
         return self.name
     def get_phone(self):
         return self.phone
+    def set_profile(self, name, phone):
+        self.name = name
+        self.phone = phone
+    def get_timezone(self):
+        return self.timezone
     def get_booked_meetings(self):
         return self.bookings
-    def book_meeting(self, bookings):
-        self.bookings = bookings
\ No newline at end of file
+    def book_meeting(self, booking):
+        self.bookings.add(booking)
+    def cancel_meeting(self, booking):
+        return self.bookings.remove(booking)
\ No newline at end of file
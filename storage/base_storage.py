@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+
+from models.timezone_model import DEFAULT_TIMEZONE
+
+
+class StorageBackend:
+    """
+    Persistence interface used by UserManager. UserManager keeps the working set in memory and writes every
+    change through to the backend; users missing from memory are loaded from the backend on first access.
+    Write methods return the new version of the user, or None when the backend does not track versions. Backends
+    that track versions refuse writes made with an outdated expected_version, see save_availability.
+    """
+    # batch() undoes every write of a block that raises
+    transactional = False
+
+    def create_user(self, user_name, phone, timezone=DEFAULT_TIMEZONE) -> int:
+        """
+        Persist a new user and allocate its id. New users start at version 0.
+        :param user_name: user name
+        :param phone: phone
+        :param timezone: IANA timezone name the user's availability and bookings are in
+        :return: user_id
+        """
+        raise NotImplementedError
+
+    def get_user_version(self, user_id):
+        """
+        :param user_id: User id
+        :return: version of the stored user, None if the backend does not know the user
+        """
+        raise NotImplementedError
+
+    def load_user(self, user_id):
+        """
+        Load a user with availability and bookings
+        :param user_id: User id
+        :return: tuple of (User, version), (None, None) if not found
+        """
+        raise NotImplementedError
+
+    def get_requested_user_ids(self, requestor_id) -> list:
+        """
+        :param requestor_id: User id of the requestor
+        :return: ids of the users that have a booking made by the requestor
+        """
+        raise NotImplementedError
+
+    def update_user(self, user_id, user_name, phone):
+        """
+        Replace the name and phone of a user
+        :param user_id: User id
+        :param user_name: user name
+        :param phone: phone
+        :return: new user version
+        """
+        raise NotImplementedError
+
+    def update_requestor(self, requestor_id, requestor):
+        """
+        Refresh the requestor snapshot on every booking made by the requestor
+        :param requestor_id: User id of the requestor
+        :param requestor: (name, phone) to store on the bookings
+        :return: dict of user id to new version of the users holding those bookings, empty when not tracked
+        """
+        raise NotImplementedError
+
+    def save_availability(self, user_id, date, intervals, expected_version=None):
+        """
+        Replace the availability of a user for a date
+        :param user_id: User id
+        :param date: Date in YYYY-MM-DD format
+        :param intervals: IntervalList
+        :param expected_version: version of the user the change was computed from, the write fails with
+            StaleUserException when the stored user is at another version. None writes unconditionally.
+        :return: new user version
+        """
+        raise NotImplementedError
+
+    def save_recurrence_rules(self, user_id, rules, expected_version=None):
+        """
+        Replace the recurrence rules of a user
+        :param user_id: User id
+        :param rules: tuple of RecurrenceRule
+        :return: new user version
+        """
+        raise NotImplementedError
+
+    def save_booking(self, user_id, booking, intervals, expected_version=None):
+        """
+        Persist a booking together with the availability left after it, and assign its booking id
+        :param user_id: User id
+        :param booking: Booking, its booking id is set by the backend
+        :param intervals: IntervalList of remaining availability on the booking date
+        :return: new user version
+        """
+        raise NotImplementedError
+
+    def delete_booking(self, user_id, booking, intervals, expected_version=None):
+        """
+        Delete a booking together with the availability restored by cancelling it
+        :param user_id: User id
+        :param booking: Booking
+        :param intervals: IntervalList of availability on the booking date once the booking is gone
+        :return: new user version
+        """
+        raise NotImplementedError
+
+    def move_booking(self, user_id, booking, new_booking, intervals, expected_version=None):
+        """
+        Replace a booking with new_booking, which keeps its booking id, and update the availability of the dates
+        involved, all in one atomic write
+        :param user_id: User id
+        :param booking: Booking being moved
+        :param new_booking: Booking at the new date and time
+        :param intervals: dict of date to IntervalList of availability after the move, for the old and new date
+        :return: new user version
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self):
+        """
+        Group all writes made inside the block into a single commit. Keep blocks short, backends may lock out
+        writers of other processes until the block ends.
+        """
+        yield
+
+    def close(self):
+        pass
@@ -0,0 +1,421 @@
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+from models.availability_model import Availability
+from models.booking_model import Booking
+from models.interval_model import IntervalList
+from models.recurrence_model import RecurrenceRule, RecurrenceSchedule
+from models.timezone_model import DEFAULT_TIMEZONE
+from models.user_model import User
+from storage.base_storage import StorageBackend
+from utils.concurrency import IdAllocator
+from utils.helper_functions import get_booking_window
+
+# Log record types, one compact JSON array per line
+USER, AVAILABILITY, RULES, BOOKING, CANCEL, MOVE, PROFILE, REQUESTOR = 'U', 'A', 'R', 'B', 'C', 'M', 'P', 'Q'
+
+LOG_FILE = re.compile(r'journal-(\d+)\.log')
+SNAPSHOT_FILE = re.compile(r'snapshot-(\d+)\.json')
+
+
+def _encode(record) -> bytes:
+    return (json.dumps(record, separators=(',', ':')) + '\n').encode()
+
+
+class JournalStorage(StorageBackend):
+    """
+    Keeps the in-memory speed of the default backend and makes it durable with an append only operation log.
+    Every write is appended to the log and fsynced before it returns. A background flusher commits whatever
+    accumulated while the previous fsync ran in one go (group commit), so concurrent writers share fsyncs.
+    Every snapshot_every records a compact snapshot of the whole state is written and the log covered by it
+    is dropped. Startup loads the latest snapshot and replays the log written after it.
+
+    The log directory belongs to a single process, run one worker (with threads) per directory.
+    """
+
+    def __init__(self, directory, fsync=True, snapshot_every=100000, first_id=1, id_step=1):
+        """
+        :param directory: directory holding the log segments and snapshots, created if missing
+        :param fsync: fsync every commit, without it a crash of the machine may lose the last writes
+        :param snapshot_every: number of log records between automatic snapshots, 0 to only snapshot on demand
+        :param first_id: first user id to allocate
+        :param id_step: distance between allocated ids, see IdAllocator
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+        # State as of the last append. Intervals, rules and bookings are shared with UserManager, which never
+        # modifies them in place apart from the requestor snapshot of bookings, so this costs references and not
+        # copies.
+        self._users = {}
+        self._availability = {}
+        self._rules = {}
+        self._bookings = {}
+        self._requestors = {}
+        self._user_ids = IdAllocator(first_id, id_step)
+        self._booking_ids = IdAllocator()
+        self._seq = 0
+        self._durable_seq = 0
+        self._pending = []
+        self._records_since_snapshot = 0
+        self._closed = False
+        # error that stopped the log, raised to every writer from then on
+        self._error = None
+        self._cond = threading.Condition()
+        self._log_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._local = threading.local()
+        self.recover()
+        self._log = open(self._log_path(self._seq + 1), 'wb')
+        self._flusher = threading.Thread(target=self._flush_loop, name='journal-flusher', daemon=True)
+        self._flusher.start()
+
+    def _log_path(self, first_seq) -> str:
+        return os.path.join(self.directory, f"journal-{first_seq:012d}.log")
+
+    def _snapshot_path(self, seq) -> str:
+        return os.path.join(self.directory, f"snapshot-{seq:012d}.json")
+
+    def _files(self, pattern) -> list:
+        return sorted((int(match.group(1)), os.path.join(self.directory, match.group(0)))
+                      for match in map(pattern.fullmatch, os.listdir(self.directory)) if match)
+
+    def _sync_directory(self):
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):
+            descriptor = os.open(self.directory, os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def recover(self):
+        """
+        Rebuild the state from the latest complete snapshot followed by the log segments written after it.
+        A torn record at the end of a segment, left by a crash in the middle of a write, is ignored.
+        """
+        snapshots = self._files(SNAPSHOT_FILE)
+        if snapshots:
+            self._seq, path = snapshots[-1]
+            with open(path, 'rb') as snapshot:
+                self._load_snapshot(json.load(snapshot))
+        for first_seq, path in self._files(LOG_FILE):
+            if first_seq <= self._seq:
+                continue
+            with open(path, 'rb') as log:
+                for line in log:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self._replay(record)
+                    self._seq += 1
+        self._durable_seq = self._seq
+
+    def _load_snapshot(self, snapshot):
+        self._user_ids.advance_to(snapshot['next_user_id'])
+        self._booking_ids.advance_to(snapshot['next_booking_id'])
+        for user_id, user_name, phone, *timezone in snapshot['users']:
+            # snapshots written before users had a timezone have three columns
+            self._users[user_id] = (user_name, phone, timezone[0] if timezone else DEFAULT_TIMEZONE)
+        for user_id, date, starts, ends in snapshot['availability']:
+            self._set_availability(user_id, date, IntervalList(starts, ends))
+        for user_id, rules in snapshot['rules']:
+            self._rules[user_id] = tuple(RecurrenceRule.from_dict(rule) for rule in rules)
+        for user_id, rows in snapshot['bookings']:
+            # rows of snapshots written before bookings had a requestor snapshot have five columns
+            self._bookings[user_id] = {row[0]: Booking(user_id, *row[1:5], row[0], self._requestor(row, 5))
+                                       for row in rows}
+            for requestor_id in {row[4] for row in rows}:
+                self._requestors.setdefault(requestor_id, set()).add(user_id)
+
+    def _replay(self, record):
+        kind, user_id = record[0], record[1]
+        if kind == USER:
+            self._users[user_id] = (record[2], record[3], record[4] if len(record) > 4 else DEFAULT_TIMEZONE)
+            self._user_ids.advance_to(user_id + 1)
+        elif kind == AVAILABILITY:
+            self._set_availability(user_id, record[2], IntervalList(record[3], record[4]))
+        elif kind == RULES:
+            self._rules[user_id] = tuple(RecurrenceRule.from_dict(rule) for rule in record[2])
+        elif kind == BOOKING:
+            _, _, booking_id, date, start, end, requestor_id, starts, ends = record[:9]
+            self._add_booking(Booking(user_id, date, start, end, requestor_id, booking_id, self._requestor(record, 9)))
+            self._booking_ids.advance_to(booking_id + 1)
+            self._set_availability(user_id, date, IntervalList(starts, ends))
+        elif kind == CANCEL:
+            _, _, booking_id, date, starts, ends = record
+            del self._bookings[user_id][booking_id]
+            self._set_availability(user_id, date, IntervalList(starts, ends))
+        elif kind == MOVE:
+            _, _, booking_id, date, start, end, dates = record
+            booking = self._bookings[user_id][booking_id]
+            self._bookings[user_id][booking_id] = Booking(user_id, date, start, end, booking.get_requestor_id(),
+                                                          booking_id, booking.get_requestor())
+            for date, starts, ends in dates:
+                self._set_availability(user_id, date, IntervalList(starts, ends))
+        elif kind == PROFILE:
+            self._set_profile(user_id, record[2], record[3])
+        elif kind == REQUESTOR:
+            self._set_requestor(user_id, tuple(record[2]))
+
+    @staticmethod
+    def _requestor(row, index):
+        return tuple(row[index]) if len(row) > index and row[index] is not None else None
+
+    def _set_profile(self, user_id, user_name, phone):
+        self._users[user_id] = (user_name, phone, self._users[user_id][2])
+
+    def _set_requestor(self, requestor_id, requestor):
+        for user_id in self._requestors.get(requestor_id, ()):
+            for booking in self._bookings.get(user_id, {}).values():
+                if booking.get_requestor_id() == requestor_id:
+                    booking.set_requestor(requestor)
+
+    def _set_availability(self, user_id, date, intervals):
+        dates = self._availability.get(user_id)
+        if dates is None:
+            dates = self._availability[user_id] = {}
+        dates[date] = intervals
+
+    def _add_booking(self, booking):
+        user_id = booking.get_user_id()
+        self._bookings.setdefault(user_id, {})[booking.get_booking_id()] = booking
+        self._requestors.setdefault(booking.get_requestor_id(), set()).add(user_id)
+
+    def _append(self, record, apply):
+        """
+        Apply a write to the state and queue its log record, then wait until the flusher made it durable.
+        Inside batch() the wait happens once at the end of the batch.
+        """
+        line = _encode(record)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Journal is closed")
+            if self._error is not None:
+                raise self._error
+            apply()
+            self._seq += 1
+            seq = self._seq
+            self._pending.append(line)
+            self._records_since_snapshot += 1
+            self._cond.notify_all()
+            if getattr(self._local, 'depth', 0):
+                self._local.last_seq = seq
+            else:
+                self._wait_durable(seq)
+        if self.snapshot_every and self._records_since_snapshot >= self.snapshot_every \
+                and self._snapshot_lock.acquire(blocking=False):
+            threading.Thread(target=self._snapshot_and_release, name='journal-snapshot', daemon=True).start()
+
+    def _wait_durable(self, seq):
+        while self._durable_seq < seq:
+            if self._error is not None:
+                raise self._error
+            self._cond.wait()
+
+    def _flush(self, rotate=False):
+        """
+        Write and fsync every queued record
+        :param rotate: also start a new log segment and capture the state it starts from, for a snapshot
+        :return: tuple of (last flushed seq, captured state or None)
+        """
+        with self._log_lock:
+            with self._cond:
+                lines, self._pending = self._pending, []
+                seq = self._seq
+                state = self._capture() if rotate else None
+                if rotate:
+                    self._records_since_snapshot = 0
+            try:
+                if lines:
+                    self._log.write(b''.join(lines))
+                    self._log.flush()
+                    if self.fsync:
+                        os.fsync(self._log.fileno())
+                if rotate:
+                    self._log.close()
+                    self._log = open(self._log_path(seq + 1), 'wb')
+            except Exception as e:
+                # what reached the log is unknown, so nothing after this point is made durable
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._durable_seq = max(self._durable_seq, seq)
+                self._cond.notify_all()
+        return seq, state
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if (self._closed and not self._pending) or self._error is not None:
+                    return
+            try:
+                self._flush()
+            except Exception:
+                # the waiting writers raise the error _flush stored
+                return
+
+    def _capture(self) -> tuple:
+        # shallow copies only, the objects they point to are never modified in place
+        return (max(self._users, default=0) + 1, self._booking_ids.peek(), dict(self._users),
+                {user_id: dict(dates) for user_id, dates in self._availability.items()},
+                dict(self._rules), {user_id: list(bookings.values()) for user_id, bookings in self._bookings.items()})
+
+    def snapshot(self) -> str:
+        """
+        Write a snapshot of the current state and drop the log segments and snapshots it replaces.
+        Availability of dates before the booking window is left out, it can no longer be queried or booked.
+        :return: path of the snapshot
+        """
+        with self._snapshot_lock:
+            return self._write_snapshot()
+
+    def _snapshot_and_release(self):
+        try:
+            self._write_snapshot()
+        finally:
+            self._snapshot_lock.release()
+
+    def _write_snapshot(self) -> str:
+        seq, (next_user_id, next_booking_id, users, availability, rules, bookings) = self._flush(rotate=True)
+        window_start = get_booking_window()[0]
+        snapshot = {
+            'seq': seq,
+            'next_user_id': next_user_id,
+            'next_booking_id': next_booking_id,
+            'users': [[user_id, *profile] for user_id, profile in users.items()],
+            'availability': [[user_id, date, intervals.starts.tolist(), intervals.ends.tolist()]
+                             for user_id, dates in availability.items()
+                             for date, intervals in dates.items() if date >= window_start],
+            'rules': [[user_id, [rule.to_dict() for rule in user_rules]] for user_id, user_rules in rules.items()],
+            'bookings': [[user_id, [[booking.get_booking_id(), booking.get_date(), booking.get_start(),
+                                     booking.get_end(), booking.get_requestor_id(), booking.get_requestor()]
+                                    for booking in user_bookings]]
+                         for user_id, user_bookings in bookings.items()]
+        }
+        path = self._snapshot_path(seq)
+        with open(path + '.tmp', 'w') as output:
+            json.dump(snapshot, output, separators=(',', ':'))
+            output.flush()
+            if self.fsync:
+                os.fsync(output.fileno())
+        os.replace(path + '.tmp', path)
+        self._sync_directory()
+        for first_seq, old_path in self._files(LOG_FILE):
+            if first_seq <= seq:
+                os.remove(old_path)
+        for old_seq, old_path in self._files(SNAPSHOT_FILE):
+            if old_seq < seq:
+                os.remove(old_path)
+        return path
+
+    @contextmanager
+    def batch(self):
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            last_seq = getattr(self._local, 'last_seq', 0) if not self._local.depth else 0
+            if last_seq:
+                self._local.last_seq = 0
+                with self._cond:
+                    self._wait_durable(last_seq)
+
+    def create_user(self, user_name, phone, timezone=DEFAULT_TIMEZONE) -> int:
+        user_id = self._user_ids.next_id()
+
+        def apply():
+            self._users[user_id] = (user_name, phone, timezone)
+        self._append([USER, user_id, user_name, phone, timezone], apply)
+        return user_id
+
+    def get_user_version(self, user_id):
+        # the journal is owned by this process, so a known user is never changed behind UserManager's back
+        return 0 if user_id in self._users else None
+
+    def load_user(self, user_id):
+        with self._cond:
+            if user_id not in self._users:
+                return None, None
+            user = User(user_id, *self._users[user_id])
+            window_start = get_booking_window()[0]
+            availability_dict = user.get_availability()
+            for date, intervals in self._availability.get(user_id, {}).items():
+                if date >= window_start:
+                    availability_dict[date] = Availability(date, intervals)
+            if user_id in self._rules:
+                user.set_recurrence(RecurrenceSchedule(self._rules[user_id]))
+            for booking in self._bookings.get(user_id, {}).values():
+                user.book_meeting(booking)
+        return user, 0
+
+    def get_requested_user_ids(self, requestor_id) -> list:
+        with self._cond:
+            return list(self._requestors.get(requestor_id, ()))
+
+    def update_user(self, user_id, user_name, phone):
+        self._append([PROFILE, user_id, user_name, phone], lambda: self._set_profile(user_id, user_name, phone))
+        return None
+
+    def update_requestor(self, requestor_id, requestor):
+        self._append([REQUESTOR, requestor_id, list(requestor)], lambda: self._set_requestor(requestor_id, requestor))
+        return {}
+
+    def save_availability(self, user_id, date, intervals, expected_version=None):
+        self._append([AVAILABILITY, user_id, date, intervals.starts.tolist(), intervals.ends.tolist()],
+                     lambda: self._set_availability(user_id, date, intervals))
+        return None
+
+    def save_recurrence_rules(self, user_id, rules, expected_version=None):
+        def apply():
+            self._rules[user_id] = tuple(rules)
+        self._append([RULES, user_id, [rule.to_dict() for rule in rules]], apply)
+        return None
+
+    def save_booking(self, user_id, booking, intervals, expected_version=None):
+        booking.set_booking_id(self._booking_ids.next_id())
+
+        def apply():
+            self._add_booking(booking)
+            self._set_availability(user_id, booking.get_date(), intervals)
+        self._append([BOOKING, user_id, booking.get_booking_id(), booking.get_date(), booking.get_start(),
+                      booking.get_end(), booking.get_requestor_id(), intervals.starts.tolist(),
+                      intervals.ends.tolist(), booking.get_requestor()], apply)
+        return None
+
+    def delete_booking(self, user_id, booking, intervals, expected_version=None):
+        def apply():
+            del self._bookings[user_id][booking.get_booking_id()]
+            self._set_availability(user_id, booking.get_date(), intervals)
+        self._append([CANCEL, user_id, booking.get_booking_id(), booking.get_date(), intervals.starts.tolist(),
+                      intervals.ends.tolist()], apply)
+        return None
+
+    def move_booking(self, user_id, booking, new_booking, intervals, expected_version=None):
+        # a single record, so replay never sees the booking removed without being added back
+        def apply():
+            self._bookings[user_id][booking.get_booking_id()] = new_booking
+            for date, date_intervals in intervals.items():
+                self._set_availability(user_id, date, date_intervals)
+        self._append([MOVE, user_id, booking.get_booking_id(), new_booking.get_date(), new_booking.get_start(),
+                      new_booking.get_end(), [[date, date_intervals.starts.tolist(), date_intervals.ends.tolist()]
+                                              for date, date_intervals in intervals.items()]], apply)
+        return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        if self._error is None:
+            self._flush()
+        self._log.close()
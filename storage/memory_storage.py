@@ -0,0 +1,52 @@
+from storage.base_storage import StorageBackend
+from models.timezone_model import DEFAULT_TIMEZONE
+from utils.concurrency import IdAllocator
+
+
+class InMemoryStorage(StorageBackend):
+    """
+    Default backend. UserManager's own dict is the only copy of the data, so nothing is persisted
+    and data is lost on every reload.
+    """
+
+    def __init__(self, first_id=1, id_step=1):
+        """
+        :param first_id: first user id to allocate
+        :param id_step: distance between allocated ids, see IdAllocator
+        """
+        self._user_ids = IdAllocator(first_id, id_step)
+        self._booking_ids = IdAllocator()
+
+    def create_user(self, user_name, phone, timezone=DEFAULT_TIMEZONE) -> int:
+        return self._user_ids.next_id()
+
+    def get_user_version(self, user_id):
+        return None
+
+    def load_user(self, user_id):
+        return None, None
+
+    def get_requested_user_ids(self, requestor_id) -> list:
+        return []
+
+    def update_user(self, user_id, user_name, phone):
+        return None
+
+    def update_requestor(self, requestor_id, requestor):
+        return {}
+
+    def save_availability(self, user_id, date, intervals, expected_version=None):
+        return None
+
+    def save_recurrence_rules(self, user_id, rules, expected_version=None):
+        return None
+
+    def save_booking(self, user_id, booking, intervals, expected_version=None):
+        booking.set_booking_id(self._booking_ids.next_id())
+        return None
+
+    def delete_booking(self, user_id, booking, intervals, expected_version=None):
+        return None
+
+    def move_booking(self, user_id, booking, new_booking, intervals, expected_version=None):
+        return None
@@ -0,0 +1,268 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from models.availability_model import Availability
+from models.booking_model import Booking
+from models.interval_model import IntervalList, minutes_to_time
+from models.recurrence_model import RecurrenceRule, RecurrenceSchedule
+from models.timezone_model import DEFAULT_TIMEZONE
+from models.user_model import User
+from storage.base_storage import StorageBackend
+from utils.exceptions import SlotNotAvailableException, BookingNotFoundException, StaleUserException
+from utils.helper_functions import get_booking_window
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    timezone TEXT NOT NULL DEFAULT 'UTC'
+);
+CREATE TABLE IF NOT EXISTS availability (
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    starts BLOB NOT NULL,
+    ends BLOB NOT NULL,
+    PRIMARY KEY (user_id, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS recurrence_rules (
+    user_id INTEGER PRIMARY KEY,
+    rules TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    start_minute INTEGER NOT NULL,
+    end_minute INTEGER NOT NULL,
+    requestor_id INTEGER,
+    requestor_name TEXT,
+    requestor_phone TEXT
+);
+CREATE INDEX IF NOT EXISTS bookings_user_date ON bookings (user_id, date, start_minute);
+CREATE INDEX IF NOT EXISTS bookings_requestor ON bookings (requestor_id, user_id);
+"""
+
+# Statements are kept as module constants so sqlite3's per connection statement cache reuses the prepared form
+INSERT_USER = "INSERT INTO users (user_name, phone, timezone) VALUES (?, ?, ?)"
+SELECT_VERSION = "SELECT version FROM users WHERE user_id = ?"
+BUMP_VERSION = "UPDATE users SET version = version + 1 WHERE user_id = ?"
+BUMP_EXPECTED_VERSION = "UPDATE users SET version = version + 1 WHERE user_id = ? AND version = ?"
+SELECT_USER = "SELECT user_name, phone, timezone, version FROM users WHERE user_id = ?"
+UPDATE_USER = "UPDATE users SET user_name = ?, phone = ? WHERE user_id = ?"
+# databases created before users had a timezone and bookings a requestor snapshot
+ADD_TIMEZONE_COLUMN = "ALTER TABLE users ADD COLUMN timezone TEXT NOT NULL DEFAULT 'UTC'"
+ADD_REQUESTOR_COLUMNS = ("ALTER TABLE bookings ADD COLUMN requestor_name TEXT",
+                         "ALTER TABLE bookings ADD COLUMN requestor_phone TEXT")
+SELECT_AVAILABILITY = "SELECT date, starts, ends FROM availability WHERE user_id = ? AND date >= ?"
+UPSERT_AVAILABILITY = "INSERT OR REPLACE INTO availability (user_id, date, starts, ends) VALUES (?, ?, ?, ?)"
+SELECT_RULES = "SELECT rules FROM recurrence_rules WHERE user_id = ?"
+UPSERT_RULES = "INSERT OR REPLACE INTO recurrence_rules (user_id, rules) VALUES (?, ?)"
+SELECT_BOOKINGS = ("SELECT booking_id, date, start_minute, end_minute, requestor_id, requestor_name, requestor_phone "
+                   "FROM bookings WHERE user_id = ? ORDER BY date, start_minute")
+SELECT_CONFLICT = ("SELECT 1 FROM bookings WHERE user_id = ? AND date = ? "
+                   "AND start_minute < ? AND end_minute > ? AND booking_id != ? LIMIT 1")
+SELECT_REQUESTED_USERS = "SELECT DISTINCT user_id FROM bookings WHERE requestor_id = ?"
+INSERT_BOOKING = ("INSERT INTO bookings (user_id, date, start_minute, end_minute, requestor_id, requestor_name, "
+                  "requestor_phone) VALUES (?, ?, ?, ?, ?, ?, ?)")
+UPDATE_REQUESTOR = "UPDATE bookings SET requestor_name = ?, requestor_phone = ? WHERE requestor_id = ?"
+DELETE_BOOKING = "DELETE FROM bookings WHERE booking_id = ? AND user_id = ?"
+UPDATE_BOOKING = ("UPDATE bookings SET date = ?, start_minute = ?, end_minute = ? "
+                  "WHERE booking_id = ? AND user_id = ?")
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite backend in WAL mode, so several worker processes can share one database file with concurrent readers.
+    Each thread gets its own pooled connection. Writes commit one by one unless grouped with batch().
+    """
+    transactional = True
+
+    def __init__(self, db_path, timeout=30):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        if 'timezone' not in [column[1] for column in connection.execute("PRAGMA table_info(users)")]:
+            self._migrate(connection, [ADD_TIMEZONE_COLUMN])
+        if 'requestor_name' not in [column[1] for column in connection.execute("PRAGMA table_info(bookings)")]:
+            self._migrate(connection, ADD_REQUESTOR_COLUMNS)
+
+    @staticmethod
+    def _migrate(connection, statements):
+        for statement in statements:
+            try:
+                connection.execute(statement)
+            except sqlite3.OperationalError:
+                # another worker process added it first
+                pass
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False, cached_statements=64)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def _transaction(self, mode='IMMEDIATE'):
+        """
+        Run the block in a transaction, or inside the enclosing one when called within batch()
+        """
+        connection = self._connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield connection
+            finally:
+                self._local.depth -= 1
+            return
+        connection.execute(f"BEGIN {mode}")
+        self._local.depth = 1
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        else:
+            connection.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    @contextmanager
+    def batch(self):
+        with self._transaction():
+            yield
+
+    @staticmethod
+    def _bump_version(connection, user_id, expected_version=None) -> int:
+        if expected_version is None:
+            connection.execute(BUMP_VERSION, (user_id,))
+            return connection.execute(SELECT_VERSION, (user_id,)).fetchone()[0]
+        # the write was computed from this version, if another worker process wrote since, nothing is written and
+        # the caller reloads the user. Writers bump the version before writing anything for that reason.
+        if not connection.execute(BUMP_EXPECTED_VERSION, (user_id, expected_version)).rowcount:
+            raise StaleUserException(f"User {user_id} changed since version {expected_version}")
+        return expected_version + 1
+
+    def create_user(self, user_name, phone, timezone=DEFAULT_TIMEZONE) -> int:
+        with self._transaction() as connection:
+            return connection.execute(INSERT_USER, (user_name, phone, timezone)).lastrowid
+
+    def get_user_version(self, user_id):
+        row = self._connection().execute(SELECT_VERSION, (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_user(self, user_id):
+        with self._transaction('DEFERRED') as connection:
+            row = connection.execute(SELECT_USER, (user_id,)).fetchone()
+            if row is None:
+                return None, None
+            user_name, phone, timezone, version = row
+            user = User(user_id, user_name, phone, timezone)
+            availability_dict = user.get_availability()
+            for date, starts, ends in connection.execute(SELECT_AVAILABILITY, (user_id, get_booking_window()[0])):
+                intervals = IntervalList()
+                intervals.starts.frombytes(starts)
+                intervals.ends.frombytes(ends)
+                availability_dict[date] = Availability(date, intervals)
+            rules = connection.execute(SELECT_RULES, (user_id,)).fetchone()
+            if rules:
+                user.set_recurrence(RecurrenceSchedule(RecurrenceRule.from_dict(rule) for rule in json.loads(rules[0])))
+            for booking_id, date, start, end, requestor_id, requestor_name, requestor_phone in \
+                    connection.execute(SELECT_BOOKINGS, (user_id,)):
+                requestor = (requestor_name, requestor_phone) if requestor_name is not None else None
+                user.book_meeting(Booking(user_id, date, start, end, requestor_id, booking_id, requestor))
+        return user, version
+
+    def get_requested_user_ids(self, requestor_id) -> list:
+        return [row[0] for row in self._connection().execute(SELECT_REQUESTED_USERS, (requestor_id,))]
+
+    def update_user(self, user_id, user_name, phone):
+        with self._transaction() as connection:
+            connection.execute(UPDATE_USER, (user_name, phone, user_id))
+            return self._bump_version(connection, user_id)
+
+    def update_requestor(self, requestor_id, requestor):
+        with self._transaction() as connection:
+            user_ids = [row[0] for row in connection.execute(SELECT_REQUESTED_USERS, (requestor_id,))]
+            connection.execute(UPDATE_REQUESTOR, (*requestor, requestor_id))
+            # other worker processes reload the hosts and pick up the new snapshot
+            return {user_id: self._bump_version(connection, user_id) for user_id in user_ids}
+
+    def save_availability(self, user_id, date, intervals, expected_version=None):
+        with self._transaction() as connection:
+            version = self._bump_version(connection, user_id, expected_version)
+            connection.execute(UPSERT_AVAILABILITY,
+                               (user_id, date, intervals.starts.tobytes(), intervals.ends.tobytes()))
+            return version
+
+    def save_recurrence_rules(self, user_id, rules, expected_version=None):
+        with self._transaction() as connection:
+            version = self._bump_version(connection, user_id, expected_version)
+            connection.execute(UPSERT_RULES, (user_id, json.dumps([rule.to_dict() for rule in rules])))
+            return version
+
+    def save_booking(self, user_id, booking, intervals, expected_version=None):
+        date, start, end = booking.get_date(), booking.get_start(), booking.get_end()
+        requestor_name, requestor_phone = booking.get_requestor() or (None, None)
+        with self._transaction() as connection:
+            version = self._bump_version(connection, user_id, expected_version)
+            self._check_conflict(connection, user_id, booking)
+            booking.set_booking_id(connection.execute(INSERT_BOOKING, (user_id, date, start, end,
+                                                                       booking.get_requestor_id(), requestor_name,
+                                                                       requestor_phone)).lastrowid)
+            connection.execute(UPSERT_AVAILABILITY,
+                               (user_id, date, intervals.starts.tobytes(), intervals.ends.tobytes()))
+            return version
+
+    @staticmethod
+    def _check_conflict(connection, user_id, booking):
+        # Another worker process may have booked the slot since this process loaded the user
+        start, end = booking.get_start(), booking.get_end()
+        if connection.execute(SELECT_CONFLICT, (user_id, booking.get_date(), end, start,
+                                                booking.get_booking_id() or 0)).fetchone():
+            raise SlotNotAvailableException(
+                f"The requested time slot {minutes_to_time(start)} to {minutes_to_time(end)} is not available")
+
+    def delete_booking(self, user_id, booking, intervals, expected_version=None):
+        with self._transaction() as connection:
+            version = self._bump_version(connection, user_id, expected_version)
+            # another worker process may have cancelled it already
+            if not connection.execute(DELETE_BOOKING, (booking.get_booking_id(), user_id)).rowcount:
+                raise BookingNotFoundException(f"Booking {booking.get_booking_id()} not found")
+            connection.execute(UPSERT_AVAILABILITY, (user_id, booking.get_date(), intervals.starts.tobytes(),
+                                                     intervals.ends.tobytes()))
+            return version
+
+    def move_booking(self, user_id, booking, new_booking, intervals, expected_version=None):
+        with self._transaction() as connection:
+            version = self._bump_version(connection, user_id, expected_version)
+            self._check_conflict(connection, user_id, new_booking)
+            if not connection.execute(UPDATE_BOOKING, (new_booking.get_date(), new_booking.get_start(),
+                                                       new_booking.get_end(), booking.get_booking_id(),
+                                                       user_id)).rowcount:
+                raise BookingNotFoundException(f"Booking {booking.get_booking_id()} not found")
+            for date, date_intervals in intervals.items():
+                connection.execute(UPSERT_AVAILABILITY, (user_id, date, date_intervals.starts.tobytes(),
+                                                         date_intervals.ends.tobytes()))
+            return version
+
+    def close(self):
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
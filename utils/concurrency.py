@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+
+
+class LockRegistry:
+    """
+    Maps keys, e.g. (user, date), onto a fixed pool of re-entrant locks by hash, so memory stays bounded however
+    many keys are used. Keys sharing a stripe only serialize, they never deadlock since hold() orders by stripe.
+    """
+    def __init__(self, stripes=256):
+        """
+        :param stripes: number of locks in the pool
+        """
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def _stripe(self, key) -> int:
+        return hash(key) % len(self._locks)
+
+    def get_lock(self, key) -> threading.RLock:
+        return self._locks[self._stripe(key)]
+
+    @contextmanager
+    def hold(self, *keys):
+        """
+        Acquire the locks of all keys in stripe order so that two callers locking the same keys can not deadlock.
+        Do not nest hold() calls of one registry, the nested locks may come before the held ones in that order.
+        :param keys: hashable keys
+        """
+        locks = [self._locks[stripe] for stripe in sorted({self._stripe(key) for key in keys})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+class IdAllocator:
+    """
+    Thread safe sequence of integer ids. With a step, e.g. start=2 and step=4 for shard 1 of 4, several
+    allocators hand out disjoint ids without talking to each other.
+    """
+    def __init__(self, start=1, step=1):
+        self._next_id = start
+        self._step = step
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            allocated_id = self._next_id
+            self._next_id += self._step
+            return allocated_id
+
+    def peek(self) -> int:
+        """
+        :return: the id next_id would return, without allocating it
+        """
+        with self._lock:
+            return self._next_id
+
+    def advance_to(self, next_id):
+        """
+        Make sure ids below next_id are never handed out, e.g. after loading existing users
+        :param next_id: lowest id that may be allocated next
+        """
+        with self._lock:
+            if next_id > self._next_id:
+                # stay on this allocator's sequence
+                self._next_id += -(-(next_id - self._next_id) // self._step) * self._step
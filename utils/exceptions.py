@@ -6,4 +6,15 @@ class DateOutOfBoundException(Exception):
     pass
 
 class SlotNotAvailableException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class BookingNotFoundException(Exception):
+    pass
+
+
+class StaleUserException(Exception):
+    """
+    A write was computed from a copy of the user older than the stored one, another worker process wrote since
+    """
+    pass
@@ -1,88 +1,570 @@
-from datetime import datetime, timedelta
-from models.availability_model import Availability
+import base64
+import functools
+import heapq
+import operator
+import re
+import time
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from models.interval_model import IntervalList, time_to_minutes, minutes_to_time
+from models.availability_model import bitmap_runs
+from models.timezone_model import DEFAULT_TIMEZONE, MINUTES_PER_DAY, OffsetTable, offset_table
+from utils.metrics import timed
 
 
-def init_availability() -> dict:
+BOOKING_WINDOW_DAYS = 31
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# HH:MM string of every minute of the day, responses format thousands of times per request
+TIME_STRINGS = tuple(minutes_to_time(minute) for minute in range(24 * 60 + 1))
+
+
+@lru_cache(maxsize=2)
+def _booking_window(today) -> tuple:
+    dates = tuple((today + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(BOOKING_WINDOW_DAYS))
+    return dates, frozenset(dates)
+
+
+def get_booking_window() -> tuple:
     """
-    initialize availability when a user is created
-    :return: dict with date as key and value as availability object
+    Rolling one month window starting today, computed once per day
+    :return: tuple of dates in YYYY-MM-DD format
     """
-    today = datetime.today()
-    dates = {}
-    for i in range(31):
-        date = today + timedelta(days=i)
-        date_str = date.strftime('%Y-%m-%d')
-        dates[date_str] = Availability(date_str, [])
-    return dates
+    return _booking_window(date.today())[0]
 
 
-def merge_time_ranges(time_ranges) -> list:
+def is_in_booking_window(date_str) -> bool:
     """
-    Simple merge interval logic to merge two time intervals
-    :param time_ranges: list of time range
-    :return: merged time range
-    """
-    merged_ranges = []
-    time_ranges.sort(key=lambda r: r['start_time'])
-    start_time, end_time = time_ranges[0]['start_time'], time_ranges[0]['end_time']
-    for time_range in time_ranges[1:]:
-        new_start_time, new_end_time = time_range['start_time'], time_range['end_time']
-        if end_time < new_start_time:
-            merged_ranges.append({'start_time': start_time, 'end_time': end_time})
-            start_time, end_time = new_start_time, new_end_time
+    :param date_str: date in YYYY-MM-DD format
+    :return: True if the date is between today and one month from now
+    """
+    return date_str in _booking_window(date.today())[1]
+
+
+def to_intervals(time_ranges) -> list:
+    """
+    Convert API time ranges to (start, end) minute pairs. Ranges already parsed by the validators are passed through.
+    :param time_ranges: list of {'start_time': 'HH:MM', 'end_time': 'HH:MM'} dicts or (start, end) minute pairs
+    :return: list of (start, end) tuples
+    """
+    return [(time_to_minutes(time_range['start_time']), time_to_minutes(time_range['end_time']))
+            if isinstance(time_range, dict) else tuple(time_range) for time_range in time_ranges]
+
+
+def to_time_list(intervals) -> list:
+    """
+    Convert (start, end) minute pairs back to API time ranges
+    :param intervals: iterable of (start, end) tuples
+    :return: list of {'start_time': 'HH:MM', 'end_time': 'HH:MM'} dicts
+    """
+    return [{'start_time': TIME_STRINGS[start], 'end_time': TIME_STRINGS[end]} for start, end in intervals]
+
+
+def split_overnight(time_ranges) -> tuple:
+    """
+    Split ranges whose end is before their start, e.g. 22:00-02:00, at midnight
+    :param time_ranges: list of (start, end) minute pairs
+    :return: tuple of (pairs on the date, pairs after midnight belonging to the next date)
+    """
+    same_day, next_day = [], []
+    for start, end in time_ranges:
+        if end < start:
+            same_day.append((start, MINUTES_PER_DAY))
+            if end:
+                next_day.append((0, end))
         else:
-            end_time = max(end_time, new_end_time)
-    merged_ranges.append({'start_time': start_time, 'end_time': end_time})
-    return merged_ranges
+            same_day.append((start, end))
+    return same_day, next_day
+
+
+def to_slot(date_str, start, duration) -> dict:
+    """
+    :param date_str: date in YYYY-MM-DD format
+    :param start: start minute
+    :param duration: slot length in minutes
+    :return: slot in API format, a slot running past midnight ends before it starts
+    """
+    end = start + duration
+    return {'date': date_str, 'start_time': TIME_STRINGS[start],
+            'end_time': TIME_STRINGS[end if end <= MINUTES_PER_DAY else end % MINUTES_PER_DAY]}
+
+
+def encode_cursor(position) -> str:
+    """
+    :param position: booking_position of the last booking of a page
+    :return: opaque cursor to resume after the booking
+    """
+    return base64.urlsafe_b64encode(','.join(map(str, position)).encode()).decode()
+
+
+def decode_cursor(cursor) -> tuple:
+    """
+    :param cursor: cursor returned with the previous page
+    :return: booking_position to resume after
+    """
+    try:
+        date_str, start, user_id, booking_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(',')
+        return parse_date(date_str), int(start), int(user_id), int(booking_id)
+    except (ValueError, AttributeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def merge_time_ranges(time_ranges) -> IntervalList:
+    """
+    Simple merge interval logic to merge two time intervals
+    :param time_ranges: list of (start, end) minute pairs
+    :return: merged IntervalList
+    """
+    return IntervalList.from_pairs(time_ranges)
+
+
+def _interval_events(intervals):
+    """
+    Yield sweep events for a sorted list of disjoint intervals. Ends sort before starts at the same minute,
+    so touching ranges do not count as an overlap.
+    """
+    for start, end in intervals:
+        yield start, 1
+        yield end, -1
+
+
+def find_common_intervals(interval_lists) -> list:
+    """
+    Sweep line intersection of any number of sorted, non overlapping interval lists.
+    Runs in a single pass over all the intervals, O(N log K) for N intervals across K lists.
+    :param interval_lists: list of interval lists, each an IntervalList or sorted (start, end) pairs
+    :return: sorted list of (start, end) minute pairs free in every list
+    """
+    return list(iter_common_intervals(interval_lists))
+
+
+def iter_common_intervals(interval_lists):
+    """
+    Lazy find_common_intervals, the sweep only advances as far as the caller consumes
+    :param interval_lists: list of interval lists, each an IntervalList or sorted (start, end) pairs
+    :return: iterator of (start, end) pairs free in every list, in order
+    """
+    if not interval_lists or not all(interval_lists):
+        return
+    required = len(interval_lists)
+    active = 0
+    open_start = None
+    for minute, delta in heapq.merge(*[_interval_events(intervals) for intervals in interval_lists]):
+        active += delta
+        if active == required:
+            open_start = minute
+        elif open_start is not None:
+            if open_start < minute:
+                yield open_start, minute
+            open_start = None
 
 
 def find_overlapping_ranges(ranges1, ranges2) -> list:
     """
     Find overlapping time ranges
-    :param ranges1: list of time ranges 1
-    :param ranges2: list of time ranges 2
-    :return: list of overlapping time ranges
-    """
-    overlapping_ranges = []
-    for r1 in ranges1:
-        for r2 in ranges2:
-            start_time = max(r1['start_time'], r2['start_time'])
-            end_time = min(r1['end_time'], r2['end_time'])
-            if start_time < end_time:
-                overlapping_ranges.append({'start_time': start_time, 'end_time': end_time})
-    return overlapping_ranges
-
-def validate_time_range(time_ranges):
+    :param ranges1: sorted list of (start, end) minute pairs 1
+    :param ranges2: sorted list of (start, end) minute pairs 2
+    :return: sorted list of overlapping (start, end) minute pairs
+    """
+    return find_common_intervals([ranges1, ranges2])
+
+
+def common_availability(interval_lists_on, start_date=None, end_date=None, min_duration=0) -> dict:
+    """
+    Intersect availability date by date with a single sweep per date
+    :param interval_lists_on: function of a date returning the interval lists to intersect on it
+    :param start_date: first date to consider, inclusive
+    :param end_date: last date to consider, inclusive
+    :param min_duration: minimum length in minutes of a returned slot
+    :return: dict of date to list of common time ranges
+    """
+    overlapping_availability = {}
+    for date_str in get_booking_window():
+        if (start_date and date_str < start_date) or (end_date and date_str > end_date):
+            continue
+        overlapping_ranges = [(start, end) for start, end in find_common_intervals(interval_lists_on(date_str))
+                              if end - start >= min_duration]
+        if overlapping_ranges:
+            overlapping_availability[date_str] = to_time_list(overlapping_ranges)
+    return overlapping_availability
+
+
+def local_now(table=None) -> tuple:
+    """
+    :param table: OffsetTable of the timezone the dates are in, None for the server's local time
+    :return: tuple of (today's date in YYYY-MM-DD format, minutes since midnight) in that timezone
+    """
+    if table is not None:
+        return table.to_local(int(time.time()) // 60)
+    now = datetime.now()
+    return now.strftime('%Y-%m-%d'), now.hour * 60 + now.minute
+
+
+def iter_slots(interval_lists_on, duration, granularity, start_date=None, end_date=None, now=None):
+    """
+    Lazily yield (date, start minute) of free slots date by date, so a search for the next few slots stops
+    intersecting availability as soon as enough were found
+    :param interval_lists_on: function of a date returning the interval lists to intersect on it
+    :param duration: slot length in minutes
+    :param granularity: slots start on multiples of this many minutes
+    :param start_date: first date to search, defaults to today
+    :param end_date: last date to search, defaults to the end of the booking window
+    :param now: local (date, minute) of the users, slots before it are skipped, see local_now
+    """
+    today, now_minutes = now or local_now()
+    for date_str in get_booking_window():
+        if (start_date and date_str < start_date) or date_str < today:
+            continue
+        if end_date and date_str > end_date:
+            break
+        earliest = now_minutes if date_str == today else 0
+        for start, end in find_common_intervals(interval_lists_on(date_str)):
+            start = max(start, earliest)
+            # round up to the next multiple of granularity
+            slot_start = -(-start // granularity) * granularity
+            while slot_start + duration <= end:
+                yield date_str, slot_start
+                slot_start += granularity
+
+
+def window_offset_table(timezone) -> OffsetTable:
+    """
+    :param timezone: IANA timezone name
+    :return: offset table of the timezone covering the booking window
+    """
+    return offset_table(timezone, get_booking_window()[0], BOOKING_WINDOW_DAYS)
+
+
+def utc_timeline(intervals_on, table) -> list:
+    """
+    Availability of a user over the booking window in UTC epoch minutes. Ranges meeting at local midnight are
+    joined, so availability running overnight is one range.
+    :param intervals_on: function of a date returning the user's availability on it in local minutes
+    :param table: OffsetTable of the user's timezone
+    :return: sorted list of disjoint (start, end) epoch minute pairs
+    """
+    timeline = []
+    for date_str in get_booking_window():
+        for start, end in intervals_on(date_str):
+            start, end = table.to_utc(date_str, start), table.to_utc(date_str, end)
+            if start >= end:
+                continue
+            if timeline and start <= timeline[-1][1]:
+                timeline[-1] = (timeline[-1][0], max(end, timeline[-1][1]))
+            else:
+                timeline.append((start, end))
+    return timeline
+
+
+def common_utc_availability(timelines, table, start_date=None, end_date=None, min_duration=0) -> dict:
+    """
+    Common availability of users in different timezones. The intersection is a plain sweep over epoch minutes,
+    the result is reported on the local dates of one timezone and split at its midnights.
+    :param timelines: list of UTC timelines, one per user, see utc_timeline
+    :param table: OffsetTable of the timezone to report in
+    :param start_date: first local date to report, inclusive
+    :param end_date: last local date to report, inclusive
+    :param min_duration: minimum length in minutes of a common range, a range across midnight counts as a whole
+    :return: dict of date to list of common time ranges
+    """
+    overlapping_availability = {}
+    for start, end in find_common_intervals(timelines):
+        if end - start < min_duration:
+            continue
+        for date_str, local_start, local_end in table.split_days(start, end):
+            if not is_in_booking_window(date_str) or (start_date and date_str < start_date) or \
+                    (end_date and date_str > end_date):
+                continue
+            time_list = overlapping_availability.get(date_str)
+            if time_list is None:
+                time_list = overlapping_availability[date_str] = []
+            time_list.append({'start_time': TIME_STRINGS[local_start], 'end_time': TIME_STRINGS[local_end]})
+    return overlapping_availability
+
+
+def iter_utc_slots(timelines, table, duration, granularity, start_date=None, end_date=None, user_tables=()):
+    """
+    Same as iter_slots for users in different timezones. Slots start on multiples of granularity in the local
+    time of table's timezone and may run past its midnight.
+    :param timelines: list of UTC timelines, one per user, see utc_timeline
+    :param table: OffsetTable of the timezone to report in
+    :param duration: slot length in minutes
+    :param granularity: slots start on multiples of this many minutes
+    :param start_date: first local date to search
+    :param end_date: last local date to search
+    :param user_tables: OffsetTables of the users' timezones, slots running past midnight in any of them are
+        skipped since a booking has to fit on one of the host's dates
+    :return: iterator of (local date, local start minute), a local time repeated when clocks go back is returned
+        once, for its first occurrence which is the one a booking at that time gets
+    """
+    now = int(time.time()) // 60
+    for start, end in iter_common_intervals(timelines):
+        start = max(start, now)
+        slot_start = start + -table.to_local(start)[1] % granularity
+        while slot_start + duration <= end:
+            date_str, minute = table.to_local(slot_start)
+            if end_date and date_str > end_date:
+                return
+            if is_in_booking_window(date_str) and (not start_date or date_str >= start_date) and \
+                    table.to_utc(date_str, minute) == slot_start and \
+                    all(user_table.to_local(slot_start)[0] == user_table.to_local(slot_start + duration - 1)[0]
+                        for user_table in user_tables):
+                yield date_str, minute
+            slot_start += granularity
+
+
+def window_bitmap(day_bitmaps, granularity) -> int:
+    """
+    Lay out the day bitmaps of consecutive dates in one int, each day followed by a zero bit so runs never
+    continue past midnight. Intersecting users over all dates is then a single AND per user.
+    :param day_bitmaps: iterable of day bitsets, see interval_bitmap
+    :param granularity: slot length in minutes
+    :return: int bitset
+    """
+    stride = 24 * 60 // granularity + 1
+    bits = 0
+    for index, day_bits in enumerate(day_bitmaps):
+        bits |= day_bits << (index * stride)
+    return bits
+
+
+def common_bitmap_availability(bitmaps, dates, granularity, min_duration=0) -> dict:
+    """
+    Same result as common_availability for availability aligned to the granularity, computed on bitmaps
+    :param bitmaps: list of window bitmaps, one per user, see window_bitmap
+    :param dates: dates the window bitmaps cover
+    :param granularity: slot length in minutes
+    :param min_duration: minimum length in minutes of a returned slot
+    :return: dict of date to list of common time ranges
+    """
+    stride = 24 * 60 // granularity + 1
+    common = functools.reduce(operator.and_, bitmaps)
+    overlapping_availability = {}
+    for first, last in bitmap_runs(common):
+        if (last - first) * granularity < min_duration:
+            continue
+        day, slot = divmod(first, stride)
+        time_list = overlapping_availability.get(dates[day])
+        if time_list is None:
+            time_list = overlapping_availability[dates[day]] = []
+        time_list.append({'start_time': TIME_STRINGS[slot * granularity],
+                          'end_time': TIME_STRINGS[(slot + last - first) * granularity]})
+    return overlapping_availability
+
+
+@lru_cache(maxsize=64)
+def _slot_start_mask(day_count, granularity, step) -> int:
+    day_mask = sum(1 << slot for slot in range(0, 24 * 60 // granularity, step))
+    return window_bitmap([day_mask] * day_count, granularity)
+
+
+def iter_bitmap_slots(bitmaps, dates, granularity, duration, slot_granularity, now=None):
+    """
+    Same slots as iter_slots for availability aligned to the granularity: a slot fits where the common bitmap
+    ANDed with itself shifted by each slot of the duration is still set
+    :param bitmaps: list of window bitmaps, one per user, see window_bitmap
+    :param dates: dates the window bitmaps cover
+    :param granularity: bitmap slot length in minutes
+    :param duration: slot length in minutes
+    :param slot_granularity: slots start on multiples of this many minutes, a multiple of granularity
+    :param now: local (date, minute) of the users, slots before it are skipped, see local_now
+    """
+    stride = 24 * 60 // granularity + 1
+    common = functools.reduce(operator.and_, bitmaps)
+    starts = common
+    for shift in range(1, -(-duration // granularity)):
+        starts &= common >> shift
+    starts &= _slot_start_mask(len(dates), granularity, slot_granularity // granularity)
+    today, now_minutes = now or local_now()
+    if dates and today >= dates[0]:
+        # no slots in the past, the users' today may already be a later date of the window
+        past_days = bisect_left(dates, today)
+        past = past_days * stride + (-(-now_minutes // granularity) if past_days < len(dates) else 0)
+        starts &= ~((1 << past) - 1)
+    while starts:
+        lowest = starts & -starts
+        day, slot = divmod(lowest.bit_length() - 1, stride)
+        yield dates[day], slot * granularity
+        starts ^= lowest
+
+
+# Precompiled parsers for the validators, several times faster than datetime.strptime and producing the minute
+# and canonical date values the manager works with directly. Same leniency as strptime: one or two digit fields.
+TIME_PATTERN = re.compile(r'([01]?[0-9]|2[0-3]):([0-5]?[0-9])')
+DATE_PATTERN = re.compile(r'([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})')
+# the 1440 canonical HH:MM strings resolve with a single dict lookup, the pattern handles the rest
+_MINUTES = {TIME_STRINGS[minute]: minute for minute in range(24 * 60)}
+
+
+def parse_time(time_str, end=False) -> int:
+    """
+    :param time_str: time in HH:MM format
+    :param end: the time ends a range, so 24:00 is accepted for midnight at the end of the day as the API returns it
+    :return: minutes since midnight
+    """
+    minutes = _MINUTES.get(time_str) if isinstance(time_str, str) else None
+    if minutes is not None:
+        return minutes
+    if end and time_str == TIME_STRINGS[MINUTES_PER_DAY]:
+        return MINUTES_PER_DAY
+    match = TIME_PATTERN.fullmatch(time_str) if isinstance(time_str, str) else None
+    if match is None:
+        raise ValueError("Invalid time format. Use HH:MM format.")
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def parse_date(date_str) -> str:
+    """
+    :param date_str: date in YYYY-MM-DD format
+    :return: the date in canonical zero padded YYYY-MM-DD format
+    """
+    match = DATE_PATTERN.fullmatch(date_str) if isinstance(date_str, str) else None
+    try:
+        if match is not None:
+            return _canonical_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid date format for '{date_str}'. Expected format: YYYY-MM-DD")
+
+
+@lru_cache(maxsize=1024)
+def _canonical_date(year, month, day) -> str:
+    # requests keep hitting the same few dates, so the calendar check runs once per date
+    return date(year, month, day).isoformat()
+
+
+@lru_cache(maxsize=2)
+def _last_allowed_date(today) -> str:
+    return (today + timedelta(days=30)).isoformat()
+
+
+@timed('calendly_validation_seconds', 'Time spent validating request payloads', function='validate_time_range')
+def validate_time_range(time_ranges) -> list:
+    """
+    Validate and parse the time ranges of every date in one pass
+    :param time_ranges: list of list of {'start_time': 'HH:MM', 'end_time': 'HH:MM'} dicts
+    :return: list of list of (start, end) minute pairs
+    """
+    parsed = []
     for time_range in time_ranges:
+        pairs = []
         for value in time_range:
-            start_time, end_time = value["start_time"], value["end_time"]
-
-            # Validate individual time values
-            try:
-                start_datetime = datetime.strptime(start_time, "%H:%M")
-                end_datetime = datetime.strptime(end_time, "%H:%M")
-            except ValueError:
-                raise ValueError("Invalid time format. Use HH:MM format.")
-
-            # Check if time values are within 24 hours
-            if start_datetime.hour > 23 or start_datetime.minute > 59:
-                raise ValueError("Invalid start time. Hour and minute should be within 0-23 and 0-59 respectively.")
-            if end_datetime.hour > 23 or end_datetime.minute > 59:
-                raise ValueError("Invalid end time. Hour and minute should be within 0-23 and 0-59 respectively.")
-
-            if end_datetime < start_datetime:
-                end_datetime += timedelta(days=1)
-
-            time_diff = end_datetime - start_datetime
-            if time_diff.total_seconds() > 24 * 3600:
-                raise ValueError("Time range should not exceed 24 hours")
-def validate_date_list(date_list):
-    one_month_from_now = (datetime.now() + timedelta(days=30)).date()
+            start, end = parse_time(value["start_time"]), parse_time(value["end_time"], end=True)
+            # An end before the start wraps to the next day, which is always within 24 hours
+            pairs.append((start, end))
+        parsed.append(pairs)
+    return parsed
+
+
+@timed('calendly_validation_seconds', 'Time spent validating request payloads', function='validate_date_list')
+def validate_date_list(date_list) -> list:
+    """
+    :param date_list: list of dates in YYYY-MM-DD format, at most one month from now
+    :return: list of dates in canonical YYYY-MM-DD format
+    """
+    last_allowed = _last_allowed_date(date.today())
+    parsed = []
     for date_str in date_list:
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-        except ValueError:
-            raise ValueError(f"Invalid date format for '{date_str}'. Expected format: YYYY-MM-DD")
+        canonical = parse_date(date_str)
+        if canonical > last_allowed:
+            raise ValueError(f"Date '{date_str}' is more than one month from now")
+        parsed.append(canonical)
+    return parsed
+
+
+def validate_date_range(start_date, end_date, bounded=True) -> tuple:
+    """
+    Validate the optional bounds of a date range query
+    :param start_date: first date in YYYY-MM-DD format or None
+    :param end_date: last date in YYYY-MM-DD format or None
+    :param bounded: also require the dates to be at most one month from now
+    :return: tuple of canonical (start_date, end_date), None where not given
+    """
+    validate = validate_date_list if bounded else validate_date_format
+    return tuple(validate([date_str])[0] if date_str else None for date_str in (start_date, end_date))
+
 
-        if date_obj > one_month_from_now:
-            raise ValueError(f"Date '{date_str}' is more than one month from now")
\ No newline at end of file
+def validate_date_format(date_list) -> list:
+    """
+    Check dates are valid YYYY-MM-DD dates without restricting them to the booking window
+    :param date_list: list of dates
+    :return: list of dates in canonical YYYY-MM-DD format
+    """
+    return [parse_date(date_str) for date_str in date_list]
+
+
+def validate_weekdays(weekdays):
+    """
+    :param weekdays: list of weekdays, Monday is 0 and Sunday is 6
+    """
+    if not weekdays or not all(isinstance(weekday, int) and 0 <= weekday <= 6 for weekday in weekdays):
+        raise ValueError("weekdays should be a non empty list of integers between 0 (Monday) and 6 (Sunday)")
+
+
+def validate_timezone(timezone) -> str:
+    """
+    :param timezone: IANA timezone name, e.g. Europe/Berlin, or None
+    :return: the timezone, DEFAULT_TIMEZONE for None
+    """
+    if timezone is None:
+        return DEFAULT_TIMEZONE
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        raise ValueError(f"Unknown timezone '{timezone}'. Use an IANA name like Europe/Berlin")
+    return timezone
+
+
+def validate_page_limit(limit) -> int:
+    """
+    :param limit: requested page size or None
+    :return: the page size, DEFAULT_PAGE_SIZE for None
+    """
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit should be an integer between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def validate_user_row(row) -> tuple:
+    """
+    Validate one row of a bulk user import
+    :param row: dict with user_name, phone_number and optional timezone
+    :return: tuple of (user_name, phone, timezone)
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Row should be a JSON object")
+    user_name, phone = row.get('user_name'), row.get('phone_number')
+    if not isinstance(user_name, str) or not isinstance(phone, str):
+        raise ValueError("user_name and phone_number are required strings")
+    return user_name, phone, validate_timezone(row.get('timezone'))
+
+
+def validate_profile_update(user_name, phone):
+    """
+    :param user_name: new user name or None to keep it
+    :param phone: new phone number or None to keep it
+    """
+    if user_name is None and phone is None:
+        raise ValueError("user_name or phone_number is required")
+    if not all(value is None or isinstance(value, str) for value in (user_name, phone)):
+        raise ValueError("user_name and phone_number should be strings")
+
+
+def validate_availability_row(row) -> tuple:
+    """
+    Validate one row of a bulk availability import
+    :param row: dict with user_id, date and time_ranges
+    :return: tuple of (user_id, date, list of (start, end) minute pairs)
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Row should be a JSON object")
+    user_id, date_str, time_ranges = row.get('user_id'), row.get('date'), row.get('time_ranges')
+    if not isinstance(user_id, int) or not isinstance(date_str, str) or not isinstance(time_ranges, list):
+        raise ValueError("user_id, date and time_ranges are required")
+    if not all(isinstance(value, dict) and 'start_time' in value and 'end_time' in value for value in time_ranges):
+        raise ValueError("Each time range needs start_time and end_time")
+    return user_id, validate_date_list([date_str])[0], validate_time_range([time_ranges])[0]